@@ -0,0 +1,237 @@
+"""
+Admission control for LLM-backed requests, per process.
+
+- Per session: a token bucket (RAG_ADMISSION_SESSION_PER_MIN questions per
+  minute, bursts of RAG_ADMISSION_SESSION_BURST). `check_session` rejects a
+  question before retrieval or generation starts.
+- Global: at most `limit` generation (rag.generate_async) and judge
+  (rag.judge_batch_async) calls in flight across all sessions and event loops,
+  with a FIFO wait queue of `max_queue` callers. A caller that finds the queue
+  full, or is still queued after `queue_timeout_s`, is shed straight away with
+  AdmissionRejected instead of adding to a storm of provider 429s.
+
+rag.PROVIDER_CONCURRENCY only bounds the calls of one event loop; the
+Streamlit wrappers start a loop per question, so these gates are what bound
+the process. A queued caller reports its position through the callback set
+with `waiting` (the Q&A page shows it). Admitted / queued / shed counters and
+the queue wait histogram are on the RAG API /health, the Monitoring page and
+`stats()`. RAG_ADMISSION=0 turns both layers off.
+"""
+import os
+import time
+import asyncio
+import threading
+import contextlib
+import contextvars
+import collections
+import concurrent.futures
+from typing import Any, Callable, Dict, Optional
+
+from embedding_service import Histogram
+
+ENABLED = os.getenv("RAG_ADMISSION", "1") == "1"
+SESSION_PER_MIN = float(os.getenv("RAG_ADMISSION_SESSION_PER_MIN", "6"))
+SESSION_BURST = int(os.getenv("RAG_ADMISSION_SESSION_BURST", "3"))
+MAX_SESSIONS = 10_000
+POSITION_POLL_S = 0.5
+QUEUE_WAIT_MS_BOUNDS = [10, 50, 100, 500, 1000, 5000, 20000, 60000]
+
+# call class -> (in flight, queue length, queue timeout in seconds; 0 waits as long as it takes)
+GATE_LIMITS = {
+    "generation": (int(os.getenv("RAG_ADMISSION_GENERATION_LIMIT", "8")),
+                   int(os.getenv("RAG_ADMISSION_GENERATION_QUEUE", "16")),
+                   float(os.getenv("RAG_ADMISSION_GENERATION_TIMEOUT_S", "20"))),
+    "judge": (int(os.getenv("RAG_ADMISSION_JUDGE_LIMIT", "4")),
+              int(os.getenv("RAG_ADMISSION_JUDGE_QUEUE", "32")),
+              float(os.getenv("RAG_ADMISSION_JUDGE_TIMEOUT_S", "120"))),
+}
+
+# (gate name, 1-based queue position) while a call of this context is queued
+ON_WAIT: "contextvars.ContextVar[Optional[Callable[[str, int], None]]]" = contextvars.ContextVar("admission_on_wait", default=None)
+
+class AdmissionRejected(RuntimeError):
+    """A request was shed: reason is rate_limited, queue_full or queue_timeout."""
+
+    def __init__(self, reason: str, retry_after_s: float, message: str):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+class TokenBucket:
+    def __init__(self, rate_per_s: float, burst: int):
+        self.rate = rate_per_s
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token: 0.0 on success, otherwise the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class SessionLimiter:
+    """Token buckets keyed by session id; the least recently used are dropped beyond MAX_SESSIONS."""
+
+    def __init__(self, per_minute: float = SESSION_PER_MIN, burst: int = SESSION_BURST,
+                 max_sessions: int = MAX_SESSIONS):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_sessions = max_sessions
+        self.buckets: "collections.OrderedDict[str, TokenBucket]" = collections.OrderedDict()
+        self.counters = {"admitted": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+
+    def check(self, session_id: str) -> None:
+        with self._lock:
+            bucket = self.buckets.pop(session_id, None) or TokenBucket(self.rate, self.burst)
+            self.buckets[session_id] = bucket
+            if len(self.buckets) > self.max_sessions:
+                self.buckets.popitem(last=False)
+            retry_after = bucket.take()
+            self.counters["rate_limited" if retry_after else "admitted"] += 1
+        if retry_after:
+            raise AdmissionRejected("rate_limited", retry_after,
+                                    f"Too many questions from this session, try again in {retry_after:.0f} s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.counters, "sessions": len(self.buckets),
+                    "per_minute": self.rate * 60, "burst": self.burst}
+
+class Gate:
+    """
+    At most `limit` holders; later callers wait in FIFO order, up to
+    `max_queue` of them, for at most `queue_timeout_s`. A released slot is
+    handed straight to the first waiter, so it cannot be overtaken.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout_s: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self.in_flight = 0
+        self.counters = {"admitted": 0, "queued": 0, "shed_queue_full": 0, "shed_timeout": 0}
+        self.queue_wait_ms = Histogram(QUEUE_WAIT_MS_BOUNDS)
+        self._waiters: "collections.deque[concurrent.futures.Future]" = collections.deque()
+        self._lock = threading.Lock()
+
+    def _enter(self) -> Optional[concurrent.futures.Future]:
+        """None when admitted right away, otherwise the future a queued caller waits on."""
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                self.counters["admitted"] += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self.counters["shed_queue_full"] += 1
+                raise AdmissionRejected("queue_full", self.queue_timeout_s or POSITION_POLL_S,
+                                        f"The assistant is busy ({self.name} queue full), please try again shortly")
+            ticket: concurrent.futures.Future = concurrent.futures.Future()
+            self._waiters.append(ticket)
+            self.counters["queued"] += 1
+            return ticket
+
+    def _abandon(self, ticket: concurrent.futures.Future) -> bool:
+        """Leave the queue; False when the slot was handed over meanwhile (the caller holds it)."""
+        with self._lock:
+            try:
+                self._waiters.remove(ticket)
+            except ValueError:
+                return False
+            return True
+
+    def position(self, ticket: concurrent.futures.Future) -> int:
+        with self._lock:
+            try:
+                return self._waiters.index(ticket) + 1
+            except ValueError:
+                return 0
+
+    def release(self) -> None:
+        with self._lock:
+            if self._waiters:
+                self.counters["admitted"] += 1
+                self._waiters.popleft().set_result(None)
+            else:
+                self.in_flight -= 1
+
+    async def _wait(self, ticket: concurrent.futures.Future) -> None:
+        started = time.perf_counter()
+        on_wait = ON_WAIT.get()
+        granted = asyncio.wrap_future(ticket)
+        try:
+            while True:
+                if on_wait is not None:
+                    on_wait(self.name, self.position(ticket))
+                poll_s = POSITION_POLL_S if on_wait is not None else None
+                if self.queue_timeout_s > 0:
+                    remaining = self.queue_timeout_s - (time.perf_counter() - started)
+                    poll_s = remaining if poll_s is None else min(poll_s, remaining)
+                if poll_s is not None and poll_s <= 0:
+                    if self._abandon(ticket):
+                        with self._lock:
+                            self.counters["shed_timeout"] += 1
+                        raise AdmissionRejected("queue_timeout", self.queue_timeout_s,
+                                                f"The assistant is busy (waited {self.queue_timeout_s:g} s for "
+                                                f"a free {self.name} slot), please try again shortly")
+                    break
+                done, _ = await asyncio.wait({granted}, timeout=poll_s)
+                if done:
+                    break
+        except asyncio.CancelledError:
+            if not self._abandon(ticket):
+                self.release()
+            raise
+        self.queue_wait_ms.observe((time.perf_counter() - started) * 1000)
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        if not ENABLED:
+            yield
+            return
+        ticket = self._enter()
+        if ticket is not None:
+            await self._wait(ticket)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = {**self.counters, "in_flight": self.in_flight, "queue_depth": len(self._waiters),
+                        "limit": self.limit, "max_queue": self.max_queue}
+        snapshot["shed"] = snapshot["shed_queue_full"] + snapshot["shed_timeout"]
+        snapshot["queue_wait_ms"] = self.queue_wait_ms.snapshot()
+        return snapshot
+
+SESSIONS = SessionLimiter()
+GATES = {name: Gate(name, *limits) for name, limits in GATE_LIMITS.items()}
+
+def check_session(session_id: Optional[str]) -> None:
+    """Raise AdmissionRejected when the session is over its question rate."""
+    if ENABLED and session_id and SESSION_PER_MIN > 0:
+        SESSIONS.check(session_id)
+
+def slot(gate: str):
+    """`async with admission.slot("generation"):` around one LLM-backed call."""
+    return GATES[gate].slot()
+
+@contextlib.contextmanager
+def waiting(on_wait: Callable[[str, int], None]):
+    """Report queue positions of the calls started in this context (e.g. by rag.rag) to `on_wait`."""
+    token = ON_WAIT.set(on_wait)
+    try:
+        yield
+    finally:
+        ON_WAIT.reset(token)
+
+def stats() -> Dict[str, Any]:
+    return {"enabled": ENABLED, "sessions": SESSIONS.stats(),
+            **{name: gate.stats() for name, gate in GATES.items()}}
@@ -5,37 +5,42 @@ from typing import Tuple, List
 import streamlit as st
 from qdrant_client import QdrantClient
 from dotenv import load_dotenv
-import google.generativeai as genai
 import ui
-import monitoring
 import persistence
-import ingest
 import db
+import warmup
+import rag_client
+import memory
+import history
+
+# google.generativeai / openai are imported by rag on first use and the
+# monitoring stack (pandas, altair) only when the Monitoring page is opened.
 
 load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+WARMUP_TIMEOUT_S = float(os.getenv("TRAVEL_ASSISTANT_WARMUP_TIMEOUT", "600"))
 
 st.set_page_config(page_title="Krakow Travel Assistant", page_icon="🤖", layout="wide")
 
 # --- Session / constants -----------------------------------------------------
 def init_session_state() -> None:
-    if 'conversation_history' not in st.session_state:
-        st.session_state.conversation_history = []
-    if 'feedback_data' not in st.session_state:
-        st.session_state.feedback_data = []
-    # keep 'previous_answer' key if other modules expect it
-    if 'previous_answer' not in st.session_state:
-        st.session_state.previous_answer = None
+    # id-keyed Q&A history with counters, capped in memory (see history.py)
+    if 'history' not in st.session_state:
+        st.session_state.history = history.ConversationHistory()
+    # bounded conversation memory passed to the RAG pipeline (see memory.py)
+    if 'conversation_state' not in st.session_state:
+        st.session_state.conversation_state = memory.new_memory()
+    # key of the per-session rate limit (see admission.py)
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = str(uuid.uuid4())
 
 init_session_state()
 
 def _ensure_db_initialized_from_app() -> None:
     """
-    Check whether the expected 'conversations' table exists; if not, call db.init_db().
-    This avoids dropping existing data on subsequent runs.
+    Check whether the expected 'conversations' table exists; if not, call db.init_db(),
+    otherwise db.migrate_db(). This avoids dropping existing data on subsequent runs.
     """
     try:
         conn = db.get_db_connection()
@@ -48,12 +53,14 @@ def _ensure_db_initialized_from_app() -> None:
                 if not exists:
                     # Only initialize when table missing
                     db.init_db()
+                else:
+                    db.migrate_db()
         finally:
             conn.close()
-    except Exception:
+    except Exception as e:
         # If DB is unreachable or something goes wrong, do not crash the app.
         # Initialization can be retried manually.
-        pass
+        print(f"DB initialization / migration skipped: {e!r}")
 
 # Run DB initialization on first app start unless disabled by env var
 if os.getenv("TRAVEL_ASSISTANT_INIT_DB_ON_STARTUP", "1") == "1":
@@ -61,25 +68,45 @@ if os.getenv("TRAVEL_ASSISTANT_INIT_DB_ON_STARTUP", "1") == "1":
 
 # --- Cached resources -------------------------------------------------------
 @st.cache_resource
-def get_qdrant_client(url: str = QDRANT_URL) -> QdrantClient:
-    return QdrantClient(url=url)
+def get_warmup() -> warmup.Warmup:
+    """
+    One warm-up per process. With TRAVEL_ASSISTANT_WARMUP=1 (default) the models
+    load in a background thread from the first script run; otherwise they load
+    on the first Q&A request.
+    """
+    wu = warmup.Warmup(QDRANT_URL)
+    if os.getenv("TRAVEL_ASSISTANT_WARMUP", "1") == "1":
+        wu.start()
+    return wu
 
-@st.cache_resource
-def load_documents_and_client(_qdrant_client: QdrantClient) -> Tuple[List[dict], QdrantClient]:
-    DOCUMENTS, client = ingest.load_data(_qdrant_client)
-    return DOCUMENTS, client
+def load_documents_and_client() -> Tuple[List[dict], QdrantClient]:
+    wu = get_warmup()
+    if not wu.ready.is_set():
+        with st.spinner("Loading search models..."):
+            finished = wu.start().wait(WARMUP_TIMEOUT_S)
+        if not finished:
+            st.warning("The assistant is still starting up, please try again in a moment.")
+            st.stop()
+    if wu.error is not None:
+        get_warmup.clear()  # retry the warm-up on the next run
+        raise wu.error
+    return wu.documents, wu.qdrant_client
 
 # --- Main app navigation ----------------------------------------------------
 def main() -> None:
     st.sidebar.title("Navigation")
     page = st.sidebar.radio("Select Page", ["Q&A Assistant", "Monitoring"])
 
-    qdrant = get_qdrant_client()
-    DOCUMENTS, qdrant_client = load_documents_and_client(qdrant)
-
-    if page == "Q&A Assistant":
+    if page == "Q&A Assistant" and rag_client.remote_enabled():
+        # retrieval and generation run in the RAG API workers
+        ui.qa_page(None, None, OPENAI_API_KEY)
+    elif page == "Q&A Assistant":
+        wu = get_warmup()
+        st.sidebar.caption("Search models: ready" if wu.ready.is_set() else "Search models: warming up...")
+        DOCUMENTS, qdrant_client = load_documents_and_client()
         ui.qa_page(DOCUMENTS, qdrant_client, OPENAI_API_KEY)
     else:
+        import monitoring
         monitoring.monitoring_page()
 
 if __name__ == "__main__":
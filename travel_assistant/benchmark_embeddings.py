@@ -0,0 +1,127 @@
+"""
+Compare the dense embedding models of embedding_models.py on CPU cost and
+retrieval quality against data/ground-truth-retrieval.csv.
+
+Each model runs in a fresh process (so peak memory is its own): the POI corpus
+is indexed into a scratch collection with ingest.load_data, then every
+question is embedded on its own and searched dense-only and hybrid (BM25 +
+RRF, as served). Reported per model: indexing wall and CPU time, per-query
+embedding latency and CPU time, model and peak process memory, estimated
+vector RAM, and hit rate / MRR / nDCG of both searches.
+
+    python travel_assistant/benchmark_embeddings.py --models jina-small bge-small potion-retrieval --sample 500
+    python travel_assistant/benchmark_embeddings.py --qdrant-url :memory:   # no Qdrant server needed
+
+Set RAG_EMBEDDING_MODEL to the chosen entry and publish a new index version
+(index_versions.py publish) to switch.
+"""
+import os
+import time
+import resource
+import argparse
+import multiprocessing
+import concurrent.futures
+from typing import Any, Dict, List
+
+import pandas as pd
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+import collection_profiles
+import embedding_models
+import ingest
+import rag
+import retrieval_eval
+
+load_dotenv()
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def bench_collection_name(model_name: str) -> str:
+    return f"hybrid_search__bench_emb_{model_name.replace('-', '_')}"
+
+def benchmark_model(model_name: str, qdrant_url: str, ground_truth: List[Dict[str, Any]], limit: int,
+                    threads: int | None, keep: bool) -> Dict[str, Any]:
+    from fastembed import TextEmbedding
+
+    dense = embedding_models.get_model(model_name)
+    collection_name = bench_collection_name(model_name)
+    qdrant_client = QdrantClient(location=qdrant_url)
+
+    rss_before = peak_rss_mb()
+    model = TextEmbedding(model_name=dense["model"], threads=threads)
+    list(model.query_embed(["warm-up"]))
+    model_rss_mb = peak_rss_mb() - rss_before
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    documents, _ = ingest.load_data(qdrant_client, collection_name=collection_name, embedding_model=model_name)
+    index_s, index_cpu_s = time.perf_counter() - wall, time.process_time() - cpu
+
+    embed_ms: List[float] = []
+    embed_cpu_ms: List[float] = []
+
+    def dense_search(question):
+        wall, cpu = time.perf_counter(), time.process_time()
+        vector = next(iter(model.query_embed([question]))).tolist()
+        embed_ms.append((time.perf_counter() - wall) * 1000)
+        embed_cpu_ms.append((time.process_time() - cpu) * 1000)
+        return qdrant_client.query_points(collection_name=collection_name, query=vector, using=dense["vector_name"],
+                                          limit=limit).points
+
+    def hybrid_search(question):
+        return rag.rrf_search(qdrant_client, question, limit=limit, collection_name=collection_name,
+                              embedding_model=model_name)
+
+    hybrid_search(ground_truth[0]['question'])  # load the query-side models outside the measurement
+    dense_metrics = retrieval_eval.evaluate(ground_truth, dense_search)
+    hybrid_metrics = retrieval_eval.evaluate(ground_truth, hybrid_search)
+    vectors = collection_profiles.estimate_memory_bytes(collection_profiles.get_profile(), len(documents), dense["dim"])
+    if not keep:
+        qdrant_client.delete_collection(collection_name)
+    return {
+        "model": model_name,
+        "dim": dense["dim"],
+        "index_s": round(index_s, 2),
+        "index_cpu_s": round(index_cpu_s, 2),
+        "embed_p50_ms": retrieval_eval.percentile(embed_ms, 50),
+        "embed_p95_ms": retrieval_eval.percentile(embed_ms, 95),
+        "embed_cpu_ms": sum(embed_cpu_ms) / len(embed_cpu_ms),
+        "model_rss_mb": round(model_rss_mb, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "vectors_ram_mb": round(vectors["ram_bytes"] / 1024 ** 2, 3),
+        **{f"dense_{key}": dense_metrics[key] for key in ("hit_rate", "mrr", "ndcg")},
+        **{f"hybrid_{key}": hybrid_metrics[key] for key in ("hit_rate", "mrr", "ndcg", "p95_ms")},
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=list(embedding_models.EMBEDDING_MODELS))
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL", "http://localhost:6333"),
+                        help="Qdrant URL, or :memory: for the in-process local mode")
+    parser.add_argument("--sample", type=int, default=None, help="number of ground-truth questions (default: all)")
+    parser.add_argument("--limit", type=int, default=5, help="results per query used for hit rate / MRR")
+    parser.add_argument("--threads", type=int, default=None, help="onnxruntime threads per model (default: all cores)")
+    parser.add_argument("--output", default=None, help="optional CSV path for the results table")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark collections")
+    args = parser.parse_args()
+
+    ground_truth = retrieval_eval.load_ground_truth(sample=args.sample)
+    rows = []
+    for model_name in args.models:
+        print(f"Benchmarking embedding model '{model_name}' on {len(ground_truth)} questions...")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            rows.append(pool.submit(benchmark_model, model_name, args.qdrant_url, ground_truth, args.limit,
+                                    args.threads, args.keep).result())
+
+    results = pd.DataFrame(rows).set_index("model")
+    baseline = embedding_models.DEFAULT_MODEL
+    if baseline in results.index:
+        results["embed_cpu_vs_default"] = results["embed_cpu_ms"] / results.loc[baseline, "embed_cpu_ms"]
+        results["hybrid_mrr_delta"] = results["hybrid_mrr"] - results.loc[baseline, "hybrid_mrr"]
+    print(results.round(3).to_string())
+    if args.output:
+        results.to_csv(args.output)
+
+if __name__ == "__main__":
+    main()
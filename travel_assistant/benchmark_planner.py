@@ -0,0 +1,85 @@
+"""
+Compare the adaptive retrieval planner (rag.plan_retrieval) with hybrid-only
+search on data/ground-truth-retrieval.csv: routing mix, hit rate / MRR of both
+per route, and search latency.
+
+    python travel_assistant/benchmark_planner.py --split valid --sample 500 [--output planner.csv]
+"""
+import os
+import time
+import asyncio
+import argparse
+from typing import Any, Dict, List
+
+import pandas as pd
+from dotenv import load_dotenv
+from qdrant_client import AsyncQdrantClient
+import poi_store
+import rag
+import retrieval_eval
+
+load_dotenv()
+
+async def _timed(search) -> tuple[list, float]:
+    start = time.perf_counter()
+    points = await search
+    return [p.id for p in points], (time.perf_counter() - start) * 1000
+
+async def run(qdrant_client, ground_truth: List[Dict[str, Any]], documents) -> pd.DataFrame:
+    rows = []
+    await rag.rrf_search_async(qdrant_client, ground_truth[0]['question'])  # load the query models first
+    await rag.sparse_search_async(qdrant_client, ground_truth[0]['question'])
+    for q in ground_truth:
+        start = time.perf_counter()
+        plan = rag.plan_retrieval(q['question'], documents)
+        plan_ms = (time.perf_counter() - start) * 1000
+        hybrid_ids, hybrid_ms = await _timed(rag.rrf_search_async(qdrant_client, q['question']))
+        planned_ids, planned_ms = await _timed(rag.planned_search_async(qdrant_client, q['question'], plan))
+        rows.append({
+            "route": plan["route"],
+            "hybrid": [doc_id == q['id'] for doc_id in hybrid_ids],
+            "planned": [doc_id == q['id'] for doc_id in planned_ids],
+            "hybrid_ms": hybrid_ms,
+            "planned_ms": planned_ms + plan_ms,
+        })
+    return pd.DataFrame(rows)
+
+def summarize(runs: pd.DataFrame) -> pd.DataFrame:
+    groups = [(route, group) for route, group in runs.groupby("route")] + [("all", runs)]
+    rows = []
+    for route, group in groups:
+        hybrid, planned = list(group["hybrid"]), list(group["planned"])
+        rows.append({
+            "route": route,
+            "queries": len(group),
+            "share": len(group) / len(runs),
+            "hybrid_hit_rate": retrieval_eval.hit_rate(hybrid),
+            "planned_hit_rate": retrieval_eval.hit_rate(planned),
+            "hybrid_mrr": retrieval_eval.mrr(hybrid),
+            "planned_mrr": retrieval_eval.mrr(planned),
+            "hybrid_p50_ms": retrieval_eval.percentile(list(group["hybrid_ms"]), 50),
+            "planned_p50_ms": retrieval_eval.percentile(list(group["planned_ms"]), 50),
+            "hybrid_p95_ms": retrieval_eval.percentile(list(group["hybrid_ms"]), 95),
+            "planned_p95_ms": retrieval_eval.percentile(list(group["planned_ms"]), 95),
+        })
+    summary = pd.DataFrame(rows).set_index("route")
+    summary["mrr_delta"] = summary["planned_mrr"] - summary["hybrid_mrr"]
+    return summary
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--split", choices=["test", "valid"], default=None, help="ground-truth split (default: all)")
+    parser.add_argument("--sample", type=int, default=None, help="number of ground-truth questions (default: all)")
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL", "http://localhost:6333"))
+    parser.add_argument("--output", default=None, help="optional CSV path for the summary table")
+    args = parser.parse_args()
+
+    ground_truth = retrieval_eval.load_ground_truth(split=args.split, sample=args.sample)
+    runs = asyncio.run(run(AsyncQdrantClient(url=args.qdrant_url), ground_truth, poi_store.load()))
+    summary = summarize(runs)
+    print(summary.round(3).to_string())
+    if args.output:
+        summary.to_csv(args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Compare collection profiles (see collection_profiles.py) on memory footprint,
+search latency and retrieval quality against data/ground-truth-retrieval.csv.
+
+    python travel_assistant/benchmark_profiles.py --profiles default scalar-int8 binary --sample 500
+"""
+import os
+import time
+import argparse
+from dotenv import load_dotenv
+import pandas as pd
+from qdrant_client import QdrantClient
+import collection_profiles
+import embedding_models
+import ingest
+import rag
+import retrieval_eval
+
+load_dotenv()
+
+def wait_for_indexing(qdrant_client, collection_name: str, timeout_s: float = 300.0) -> None:
+    """Wait until the optimizer has built the HNSW/quantized segments."""
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        info = qdrant_client.get_collection(collection_name)
+        if str(info.status).lower().endswith("green"):
+            return
+        time.sleep(1.0)
+
+def bench_collection_name(profile_name: str) -> str:
+    return f"hybrid_search__bench_{profile_name.replace('-', '_')}"
+
+def benchmark_profile(qdrant_client, profile_name: str, ground_truth, limit: int) -> dict:
+    collection_name = bench_collection_name(profile_name)
+    profile = collection_profiles.get_profile(profile_name)
+
+    start = time.perf_counter()
+    documents, _ = ingest.load_data(qdrant_client, collection_name=collection_name, profile=profile_name)
+    wait_for_indexing(qdrant_client, collection_name)
+    index_s = time.perf_counter() - start
+
+    def search(question):
+        return rag.rrf_search(qdrant_client, question, limit=limit, collection_name=collection_name, profile=profile_name)
+
+    # first call loads the query embedding models; keep it out of the latency numbers
+    search(ground_truth[0]['question'])
+    metrics = retrieval_eval.evaluate(ground_truth, search)
+    memory = collection_profiles.estimate_memory_bytes(profile, len(documents), embedding_models.get_model()["dim"])
+    return {
+        "profile": profile_name,
+        "index_s": round(index_s, 2),
+        "est_ram_mb": round(memory["ram_bytes"] / 1024 ** 2, 3),
+        "est_disk_mb": round(memory["disk_bytes"] / 1024 ** 2, 3),
+        **metrics,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=list(collection_profiles.COLLECTION_PROFILES))
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL", "http://localhost:6333"))
+    parser.add_argument("--sample", type=int, default=None, help="number of ground-truth questions (default: all)")
+    parser.add_argument("--limit", type=int, default=5, help="results per query used for hit rate / MRR")
+    parser.add_argument("--output", default=None, help="optional CSV path for the results table")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark collections")
+    args = parser.parse_args()
+
+    qdrant_client = QdrantClient(url=args.qdrant_url)
+    ground_truth = retrieval_eval.load_ground_truth(sample=args.sample)
+
+    rows = []
+    for profile_name in args.profiles:
+        print(f"Benchmarking profile '{profile_name}' on {len(ground_truth)} questions...")
+        rows.append(benchmark_profile(qdrant_client, profile_name, ground_truth, args.limit))
+        if not args.keep:
+            qdrant_client.delete_collection(bench_collection_name(profile_name))
+
+    results = pd.DataFrame(rows).set_index("profile")
+    print(results.to_string())
+    if args.output:
+        results.to_csv(args.output)
+
+if __name__ == "__main__":
+    main()
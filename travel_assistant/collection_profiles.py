@@ -0,0 +1,141 @@
+import os
+from qdrant_client import models
+
+# Storage/search profiles for the `hybrid_search` dense vector (the embedding_models.py
+# model, jina-small 512-d by default).
+# Only the dense branch is affected; BM25 sparse vectors are small already.
+#   quantization: None | "scalar" (int8) | "binary"
+#   always_ram:   keep the quantized vectors in RAM (originals follow `on_disk`)
+#   on_disk:      store the full-precision originals on disk (mmap)
+#   hnsw_on_disk: store the HNSW graph on disk as well
+#   hnsw_m / hnsw_ef_construct: index build parameters (None = Qdrant default)
+#   hnsw_ef:      search-time beam width (None = Qdrant default)
+#   rescore / oversampling: re-rank quantized candidates with the originals
+COLLECTION_PROFILES = {
+    "default": {
+        "quantization": None,
+        "always_ram": None,
+        "on_disk": False,
+        "hnsw_on_disk": False,
+        "hnsw_m": None,
+        "hnsw_ef_construct": None,
+        "hnsw_ef": None,
+        "rescore": None,
+        "oversampling": None,
+    },
+    "scalar-int8": {
+        "quantization": "scalar",
+        "always_ram": True,
+        "on_disk": True,
+        "hnsw_on_disk": False,
+        "hnsw_m": 16,
+        "hnsw_ef_construct": 100,
+        "hnsw_ef": 64,
+        "rescore": True,
+        "oversampling": 2.0,
+    },
+    "binary": {
+        "quantization": "binary",
+        "always_ram": True,
+        "on_disk": True,
+        "hnsw_on_disk": False,
+        "hnsw_m": 16,
+        "hnsw_ef_construct": 100,
+        "hnsw_ef": 128,
+        "rescore": True,
+        "oversampling": 3.0,
+    },
+    "low-memory": {
+        "quantization": "scalar",
+        "always_ram": False,
+        "on_disk": True,
+        "hnsw_on_disk": True,
+        "hnsw_m": 8,
+        "hnsw_ef_construct": 64,
+        "hnsw_ef": 64,
+        "rescore": True,
+        "oversampling": 2.0,
+    },
+}
+
+DEFAULT_PROFILE = "default"
+
+def get_profile(name: str | None = None) -> dict:
+    """Return the named profile, or the one selected by QDRANT_COLLECTION_PROFILE."""
+    name = name or os.getenv("QDRANT_COLLECTION_PROFILE", DEFAULT_PROFILE)
+    if name not in COLLECTION_PROFILES:
+        raise ValueError(f"Unknown collection profile '{name}'. Available: {sorted(COLLECTION_PROFILES)}")
+    return COLLECTION_PROFILES[name]
+
+def dense_vector_params(profile: dict, size: int = 512) -> models.VectorParams:
+    return models.VectorParams(
+        size=size,
+        distance=models.Distance.COSINE,
+        on_disk=profile["on_disk"] or None,
+    )
+
+def hnsw_config(profile: dict):
+    if profile["hnsw_m"] is None and profile["hnsw_ef_construct"] is None and not profile["hnsw_on_disk"]:
+        return None
+    return models.HnswConfigDiff(
+        m=profile["hnsw_m"],
+        ef_construct=profile["hnsw_ef_construct"],
+        on_disk=profile["hnsw_on_disk"] or None,
+    )
+
+def quantization_config(profile: dict):
+    if profile["quantization"] == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=profile["always_ram"],
+            )
+        )
+    if profile["quantization"] == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=profile["always_ram"])
+        )
+    return None
+
+def search_params(profile: dict):
+    """Search params for the dense prefetch; None keeps Qdrant defaults."""
+    quantization = None
+    if profile["quantization"] is not None:
+        quantization = models.QuantizationSearchParams(
+            rescore=profile["rescore"],
+            oversampling=profile["oversampling"],
+        )
+    if profile["hnsw_ef"] is None and quantization is None:
+        return None
+    return models.SearchParams(hnsw_ef=profile["hnsw_ef"], quantization=quantization)
+
+def estimate_memory_bytes(profile: dict, points: int, size: int = 512) -> dict:
+    """
+    Rough dense-vector footprint: full-precision originals, quantized copy and
+    HNSW links (m * 2 neighbours on layer 0, 4-byte ids). Split into RAM vs disk.
+    """
+    original = points * size * 4
+    if profile["quantization"] == "scalar":
+        quantized = points * size
+    elif profile["quantization"] == "binary":
+        quantized = points * size // 8
+    else:
+        quantized = 0
+    links = points * (profile["hnsw_m"] or 16) * 2 * 4
+
+    ram = 0
+    disk = 0
+    if profile["on_disk"]:
+        disk += original
+    else:
+        ram += original
+    if profile["hnsw_on_disk"]:
+        disk += links
+    else:
+        ram += links
+    if profile["always_ram"] is False:
+        disk += quantized
+    else:
+        ram += quantized
+    return {"ram_bytes": ram, "disk_bytes": disk}
@@ -0,0 +1,511 @@
+"""
+Scripted build of the POI dataset (what notebooks/00_prepare_dataset.ipynb and
+the selection cells of 02_generating_ground_truth_data.ipynb do by hand).
+
+    python travel_assistant/dataset_build.py                  # refresh from OSM / Wikipedia
+    python travel_assistant/dataset_build.py --offline        # rebuild from the caches only
+    python travel_assistant/dataset_build.py --force enrich   # recompute one stage and the ones after it
+
+Stages:
+
+- fetch: one Overpass query per category (CATEGORY_TAGS) inside the Kraków
+  area found with Nominatim. Raw responses are cached in notebooks/cache
+  (<sha1 of the request>.json, the layout osmnx already used there) and
+  fetched in parallel under a rate limit.
+- normalize: OSM elements -> one row per (category, element) with WKT
+  geometry, ':' -> '_' column names and all name variants joined in `name`.
+- enrich: English Wikipedia summary per `wikipedia` tag, with a gpt-4o-mini
+  translation when there is no English page. Every page and translation is
+  cached on its own (data/build/wiki), so a refresh only looks up new titles.
+- select: stable POI ids (data/build/poi_ids.json, OSM element -> id, seeded
+  from the existing CSVs by geometry so ids used by the ground truth and Qdrant
+  survive), RAG_COLUMNS, and the selection of all POIs with a summary plus as
+  many without one (previously selected POIs are kept).
+- export: data/krakow_pois_for_rag.csv, data/krakow_pois_selected.csv and the
+  app's copy, plus data/build/manifest.json listing added / changed / removed
+  ids of the selected dataset for `python ingest.py --manifest`.
+
+normalize, enrich and select are content-addressed: their output is stored
+under data/build/<stage>-<sha1 of the inputs>.parquet and reused when the
+inputs did not change. --offline never touches the network: cache misses are
+reported, missing summaries stay empty and POIs of categories that have no
+cached response are carried over unchanged from the previous export.
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.join(BASE_DIR, "..")
+DATA_DIR = os.path.join(ROOT_DIR, "data")
+OSM_CACHE_DIR = os.path.join(ROOT_DIR, "notebooks", "cache")
+BUILD_DIR = os.path.join(DATA_DIR, "build")
+WIKI_CACHE_DIR = os.path.join(BUILD_DIR, "wiki")
+POI_IDS_PATH = os.path.join(BUILD_DIR, "poi_ids.json")
+MANIFEST_PATH = os.path.join(BUILD_DIR, "manifest.json")
+FOR_RAG_PATH = os.path.join(DATA_DIR, "krakow_pois_for_rag.csv")
+SELECTED_PATHS = [
+    os.path.join(DATA_DIR, "krakow_pois_selected.csv"),
+    os.path.join(BASE_DIR, "data", "krakow_pois_selected.csv"),
+]
+
+PLACE = "Kraków"
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+OVERPASS_URL = os.getenv("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+USER_AGENT = "travel assistance"
+TRANSLATION_MODEL = "gpt-4o-mini"
+SELECTION_SEED = 123
+MISSING = "no information"
+
+# Bump a stage's version when its code changes, so cached outputs are rebuilt.
+STAGE_VERSIONS = {"normalize": 1, "enrich": 1, "select": 1}
+STAGES = ["fetch", "normalize", "enrich", "select", "export"]
+
+CATEGORY_TAGS = {
+    'restaurants': {
+        'amenity': ['restaurant', 'cafe', 'fast_food', 'food_court', 'ice_cream', 'pub', 'bar', 'biergarten']
+    },
+    'attractions': {
+        'tourism': ['attraction', 'museum', 'monument', 'artwork', 'viewpoint', 'zoo', 'theme_park', 'yes'],
+        'historic': ['castle', 'church', 'cathedral', 'monastery', 'ruins', 'memorial', 'monument'],
+        'leisure': ['park', 'garden', 'nature_reserve']
+    },
+    'accommodation': {
+        'tourism': ['hotel', 'hostel', 'guest_house', 'apartment', 'camp_site', 'chalet']
+    },
+    'transport': {
+        'amenity': ['bus_station', 'taxi'],
+        'railway': ['station', 'tram_stop'],
+        'aeroway': ['aerodrome', 'terminal'],
+        'public_transport': ['station', 'stop_position']
+    },
+    'entertainment': {
+        'leisure': ['cinema', 'theatre', 'nightclub', 'bowling_alley', 'amusement_arcade'],
+        'amenity': ['casino', 'community_centre', 'social_centre']
+    },
+    'shopping': {
+        'shop': ['mall', 'department_store', 'supermarket', 'marketplace'],
+        'amenity': ['marketplace']
+    },
+    'services': {
+        'amenity': ['hospital', 'clinic', 'pharmacy', 'bank', 'atm', 'post_office', 'library'],
+        'tourism': ['information']
+    },
+    'outdoor': {
+        'natural': ['beach', 'peak', 'cave', 'spring'],
+        'leisure': ['beach_resort', 'sports_centre', 'stadium', 'swimming_pool'],
+        'sport': ['skiing', 'climbing', 'hiking']
+    }
+}
+
+# Columns chosen for RAG in notebook 00 (LLM suggestion plus the text columns), frozen.
+RAG_COLUMNS = [
+    'phone', 'cemetery', 'emergency', 'opening_hours', 'website', 'pets_allowed', 'geometry', 'historic',
+    'wiki_summary_en', 'postal_code', 'toilets', 'natural', 'description', 'visiting_time', 'leisure', 'tourism',
+    'public_transport', 'brand', 'alt_name', 'amenity', 'reservation', 'attraction', 'highchair', 'parking',
+    'swimming_pool', 'contact_phone', 'community_centre', 'addr_street', 'contact_twitter', 'social_facility',
+    'contact_facebook', 'zoo', 'email', 'wheelchair', 'cuisine', 'contact_website', 'internet_access',
+    'opening_hours_reception', 'guest_house', 'addr_city', 'contact_instagram', 'image', 'location',
+    'outdoor_seating', 'museum', 'takeaway', 'smoking', 'name', 'id',
+]
+TEXT_COLUMNS = ['name', 'amenity', 'leisure', 'natural', 'tourism', 'historic', 'wiki_summary_en']
+
+TRANSLATION_PROMPT = """
+Translate below text from Polish to English:{input_text}.
+Own name is {name}.
+
+Don't translate own name, only descriptive text.
+Return only translated text without any additional information.
+"""
+
+class OfflineCacheMiss(Exception):
+    pass
+
+def sha1(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def _read_json(path: str) -> Any:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_json(path: str, data: Any) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+class RateLimiter:
+    """Spaces calls at least 1/rate_per_s seconds apart across threads."""
+
+    def __init__(self, rate_per_s: float):
+        self.interval = 1.0 / rate_per_s if rate_per_s else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+# --- fetch ---------------------------------------------------------------------
+
+def _cached_request(key: str, request, offline: bool, limiter: RateLimiter) -> Tuple[Any, str]:
+    """Response for a request key from notebooks/cache, fetched on a miss; returns (data, cache path)."""
+    path = os.path.join(OSM_CACHE_DIR, f"{sha1(key)}.json")
+    if os.path.exists(path):
+        return _read_json(path), path
+    if offline:
+        raise OfflineCacheMiss(key)
+    limiter.wait()
+    data = request()
+    _write_json(path, data)
+    return data, path
+
+def overpass_query(area_id: int, tags: Dict[str, List[str]]) -> str:
+    clauses = "".join(f'nwr["{key}"~"^({"|".join(values)})$"](area.a);' for key, values in tags.items())
+    return f"[out:json][timeout:180];area(id:{area_id})->.a;({clauses});out body;>;out skel qt;"
+
+def _matching_share(response: Dict[str, Any], tags: Dict[str, List[str]]) -> float:
+    tagged = [e["tags"] for e in response.get("elements", []) if e.get("tags")]
+    if not tagged:
+        return 0.0
+    return sum(any(t.get(k) in v for k, v in tags.items()) for t in tagged) / len(tagged)
+
+def legacy_response(category: str) -> Optional[str]:
+    """
+    Cached Overpass response written by osmnx for a category (its cache keys
+    cannot be recomputed): the file whose tagged elements best match the
+    category's tags, if that category is also the best match for the file.
+    """
+    best, best_share = None, 0.0
+    for name in sorted(os.listdir(OSM_CACHE_DIR)) if os.path.isdir(OSM_CACHE_DIR) else []:
+        path = os.path.join(OSM_CACHE_DIR, name)
+        data = _read_json(path)
+        if not isinstance(data, dict) or "elements" not in data:
+            continue
+        shares = {c: _matching_share(data, t) for c, t in CATEGORY_TAGS.items()}
+        if max(shares, key=shares.get) == category and shares[category] > best_share:
+            best, best_share = path, shares[category]
+    return best
+
+def fetch(offline: bool = False, workers: int = 2, rate_per_s: float = 1.0) -> Dict[str, Optional[str]]:
+    """Cache path of the raw Overpass response per category (None when offline and not cached)."""
+    import requests
+
+    headers = {"User-Agent": USER_AGENT}
+    limiter = RateLimiter(rate_per_s)
+    url = f"{NOMINATIM_URL}?{urlencode({'format': 'json', 'polygon_geojson': 1, 'dedupe': 0, 'limit': 50, 'q': PLACE})}"
+    places, _ = _cached_request(
+        url, lambda: requests.get(url, headers=headers, timeout=180).json(), offline, RateLimiter(1.0))
+    relation = next(p for p in places if p.get("osm_type") == "relation")
+    area_id = 3_600_000_000 + int(relation["osm_id"])
+
+    def fetch_category(category: str) -> Optional[str]:
+        query = overpass_query(area_id, CATEGORY_TAGS[category])
+        request = lambda: requests.post(OVERPASS_URL, data={"data": query}, headers=headers, timeout=240).json()
+        try:
+            return _cached_request(f"{OVERPASS_URL}?{query}", request, offline, limiter)[1]
+        except OfflineCacheMiss:
+            return legacy_response(category)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        paths = dict(zip(CATEGORY_TAGS, pool.map(fetch_category, CATEGORY_TAGS)))
+    for category, path in paths.items():
+        print(f"fetch {category}: {os.path.basename(path) if path else 'not cached (offline)'}")
+    return paths
+
+# --- content-addressed stages ----------------------------------------------------
+
+def file_sha1(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def run_stage(stage: str, inputs: Any, compute, force: bool = False) -> Tuple[pd.DataFrame, str]:
+    """Output of a stage for the given inputs, computed only when not stored yet; returns (frame, key)."""
+    key = sha1(json.dumps([stage, STAGE_VERSIONS[stage], inputs], sort_keys=True, default=str))
+    path = os.path.join(BUILD_DIR, f"{stage}-{key[:16]}.parquet")
+    if os.path.exists(path) and not force:
+        print(f"{stage}: cached ({os.path.basename(path)})")
+        return pd.read_parquet(path), key
+    start = time.perf_counter()
+    df = compute()
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    df.to_parquet(f"{path}.tmp", index=False)
+    os.replace(f"{path}.tmp", path)
+    print(f"{stage}: built {len(df)} rows in {time.perf_counter() - start:.1f}s ({os.path.basename(path)})")
+    return df, key
+
+# --- normalize ---------------------------------------------------------------------
+
+def _geometry(element: Dict[str, Any], nodes: Dict[int, tuple], ways: Dict[int, list]):
+    from shapely.geometry import LineString, MultiLineString, Point, Polygon
+    from shapely.ops import polygonize, unary_union
+
+    if element["type"] == "node":
+        return Point(nodes[element["id"]])
+    if element["type"] == "way":
+        coords = [nodes[n] for n in element.get("nodes", []) if n in nodes]
+        if len(coords) >= 4 and coords[0] == coords[-1]:
+            return Polygon(coords)
+        return LineString(coords) if len(coords) >= 2 else None
+    outer = [ways[m["ref"]] for m in element.get("members", [])
+             if m["type"] == "way" and m.get("role") in ("outer", "") and m["ref"] in ways]
+    outer = [[nodes[n] for n in way if n in nodes] for way in outer]
+    polygons = list(polygonize(unary_union(MultiLineString([c for c in outer if len(c) >= 2])))) if outer else []
+    return unary_union(polygons) if polygons else None
+
+def normalize_responses(paths: Dict[str, Optional[str]]) -> pd.DataFrame:
+    rows = []
+    for category, path in paths.items():
+        if path is None:
+            continue
+        elements = _read_json(path)["elements"]
+        nodes = {e["id"]: (e["lon"], e["lat"]) for e in elements if e["type"] == "node" and "lon" in e}
+        ways = {e["id"]: e.get("nodes", []) for e in elements if e["type"] == "way"}
+        for element in elements:
+            tags = element.get("tags") or {}
+            if not any(tags.get(k) in v for k, v in CATEGORY_TAGS[category].items()):
+                continue  # member ways / nodes returned for geometry only
+            geometry = _geometry(element, nodes, ways)
+            if geometry is None or geometry.is_empty:
+                continue
+            rows.append({"osm_key": f"{category}/{element['type']}/{element['id']}", "poi_category": category,
+                         "geometry": geometry.wkt, **{f"_tag_{k}": v for k, v in tags.items()}})
+    df = pd.DataFrame(rows)
+    # all name variants joined in column order, as the notebook's all_names_concat
+    name_columns = [c for c in df.columns if c.startswith("_tag_") and "name" in c]
+    df["_name"] = [";".join(dict.fromkeys(v for v in names if isinstance(v, str))) or None
+                   for names in df[name_columns].itertuples(index=False)]
+    df = df.rename(columns=lambda c: c[len("_tag_"):].replace(":", "_") if c.startswith("_tag_") else c)
+    df = df.loc[:, ~df.columns.duplicated()].drop(columns="name", errors="ignore").rename(columns={"_name": "name"})
+    wiki = df["wikipedia"].str.split(":", n=1, expand=True) if "wikipedia" in df else pd.DataFrame(index=df.index)
+    df["wiki_lang"] = wiki[0] if 0 in wiki else None
+    df["wiki_title"] = wiki[1] if 1 in wiki else None
+    return df.astype(object).where(df.notna(), None)
+
+# --- enrich ------------------------------------------------------------------------
+
+def _wiki_cache_path(kind: str, key: str) -> str:
+    return os.path.join(WIKI_CACHE_DIR, f"{kind}-{sha1(key)}.json")
+
+def wiki_summary(lang: str, title: str, offline: bool, limiter: RateLimiter) -> Optional[Dict[str, Any]]:
+    """{"summary": str|None, "en_found": bool} for a Wikipedia page, cached per (lang, title)."""
+    path = _wiki_cache_path("page", f"{lang}:{title}")
+    if os.path.exists(path):
+        return _read_json(path)
+    if offline:
+        return None
+    import wikipediaapi
+
+    limiter.wait()
+    page = wikipediaapi.Wikipedia(user_agent=USER_AGENT, language=lang).page(title)
+    result = {"summary": None, "en_found": False}
+    if page.exists():
+        en_page = page.langlinks.get("en")
+        if en_page is not None and en_page.exists():
+            result = {"summary": en_page.summary, "en_found": True}
+        else:
+            result["summary"] = page.summary
+    _write_json(path, result)
+    return result
+
+def translate(text: str, name: str, offline: bool, limiter: RateLimiter) -> Optional[str]:
+    prompt = TRANSLATION_PROMPT.format(input_text=text, name=name)
+    path = _wiki_cache_path("translation", prompt)
+    if os.path.exists(path):
+        return _read_json(path)["text"]
+    if offline:
+        return None
+    from openai import OpenAI
+
+    limiter.wait()
+    response = OpenAI().chat.completions.create(model=TRANSLATION_MODEL, messages=[{"role": "user", "content": prompt}])
+    translated = response.choices[0].message.content
+    _write_json(path, {"text": translated})
+    return translated
+
+def seed_wiki_cache(normalized: pd.DataFrame, poi_ids: Dict[str, int], previous: pd.DataFrame) -> int:
+    """Store English summaries of the previous export as cache entries for their pages (first build)."""
+    summaries = previous.set_index("id")["wiki_summary_en"].to_dict()
+    count = 0
+    for row in normalized[normalized["wiki_title"].notna()].itertuples():
+        summary = summaries.get(poi_ids.get(row.osm_key))
+        path = _wiki_cache_path("page", f"{row.wiki_lang}:{row.wiki_title}")
+        if summary and summary != MISSING and not os.path.exists(path):
+            _write_json(path, {"summary": summary, "en_found": True, "source": "previous export"})
+            count += 1
+    return count
+
+def enrich_summaries(normalized: pd.DataFrame, offline: bool, workers: int, rate_per_s: float) -> Dict[str, Optional[str]]:
+    """English summary per "lang:title"; only titles without a cache entry are looked up."""
+    pages = normalized.loc[normalized["wiki_title"].notna(), ["wiki_lang", "wiki_title"]].drop_duplicates()
+    limiter = RateLimiter(rate_per_s)
+
+    def resolve(page) -> Optional[str]:
+        lang, title = page
+        try:
+            result = wiki_summary(lang, title, offline, limiter)
+            if not result or not result["summary"] or result["en_found"]:
+                return result and result["summary"]
+            return translate(result["summary"], title, offline, limiter)
+        except Exception as e:
+            print(f"enrich {lang}:{title} failed: {e!r}")
+            return None
+
+    keys = [f"{lang}:{title}" for lang, title in pages.itertuples(index=False)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        summaries = dict(zip(keys, pool.map(resolve, pages.itertuples(index=False))))
+    missing = sum(v is None for v in summaries.values())
+    print(f"enrich: {len(summaries)} Wikipedia pages, {missing} without a summary{' (offline)' if offline else ''}")
+    return summaries
+
+# --- select ------------------------------------------------------------------------
+
+def load_poi_ids() -> Dict[str, int]:
+    return _read_json(POI_IDS_PATH) if os.path.exists(POI_IDS_PATH) else {}
+
+def assign_ids(enriched: pd.DataFrame, poi_ids: Dict[str, int], previous: pd.DataFrame) -> Dict[str, int]:
+    """
+    Keep ids of known OSM elements; on the first build match elements to the
+    previous export by geometry (ids there are the notebook's row numbers).
+    New elements get the next free id.
+    """
+    poi_ids = dict(poi_ids)
+    if not poi_ids and len(previous):
+        by_geometry: Dict[str, List[int]] = {}
+        for geometry, poi_id in zip(previous["geometry"], previous["id"]):
+            by_geometry.setdefault(geometry, []).append(poi_id)
+        for osm_key, geometry in zip(enriched["osm_key"], enriched["geometry"]):
+            if by_geometry.get(geometry):
+                poi_ids[osm_key] = by_geometry[geometry].pop(0)
+    next_id = max([*poi_ids.values(), *previous["id"].tolist(), -1]) + 1
+    for osm_key in enriched["osm_key"]:
+        if osm_key not in poi_ids:
+            poi_ids[osm_key] = next_id
+            next_id += 1
+    return poi_ids
+
+def to_rag_frame(enriched: pd.DataFrame, poi_ids: Dict[str, int]) -> pd.DataFrame:
+    df = enriched.copy()
+    df["id"] = df["osm_key"].map(poi_ids)
+    for column in RAG_COLUMNS:
+        if column not in df:
+            df[column] = None
+    df[TEXT_COLUMNS] = df[TEXT_COLUMNS].fillna(MISSING)
+    return df[RAG_COLUMNS].sort_values("id").reset_index(drop=True)
+
+def select_pois(for_rag: pd.DataFrame, previous_selected_ids: set) -> pd.DataFrame:
+    """All POIs with a summary plus as many without; POIs selected before stay selected."""
+    with_wiki = for_rag[for_rag["wiki_summary_en"] != MISSING]
+    without_wiki = for_rag[for_rag["wiki_summary_en"] == MISSING]
+    kept = without_wiki[without_wiki["id"].isin(previous_selected_ids)].head(len(with_wiki))
+    rest = without_wiki[~without_wiki["id"].isin(kept["id"])]
+    extra = rest.sample(min(len(with_wiki) - len(kept), len(rest)), random_state=SELECTION_SEED)
+    return pd.concat([with_wiki, kept, extra]).sort_values("id").reset_index(drop=True)
+
+# --- export ------------------------------------------------------------------------
+
+def _comparable(df: pd.DataFrame) -> Dict[int, str]:
+    values = df[RAG_COLUMNS].astype(object).where(df[RAG_COLUMNS].notna(), "").astype(str)
+    return {int(i): sha1("\x1f".join(row)) for i, row in zip(df["id"], values.itertuples(index=False))}
+
+def diff_manifest(previous: pd.DataFrame, current: pd.DataFrame) -> Dict[str, Any]:
+    before, after = _comparable(previous), _comparable(current)
+    changed = sorted(i for i in after if i in before and before[i] != after[i])
+    return {
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "dataset": os.path.relpath(SELECTED_PATHS[0], ROOT_DIR),
+        "dataset_sha1": sha1(json.dumps(sorted(after.items()))),
+        "added": sorted(set(after) - set(before)),
+        "changed": changed,
+        "removed": sorted(set(before) - set(after)),
+        "unchanged": len(after) - len(changed) - len(set(after) - set(before)),
+    }
+
+def read_previous(path: str) -> pd.DataFrame:
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=RAG_COLUMNS)
+    return pd.read_csv(path, dtype=str, keep_default_na=False).astype({"id": int})
+
+def build(offline: bool = False, force: Optional[str] = None, workers: int = 4,
+          overpass_rate: float = 1.0, wiki_rate: float = 5.0, dry_run: bool = False) -> Dict[str, Any]:
+    forced = set(STAGES[STAGES.index(force):]) if force else set()
+    previous_for_rag = read_previous(FOR_RAG_PATH)
+    previous_selected = read_previous(SELECTED_PATHS[0])
+
+    paths = fetch(offline, workers=min(workers, 2), rate_per_s=overpass_rate)
+    fetched = {c: file_sha1(p) for c, p in paths.items() if p}
+    normalized, normalized_key = run_stage("normalize", fetched, lambda: normalize_responses(paths), "normalize" in forced)
+
+    poi_ids = assign_ids(normalized, load_poi_ids(), previous_for_rag)
+    if not os.path.exists(POI_IDS_PATH):
+        print(f"enrich: seeded {seed_wiki_cache(normalized, poi_ids, previous_for_rag)} pages from the previous export")
+    summaries = enrich_summaries(normalized, offline, workers, wiki_rate)
+
+    def compute_enriched() -> pd.DataFrame:
+        df = normalized.copy()
+        df["wiki_summary_en"] = [summaries.get(f"{lang}:{title}") if title else None
+                                 for lang, title in zip(df["wiki_lang"], df["wiki_title"])]
+        return df
+
+    summaries_key = sha1(json.dumps(sorted(summaries.items()), default=str))
+    enriched, enriched_key = run_stage("enrich", [normalized_key, summaries_key], compute_enriched, "enrich" in forced)
+
+    ids_key = sha1(json.dumps(sorted(poi_ids.items())))
+    missing_categories = sorted(c for c, p in paths.items() if p is None)
+
+    def compute_for_rag() -> pd.DataFrame:
+        df = to_rag_frame(enriched, poi_ids)
+        if missing_categories:
+            # POIs of categories without a response: keep the previous rows as they were
+            carried = previous_for_rag[~previous_for_rag["id"].isin(set(poi_ids.values()))]
+            print(f"select: carried over {len(carried)} POIs for {', '.join(missing_categories)}")
+            df = pd.concat([df.astype(object), carried.replace({"": None}).astype(object)])
+            df = df.sort_values("id").reset_index(drop=True)
+        return df
+
+    for_rag, _ = run_stage("select", [enriched_key, ids_key, missing_categories,
+                                      sha1(previous_for_rag.to_json()) if missing_categories else None],
+                           compute_for_rag, "select" in forced)
+    selected = select_pois(for_rag, set(previous_selected["id"]))
+    manifest = diff_manifest(previous_selected, selected)
+    print(f"export: {len(selected)} selected POIs: {len(manifest['added'])} added, "
+          f"{len(manifest['changed'])} changed, {len(manifest['removed'])} removed, {manifest['unchanged']} unchanged")
+    if dry_run:
+        return manifest
+
+    _write_json(POI_IDS_PATH, poi_ids)
+    for_rag.to_csv(FOR_RAG_PATH, index=False, header=True)
+    for path in SELECTED_PATHS:
+        selected.to_csv(path, index=False, header=True)
+    _write_json(MANIFEST_PATH, manifest)
+    return manifest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offline", action="store_true", help="use cached responses only")
+    parser.add_argument("--force", choices=STAGES[1:], help="recompute this stage and the ones after it")
+    parser.add_argument("--workers", type=int, default=4, help="parallel Wikipedia / translation lookups")
+    parser.add_argument("--overpass-rate", type=float, default=1.0, help="Overpass / Nominatim requests per second")
+    parser.add_argument("--wiki-rate", type=float, default=5.0, help="Wikipedia / translation requests per second")
+    parser.add_argument("--dry-run", action="store_true", help="report the changes without writing the CSVs")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    build(args.offline, args.force, args.workers, args.overpass_rate, args.wiki_rate, args.dry_run)
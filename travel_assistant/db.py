@@ -15,32 +15,105 @@ def get_db_connection():
         password=os.getenv("POSTGRES_PASSWORD", "your_password"),
     )
 
+# Daily aggregates of rows moved to the Parquet archive (retention.py); sums,
+# so batches of the same day add up.
+ROLLUP_TABLES = {
+    "conversation_daily": """
+        CREATE TABLE IF NOT EXISTS conversation_daily (
+            day DATE NOT NULL,
+            model_name TEXT NOT NULL,
+            questions INTEGER NOT NULL,
+            tokens_used BIGINT NOT NULL,
+            input_tokens BIGINT NOT NULL,
+            estimated_cost_usd FLOAT NOT NULL,
+            eval_tokens_used BIGINT NOT NULL,
+            eval_estimated_cost_usd FLOAT NOT NULL,
+            judged INTEGER NOT NULL,
+            quality_score_sum FLOAT NOT NULL,
+            PRIMARY KEY (day, model_name)
+        )
+    """,
+    "feedback_daily": """
+        CREATE TABLE IF NOT EXISTS feedback_daily (
+            day DATE NOT NULL,
+            feedback_type TEXT NOT NULL,
+            responses INTEGER NOT NULL,
+            PRIMARY KEY (day, feedback_type)
+        )
+    """,
+}
+
+TIMESTAMP_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS conversations_timestamp_idx ON conversations (timestamp)",
+    "CREATE INDEX IF NOT EXISTS feedback_timestamp_idx ON feedback (timestamp)",
+]
+
+def init_retention_schema(cur):
+    """Rollup tables and the timestamp indexes retention batches select by (idempotent)."""
+    for ddl in ROLLUP_TABLES.values():
+        cur.execute(ddl)
+    for ddl in TIMESTAMP_INDEXES:
+        cur.execute(ddl)
+
+# init_db only runs on a database without the conversations table; columns
+# added or relaxed since the first schema are brought in by migrate_db, which
+# the app runs at every start-up (all statements are idempotent).
+NULLABLE_EVAL_COLUMNS = ["quality_score", "faithfulness", "groundedness", "relevance", "completeness", "coherence",
+                         "conciseness", "eval_input_tokens", "eval_tokens_used", "eval_estimated_cost_usd"]
+NULLABLE_USAGE_COLUMNS = ["tokens_used", "input_tokens", "estimated_cost_usd"]
+MIGRATIONS = [
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS routing JSONB",
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS eval_status TEXT",
+    # POIs the answer was generated from, for judging it later (negative feedback)
+    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS context_ids JSONB",
+    # labels arrive later from the judge, or never for unsampled answers
+    *(f"ALTER TABLE conversations ALTER COLUMN {column} DROP NOT NULL" for column in NULLABLE_EVAL_COLUMNS),
+    # a provider response may come without usage
+    *(f"ALTER TABLE conversations ALTER COLUMN {column} DROP NOT NULL" for column in NULLABLE_USAGE_COLUMNS),
+]
+
+def migrate_db():
+    """Bring an existing schema up to date with the one init_db creates."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            for ddl in MIGRATIONS:
+                cur.execute(ddl)
+        conn.commit()
+    finally:
+        conn.close()
+
 def init_db():
     conn = get_db_connection()
     try:
         with conn.cursor() as cur:
             cur.execute("DROP TABLE IF EXISTS feedback")
             cur.execute("DROP TABLE IF EXISTS conversations")
+            for table in ROLLUP_TABLES:
+                cur.execute(f"DROP TABLE IF EXISTS {table}")
 
             cur.execute("""
                 CREATE TABLE conversations (
                     id TEXT PRIMARY KEY,
                     question TEXT NOT NULL ,
                     answer TEXT NOT NULL ,
-                    quality_score FLOAT NOT NULL ,
-                    faithfulness TEXT NOT NULL,
-                    groundedness TEXT NOT NULL,
-                    relevance TEXT NOT NULL,
-                    completeness TEXT NOT NULL,
-                    coherence TEXT NOT NULL,
-                    conciseness TEXT NOT NULL,
-                    tokens_used INTEGER NOT NULL,
-                    input_tokens INTEGER NOT NULL,
-                    estimated_cost_usd FLOAT NOT NULL,
+                    quality_score FLOAT,
+                    faithfulness TEXT,
+                    groundedness TEXT,
+                    relevance TEXT,
+                    completeness TEXT,
+                    coherence TEXT,
+                    conciseness TEXT,
+                    tokens_used INTEGER,
+                    input_tokens INTEGER,
+                    estimated_cost_usd FLOAT,
                     model_name TEXT NOT NULL,
-                    eval_input_tokens INTEGER NOT NULL,
-                    eval_tokens_used INTEGER NOT NULL,  
-                    eval_estimated_cost_usd FLOAT NOT NULL,
+                    eval_input_tokens INTEGER,
+                    eval_tokens_used INTEGER,
+                    eval_estimated_cost_usd FLOAT,
+                    eval_status TEXT,
+                    routing JSONB,
+                    context_ids JSONB,
                     timestamp TIMESTAMP WITH TIME ZONE NOT NULL
                      )   
             """)
@@ -52,6 +125,7 @@ def init_db():
                     conversation_id TEXT PRIMARY KEY
                 )
             """)
+            init_retention_schema(cur)
         conn.commit()
     finally:
         conn.close()
@@ -82,8 +156,11 @@ model_name,
 eval_input_tokens,
 eval_tokens_used,
 eval_estimated_cost_usd,
+eval_status,
+routing,
+context_ids,
 timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,%s,%s,%s)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,%s,%s,%s,%s,%s,%s)
                 """,
                 (
                     answear['id'],
@@ -103,6 +180,9 @@ timestamp)
                     answear['eval_input_tokens'],
                     answear['eval_tokens_used'],
                     answear['eval_estimated_cost_usd'],
+                    answear.get('eval_status'),
+                    json.dumps(answear.get('routing'), default=str) if answear.get('routing') else None,
+                    json.dumps(answear.get('context_ids'), default=str) if answear.get('context_ids') is not None else None,
                     answear['timestamp']
                 ),
             )
@@ -111,6 +191,19 @@ timestamp)
         conn.close()
 
 
+def update_conversation_eval(conversation_id, fields):
+    """Set judge labels / eval_status on an existing conversation row."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            assignments = ", ".join(f"{column} = %s" for column in fields)
+            cur.execute(f"UPDATE conversations SET {assignments} WHERE id = %s",
+                        (*fields.values(), conversation_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
 def save_feedback( feedback):
     conn = get_db_connection()
     try:
@@ -147,6 +240,18 @@ def get_feedback_data():
     finally:
         conn.close()
 
+def get_conversations_by_ids(ids):
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            cur.execute("SELECT id, question, answer, eval_status, context_ids, timestamp FROM conversations WHERE id = ANY(%s)", (list(ids),))
+            conversations = [dict(row) for row in cur.fetchall()]
+            cur.execute("SELECT * FROM feedback WHERE conversation_id = ANY(%s)", (list(ids),))
+            feedback = [dict(row) for row in cur.fetchall()]
+            return conversations, feedback
+    finally:
+        conn.close()
+
 def _parse_timestamp(value: Any) -> datetime.datetime:
     """Robust timestamp parser: accepts ISO strings, naive/datetime, unix epoch."""
     if value is None:
@@ -193,8 +298,8 @@ def import_conversations_from_file(filename: str = "answer_data.json") -> Dict[s
         INSERT INTO conversations
         (id, question, answer, quality_score, faithfulness, groundedness, relevance, completeness,
          coherence, conciseness, tokens_used, input_tokens, estimated_cost_usd, model_name,
-         eval_input_tokens, eval_tokens_used, eval_estimated_cost_usd, timestamp)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+         eval_input_tokens, eval_tokens_used, eval_estimated_cost_usd, eval_status, routing, context_ids, timestamp)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         ON CONFLICT (id) DO NOTHING
     """
 
@@ -208,13 +313,13 @@ def import_conversations_from_file(filename: str = "answer_data.json") -> Dict[s
                         rec.get("id"),
                         rec.get("question", ""),
                         rec.get("answer", ""),
-                        float(rec.get("quality_score", 0.0) or 0.0),
-                        rec.get("faithfulness", ""),
-                        rec.get("groundedness", ""),
-                        rec.get("relevance", ""),
-                        rec.get("completeness", ""),
-                        rec.get("coherence", ""),
-                        rec.get("conciseness", ""),
+                        float(rec["quality_score"]) if rec.get("quality_score") is not None else None,
+                        rec.get("faithfulness"),
+                        rec.get("groundedness"),
+                        rec.get("relevance"),
+                        rec.get("completeness"),
+                        rec.get("coherence"),
+                        rec.get("conciseness"),
                         int(rec.get("tokens_used", 0) or 0),
                         int(rec.get("input_tokens", 0) or 0),
                         float(rec.get("estimated_cost_usd", 0.0) or 0.0),
@@ -222,6 +327,9 @@ def import_conversations_from_file(filename: str = "answer_data.json") -> Dict[s
                         int(rec.get("eval_input_tokens", 0) or 0),
                         int(rec.get("eval_tokens_used", 0) or 0),
                         float(rec.get("eval_estimated_cost_usd", 0.0) or 0.0),
+                        rec.get("eval_status") or ("sampled" if rec.get("quality_score") is not None else "skipped"),
+                        json.dumps(rec["routing"], default=str) if rec.get("routing") else None,
+                        json.dumps(rec["context_ids"], default=str) if rec.get("context_ids") is not None else None,
                         ts,
                     )
                     cur.execute(insert_sql, vals)
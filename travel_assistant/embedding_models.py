@@ -0,0 +1,52 @@
+import os
+
+# Dense embedding models for the `hybrid_search` collection, shared by ingest
+# (collection schema and point vectors) and rag (query vectors), so the two
+# cannot drift apart. RAG_EMBEDDING_MODEL selects one; a different model gives
+# a different index_versions data hash, so the next publish builds a new
+# version. All are fastembed ONNX models running on the CPU; compare them
+# with benchmark_embeddings.py before switching.
+#   model:       fastembed model name
+#   dim:         vector size of the named dense vector
+#   vector_name: name of the dense vector in the collection
+EMBEDDING_MODELS = {
+    "jina-small": {
+        "model": "jinaai/jina-embeddings-v2-small-en",
+        "dim": 512,
+        "vector_name": "jina-small",
+    },
+    "bge-small": {
+        "model": "BAAI/bge-small-en-v1.5",
+        "dim": 384,
+        "vector_name": "bge-small",
+    },
+    "arctic-xs": {
+        "model": "snowflake/snowflake-arctic-embed-xs",
+        "dim": 384,
+        "vector_name": "arctic-xs",
+    },
+    "minilm": {
+        "model": "sentence-transformers/all-MiniLM-L6-v2",
+        "dim": 384,
+        "vector_name": "minilm",
+    },
+    # static token embeddings (no transformer at query time)
+    "potion-retrieval": {
+        "model": "minishlab/potion-retrieval-32M",
+        "dim": 512,
+        "vector_name": "potion-retrieval",
+    },
+}
+
+DEFAULT_MODEL = "jina-small"
+
+# BM25 branch of the hybrid search; not configurable.
+SPARSE_MODEL = "Qdrant/bm25"
+SPARSE_VECTOR_NAME = "bm25"
+
+def get_model(name: str | None = None) -> dict:
+    """Return the named model, or the one selected by RAG_EMBEDDING_MODEL."""
+    name = name or os.getenv("RAG_EMBEDDING_MODEL", DEFAULT_MODEL)
+    if name not in EMBEDDING_MODELS:
+        raise ValueError(f"Unknown embedding model '{name}'. Available: {sorted(EMBEDDING_MODELS)}")
+    return EMBEDDING_MODELS[name]
@@ -0,0 +1,208 @@
+"""
+Process-wide, micro-batched query embedding for the dense branch (the
+RAG_EMBEDDING_MODEL entry of embedding_models.py, jina-small by default).
+
+Every search used to run its own single-text ONNX inference inside the Qdrant
+client, so concurrent sessions fought over the cores with many tiny calls.
+`SERVICE` owns one fastembed model (RAG_EMBED_THREADS intra-op threads) and
+one worker thread: texts submitted by any session are collected for up to
+RAG_EMBED_BATCH_WINDOW_MS after the first one arrives, or until
+RAG_EMBED_MAX_BATCH texts are waiting, embedded in one call and the vectors
+handed back to the waiting callers. rag.rrf_search then queries Qdrant with
+the precomputed vector (BM25 stays client-side as before). RAG_EMBED_BATCHING=0
+restores the per-query inference in the client.
+
+`stats()` has batch-size and queue-wait histograms (also on the RAG API
+/health). The load-test harness compares batched with per-call inference:
+
+    python travel_assistant/embedding_service.py --concurrency 16 --requests 800
+"""
+import os
+import time
+import queue
+import bisect
+import asyncio
+import argparse
+import threading
+import concurrent.futures
+from typing import Any, Dict, List, Optional
+
+import embedding_models
+
+DENSE_MODEL = embedding_models.get_model()["model"]
+BATCHING_ENABLED = os.getenv("RAG_EMBED_BATCHING", "1") == "1"
+BATCH_WINDOW_MS = float(os.getenv("RAG_EMBED_BATCH_WINDOW_MS", "5"))
+MAX_BATCH = int(os.getenv("RAG_EMBED_MAX_BATCH", "32"))
+THREADS = int(os.getenv("RAG_EMBED_THREADS", "0")) or None  # None = onnxruntime default
+# upper bound for a blocking embed(); generous because the first batch loads the model
+TIMEOUT_S = float(os.getenv("RAG_EMBED_TIMEOUT_S", "60"))
+BATCH_SIZE_BOUNDS = [1, 2, 4, 8, 16, 32, 64]
+QUEUE_WAIT_MS_BOUNDS = [0.5, 1, 2, 5, 10, 20, 50, 100]
+
+class Histogram:
+    """Fixed-bucket histogram: counts per upper bound (inclusive) plus overflow."""
+
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.total += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            buckets = {f"le_{bound:g}": n for bound, n in zip(self.bounds, self.counts)}
+            buckets["inf"] = self.counts[-1]
+            return {"count": self.count, "mean": self.total / self.count if self.count else 0.0, "buckets": buckets}
+
+class EmbeddingService:
+    def __init__(self, model_name: str = DENSE_MODEL, window_ms: float = BATCH_WINDOW_MS,
+                 max_batch: int = MAX_BATCH, threads: Optional[int] = THREADS, model=None):
+        self.model_name = model_name
+        self.window_s = window_ms / 1000
+        self.max_batch = max_batch
+        self.threads = threads
+        self.model = model
+        self.batch_sizes = Histogram(BATCH_SIZE_BOUNDS)
+        self.queue_wait_ms = Histogram(QUEUE_WAIT_MS_BOUNDS)
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._pid != os.getpid():
+                # first use, or a forked RAG API worker: the parent's thread did not survive the fork
+                self._queue = queue.Queue()
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="query-embedding", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def submit(self, text: str) -> "concurrent.futures.Future[List[float]]":
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            self._start()
+        future: "concurrent.futures.Future[List[float]]" = concurrent.futures.Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def embed(self, text: str, timeout: Optional[float] = TIMEOUT_S) -> List[float]:
+        future = self.submit(text)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    async def embed_async(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _next_batch(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.window_s
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                # past the window (the model was busy): take what is already queued, do not wait
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            # a caller that gave up (cancelled embed_async, timed-out embed) is dropped here;
+            # the others can no longer be cancelled
+            batch = [item for item in self._next_batch() if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._embed_batch(batch)
+            except Exception as e:
+                # keep the only worker alive whatever happens to one batch
+                print(f"Query embedding batch failed: {e!r}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _embed_batch(self, batch: List[tuple]) -> None:
+        started = time.perf_counter()
+        for _, _, enqueued in batch:
+            self.queue_wait_ms.observe((started - enqueued) * 1000)
+        self.batch_sizes.observe(len(batch))
+        if self.model is None:
+            from fastembed import TextEmbedding
+            self.model = TextEmbedding(model_name=self.model_name, threads=self.threads)
+        vectors = list(self.model.query_embed([text for text, _, _ in batch]))
+        if len(vectors) != len(batch):
+            raise RuntimeError(f"{len(vectors)} vectors for {len(batch)} texts")
+        for (_, future, _), vector in zip(batch, vectors):
+            future.set_result(vector.tolist())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window_s * 1000,
+            "max_batch": self.max_batch,
+            "queued": self._queue.qsize(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
+
+SERVICE = EmbeddingService()
+
+def stats() -> Dict[str, Any]:
+    return SERVICE.stats()
+
+def load_test(service: EmbeddingService, texts: List[str], concurrency: int, batched: bool) -> Dict[str, float]:
+    """`concurrency` callers embed `texts` as fast as they can, through the batcher or one call each."""
+    import retrieval_eval
+
+    latencies_ms: List[float] = []
+
+    def one(text: str) -> None:
+        start = time.perf_counter()
+        if batched:
+            service.embed(text)
+        else:
+            list(service.model.query_embed([text]))
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, texts))
+    elapsed = time.perf_counter() - start
+    return {
+        "queries_per_s": len(texts) / elapsed,
+        "p50_ms": retrieval_eval.percentile(latencies_ms, 50),
+        "p95_ms": retrieval_eval.percentile(latencies_ms, 95),
+    }
+
+if __name__ == "__main__":
+    import retrieval_eval
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=800, help="ground-truth questions to embed per run")
+    parser.add_argument("--window-ms", type=float, default=BATCH_WINDOW_MS)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--threads", type=int, default=THREADS)
+    args = parser.parse_args()
+
+    texts = [q['question'] for q in retrieval_eval.load_ground_truth(sample=args.requests)]
+    service = EmbeddingService(window_ms=args.window_ms, max_batch=args.max_batch, threads=args.threads)
+    service.embed(texts[0])  # load the model outside the measurement
+    service.batch_sizes, service.queue_wait_ms = Histogram(BATCH_SIZE_BOUNDS), Histogram(QUEUE_WAIT_MS_BOUNDS)
+    per_call = load_test(service, texts, args.concurrency, batched=False)
+    batched = load_test(service, texts, args.concurrency, batched=True)
+    print(f"per-call: {per_call}")
+    print(f"batched:  {batched}")
+    print(f"throughput gain: x{batched['queries_per_s'] / per_call['queries_per_s']:.2f}")
+    print(f"batch sizes: {service.batch_sizes.snapshot()}")
+    print(f"queue wait (ms): {service.queue_wait_ms.snapshot()}")
@@ -0,0 +1,258 @@
+"""
+Offline RAG evaluation sweep over model x prompt x question cells
+(the comparison from notebooks/04_RAG_evaluation.ipynb).
+
+    python travel_assistant/eval_runner.py --models gemini_llm openai_llm --sample 100 --workers 16
+    python travel_assistant/eval_runner.py --import-cache --ids-from-store --models openai_llm
+    python travel_assistant/eval_runner.py --export-only       # rebuild parquet/csv from the store
+
+Cells run concurrently (--workers in flight) under the per-provider limits of
+rag.PROVIDER_CONCURRENCY plus an optional requests-per-minute cap
+(--rpm gemini=300 openai=500). Each question is retrieved once and shared by
+all its cells. Every finished cell is written to one SQLite store
+(data/experiments_output/runs.sqlite, key (model, prompt, id)); cells already
+stored without an error are skipped, so an interrupted sweep resumes where it
+stopped. all_runs.parquet and agg_results.csv are rebuilt from the store at
+the end.
+"""
+import os
+import glob
+import json
+import time
+import asyncio
+import sqlite3
+import argparse
+from typing import Any, Dict, List, Optional
+
+import router
+import retrieval_eval
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.path.join(BASE_DIR, "..", "data", "experiments_output")
+STORE_PATH = os.path.join(OUTPUT_DIR, "runs.sqlite")
+ALL_RUNS_PATH = os.path.join(OUTPUT_DIR, "all_runs.parquet")
+AGG_RESULTS_PATH = os.path.join(OUTPUT_DIR, "agg_results.csv")
+
+MODELS = ["gemini_llm", "openai_llm", "mistral_llm"]
+PROMPTS = ["prompt_A", "prompt_B", "prompt_C"]
+MISTRAL_MODEL = "mistral-large-latest"
+
+# Fallback used by the notebook when a model returns nothing for the full context.
+SHORT_ENTRY_TEMPLATE = """
+name : {name}
+amenity : {amenity}
+leisure : {leisure}
+natural : {natural}
+tourism : {tourism}
+historic : {historic}
+wiki_summary_en : {wiki_summary_en}
+id : {id}
+""".strip()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    model TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    question TEXT,
+    context TEXT,
+    answer TEXT,
+    labels TEXT,
+    quality_score REAL,
+    latency_s REAL,
+    tokens_used INTEGER,
+    estimated_cost_usd REAL,
+    eval_estimated_cost_usd REAL,
+    error TEXT,
+    created_at REAL,
+    PRIMARY KEY (model, prompt, id)
+)
+"""
+COLUMNS = ["model", "prompt", "id", "question", "context", "answer", "labels", "quality_score", "latency_s",
+           "tokens_used", "estimated_cost_usd", "eval_estimated_cost_usd", "error", "created_at"]
+
+class RunStore:
+    """Append/replace one row per cell; resumability comes from the primary key."""
+
+    def __init__(self, path: str = STORE_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(SCHEMA)
+
+    def done(self) -> set:
+        return set(self.conn.execute("SELECT model, prompt, id FROM runs WHERE error IS NULL"))
+
+    def put(self, row: Dict[str, Any], replace: bool = True) -> None:
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        values = [json.dumps(row[c]) if c == "labels" and row.get(c) is not None else row.get(c) for c in COLUMNS]
+        self.conn.execute(f"{verb} INTO runs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", values)
+        self.conn.commit()
+
+    def questions(self) -> List[Dict[str, Any]]:
+        rows = self.conn.execute("SELECT id, MIN(question) FROM runs GROUP BY id ORDER BY id")
+        return [{"id": qid, "question": question} for qid, question in rows]
+
+    def frame(self):
+        import pandas as pd
+        df = pd.read_sql_query("SELECT * FROM runs WHERE error IS NULL ORDER BY model, prompt, id", self.conn)
+        df["labels"] = df["labels"].map(lambda v: json.loads(v) if v else None)
+        return df
+
+def import_cache(store: RunStore, cache_dir: str = OUTPUT_DIR) -> int:
+    """Load notebook cache files (<model>__<prompt>__<id>.json) without overwriting stored cells."""
+    count = 0
+    for path in glob.glob(os.path.join(cache_dir, "*__*__*.json")):
+        with open(path, encoding="utf-8") as f:
+            rec = json.load(f)
+        store.put({**rec, "created_at": os.path.getmtime(path)}, replace=False)
+        count += 1
+    return count
+
+def export(store: RunStore, all_runs_path: str = ALL_RUNS_PATH, agg_path: str = AGG_RESULTS_PATH):
+    df = store.frame()
+    df.to_parquet(all_runs_path, index=False)
+    summary = df.groupby(["model", "prompt"])["quality_score"].describe()
+    summary.to_csv(agg_path)
+    return summary
+
+class RateLimiter:
+    """Spaces calls at least 60/rpm seconds apart (per provider, per event loop)."""
+
+    def __init__(self, rpm: Optional[float]):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+async def mistral_llm_async(prompt: str) -> Dict[str, Any]:
+    from mistralai import Mistral  # dev dependency, only needed for mistral cells
+    client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
+    response = await asyncio.to_thread(client.chat.complete, model=MISTRAL_MODEL,
+                                       messages=[{"role": "user", "content": prompt}], temperature=0)
+    usage = getattr(response, "usage", None)
+    tokens = usage.total_tokens if usage else None
+    return {
+        "answer": response.choices[0].message.content or "",
+        "tokens_used": tokens,
+        "estimated_cost_usd": tokens / 1_000_000 * router.MODELS["mistral_llm"]["usd_per_mtok"] if tokens else None,
+    }
+
+async def generate(model: str, prompt: str) -> Dict[str, Any]:
+    import rag
+    if model == "gemini_llm":
+        return await rag.gemini_llm_async(prompt)
+    if model == "openai_llm":
+        return await rag.openai_llm_async(prompt)
+    return await mistral_llm_async(prompt)
+
+async def run_sweep(store: RunStore, questions: List[Dict[str, Any]], models: List[str], prompts: List[str],
+                    workers: int, rpm: Dict[str, float], qdrant_url: str) -> Dict[str, int]:
+    from qdrant_client import AsyncQdrantClient
+    import poi_store
+    import rag
+
+    done = store.done()
+    cells = [(m, p, q) for m in models for p in prompts for q in questions if (m, p, q["id"]) not in done]
+    print(f"{len(cells)} cells to run ({len(done)} already stored)")
+    if not cells:
+        return {"ran": 0, "failed": 0}
+
+    documents = await asyncio.to_thread(poi_store.load)
+    qdrant_client = AsyncQdrantClient(url=qdrant_url)
+    limiters = {m: RateLimiter(rpm.get(m.split("_")[0])) for m in models}
+    in_flight = asyncio.Semaphore(workers)
+    retrieval: Dict[int, asyncio.Task] = {}
+    progress = {"ran": 0, "failed": 0}
+    started = time.perf_counter()
+
+    def retrieve(question: Dict[str, Any]) -> asyncio.Task:
+        if question["id"] not in retrieval:
+            retrieval[question["id"]] = asyncio.ensure_future(
+                rag.retrieve_async(qdrant_client, question["question"], documents))
+        return retrieval[question["id"]]
+
+    async def run_cell(model: str, prompt_name: str, question: Dict[str, Any]) -> None:
+        row = {"model": model, "prompt": prompt_name, "id": question["id"], "question": question["question"]}
+        async with in_flight:
+            try:
+                docs = await retrieve(question)
+                context = rag.build_context(docs, rag.ENTRY_TEMPLATE)
+                await limiters[model].wait()
+                start = time.perf_counter()
+                answer = await generate(model, rag.build_prompt(rag.PROMPT_VARIANTS[prompt_name], question["question"], context))
+                if not answer["answer"]:
+                    context = rag.build_context(docs, SHORT_ENTRY_TEMPLATE)
+                    await limiters[model].wait()
+                    answer = await generate(model, rag.build_prompt(rag.PROMPT_VARIANTS[prompt_name], question["question"], context))
+                row["latency_s"] = time.perf_counter() - start
+                labels, judge_stats = await rag.judge_label_async(question["question"], docs, answer["answer"],
+                                                                  os.getenv("OPENAI_API_KEY"))
+                row.update({
+                    "context": context,
+                    "answer": answer["answer"],
+                    "labels": labels,
+                    "quality_score": rag.quality_score_from_labels(labels),
+                    "tokens_used": answer.get("tokens_used"),
+                    "estimated_cost_usd": answer.get("estimated_cost_usd"),
+                    "eval_estimated_cost_usd": judge_stats["estimated_cost_usd"],
+                })
+            except Exception as e:
+                row["error"] = repr(e)
+                progress["failed"] += 1
+        row["created_at"] = time.time()
+        store.put(row)
+        progress["ran"] += 1
+        if progress["ran"] % 25 == 0 or progress["ran"] == len(cells):
+            elapsed = time.perf_counter() - started
+            print(f"{progress['ran']}/{len(cells)} cells, {progress['failed']} failed, "
+                  f"{elapsed:.0f}s elapsed, ~{elapsed / progress['ran'] * (len(cells) - progress['ran']):.0f}s left")
+
+    try:
+        await asyncio.gather(*(run_cell(m, p, q) for m, p, q in cells))
+    finally:
+        await qdrant_client.close()
+    return progress
+
+def _parse_rpm(values: List[str]) -> Dict[str, float]:
+    return {name: float(rate) for name, rate in (v.split("=", 1) for v in values or [])}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=MODELS, choices=MODELS)
+    parser.add_argument("--prompts", nargs="+", default=PROMPTS, choices=PROMPTS)
+    parser.add_argument("--sample", type=int, default=100, help="questions from the ground truth")
+    parser.add_argument("--ids-from-store", action="store_true",
+                        help="evaluate the questions already in the store (e.g. after --import-cache)")
+    parser.add_argument("--workers", type=int, default=16, help="cells in flight")
+    parser.add_argument("--rpm", nargs="*", help="requests per minute per provider, e.g. gemini=300 openai=500")
+    parser.add_argument("--store", default=STORE_PATH)
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL", "http://localhost:6333"))
+    parser.add_argument("--import-cache", action="store_true", help="load the notebook's per-cell JSON cache first")
+    parser.add_argument("--export-only", action="store_true", help="only rebuild all_runs.parquet / agg_results.csv")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    store = RunStore(args.store)
+    if args.import_cache:
+        print(f"imported {import_cache(store)} cached cells")
+    if not args.export_only:
+        if args.ids_from_store:
+            questions = store.questions()
+        else:
+            # one question per POI id, as cells are keyed by id
+            questions = list({q["id"]: q for q in reversed(retrieval_eval.load_ground_truth(sample=args.sample))}.values())
+        start = time.perf_counter()
+        result = asyncio.run(run_sweep(store, questions, args.models, args.prompts, args.workers,
+                                       _parse_rpm(args.rpm), args.qdrant_url))
+        print(f"sweep: {result['ran']} cells ({result['failed']} failed) in {time.perf_counter() - start:.0f}s")
+    print(export(store))
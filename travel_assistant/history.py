@@ -0,0 +1,71 @@
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# Q&A page history of one Streamlit session. Entries and feedback are keyed by
+# conversation id and the sidebar counters are kept up to date on every change,
+# so a rerun costs O(page) instead of rescanning the whole session. Only the
+# newest HISTORY_MAX_ENTRIES answers stay in memory; older ones keep just their
+# id and are reloaded from the database (or the JSON mirrors) when their page
+# is opened.
+HISTORY_MAX_ENTRIES = int(os.getenv("TRAVEL_ASSISTANT_HISTORY_MAX_ENTRIES", "50"))
+HISTORY_PAGE_SIZE = int(os.getenv("TRAVEL_ASSISTANT_HISTORY_PAGE_SIZE", "5"))
+HISTORY_EXPANDED = int(os.getenv("TRAVEL_ASSISTANT_HISTORY_EXPANDED", "1"))
+
+class ConversationHistory:
+    def __init__(self, max_entries: int = HISTORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.ids: List[str] = []  # every conversation of the session, oldest first
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.feedback: Dict[str, Dict[str, Any]] = {}
+        self.reloaded: Dict[str, Dict[str, Any]] = {}  # entries of the archived page being viewed
+        self.counts = {"questions": 0, "feedback": 0, "positive": 0}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        self.ids.append(entry["id"])
+        self.entries[entry["id"]] = entry
+        self.counts["questions"] += 1
+        while len(self.entries) > self.max_entries:
+            old_id, _ = self.entries.popitem(last=False)
+            self.feedback.pop(old_id, None)
+
+    def add_feedback(self, feedback: Dict[str, Any]) -> None:
+        conversation_id = feedback["conversation_id"]
+        if conversation_id in self.feedback:
+            return
+        self.feedback[conversation_id] = feedback
+        self.counts["feedback"] += 1
+        self.counts["positive"] += feedback.get("feedback_type") == "positive"
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(conversation_id) or self.reloaded.get(conversation_id)
+
+    def page_count(self, page_size: int = HISTORY_PAGE_SIZE) -> int:
+        return max(1, -(-len(self.ids) // page_size))
+
+    def page_ids(self, page: int, page_size: int = HISTORY_PAGE_SIZE) -> List[str]:
+        """Conversation ids on a page, newest first (page 1 holds the latest answers)."""
+        newest_first = self.ids[::-1]
+        return newest_first[(page - 1) * page_size:page * page_size]
+
+    def missing(self, ids: List[str]) -> List[str]:
+        return [i for i in ids if self.get(i) is None]
+
+    def reload(self, ids: List[str]) -> int:
+        """Fetch archived entries (and their feedback) for the page being viewed; replaces the previous page."""
+        import persistence
+
+        entries, feedback = persistence.load_conversations(ids)
+        for old_id in self.reloaded:
+            if old_id not in self.entries:
+                self.feedback.pop(old_id, None)
+        self.reloaded = {e["id"]: e for e in entries}
+        for item in feedback:
+            self.feedback.setdefault(item["conversation_id"], item)
+        return len(self.reloaded)
+
+    def clear(self) -> None:
+        self.__init__(self.max_entries)
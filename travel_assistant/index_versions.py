@@ -0,0 +1,232 @@
+"""
+Blue/green versions of the Qdrant index behind an alias.
+
+Searches go to the alias `hybrid_search` (QDRANT_COLLECTION_ALIAS), never to a
+collection directly. A reindex builds a new collection
+
+    hybrid_search_<UTC yyyymmddHHMMSS>_<data hash>
+
+validates it (exact point count and smoke queries for a few landmarks) and
+only then moves the alias, in one atomic alias update, so replicas keep
+serving the previous version while the new one is embedded and a failed
+ingest leaves the live index untouched. The data hash covers the POI CSV, the
+collection profile and the embedding models: when it did not change,
+`ensure_index` leaves everything as it is, so restarting a node does not
+re-embed anything. The previous QDRANT_KEEP_VERSIONS versions are kept for an
+instant `rollback`; older ones are deleted.
+
+A new node can also become ready from a snapshot of a published version
+(QDRANT_SNAPSHOT_URL, a location the Qdrant server can read: http(s):// or
+file://) instead of embedding the dataset itself.
+
+    python travel_assistant/index_versions.py list
+    python travel_assistant/index_versions.py publish [--manifest data/build/manifest.json]
+    python travel_assistant/index_versions.py rollback [--to hybrid_search_...]
+    python travel_assistant/index_versions.py snapshot
+    python travel_assistant/index_versions.py restore <snapshot location>
+"""
+import os
+import re
+import time
+import hashlib
+import argparse
+from typing import Any, Dict, List, Optional
+
+from qdrant_client import models
+import ingest
+import collection_profiles
+
+ALIAS = os.getenv("QDRANT_COLLECTION_ALIAS", "hybrid_search")
+KEEP_VERSIONS = int(os.getenv("QDRANT_KEEP_VERSIONS", "2"))
+SNAPSHOT_URL = os.getenv("QDRANT_SNAPSHOT_URL")
+VALIDATION_QUERIES = 3
+VALIDATION_TOP_K = 5
+
+class IndexValidationError(RuntimeError):
+    """A freshly built version failed validation; the alias was not moved."""
+
+def data_hash(profile: Optional[str] = None) -> str:
+    digest = hashlib.sha1()
+    with open(ingest.DATA_PATH, "rb") as f:
+        digest.update(f.read())
+    profile_name = profile or os.getenv("QDRANT_COLLECTION_PROFILE", collection_profiles.DEFAULT_PROFILE)
+    digest.update(f"{profile_name}|{ingest.DENSE_MODEL}|{ingest.SPARSE_MODEL}".encode())
+    return digest.hexdigest()[:12]
+
+def version_pattern(alias: str = ALIAS) -> "re.Pattern[str]":
+    return re.compile(rf"^{re.escape(alias)}_(\d{{14}})_([0-9a-f]{{12}})$")
+
+def versions(qdrant_client, alias: str = ALIAS) -> List[str]:
+    """Versioned collections of the alias, oldest first."""
+    pattern = version_pattern(alias)
+    names = [c.name for c in qdrant_client.get_collections().collections if pattern.match(c.name)]
+    return sorted(names, key=lambda name: pattern.match(name).group(1))
+
+def version_hash(collection_name: str, alias: str = ALIAS) -> Optional[str]:
+    match = version_pattern(alias).match(collection_name)
+    return match.group(2) if match else None
+
+def live_collection(qdrant_client, alias: str = ALIAS) -> Optional[str]:
+    for item in qdrant_client.get_aliases().aliases:
+        if item.alias_name == alias:
+            return item.collection_name
+    return None
+
+def validate(qdrant_client, collection_name: str, documents: List[Dict[str, Any]], profile: Optional[str] = None) -> None:
+    """Exact point count plus name queries for a few POIs with a Wikipedia summary; raises IndexValidationError."""
+    import rag
+
+    count = qdrant_client.count(collection_name=collection_name, exact=True).count
+    if count != len(documents):
+        raise IndexValidationError(f"{collection_name}: {count} points, expected {len(documents)}")
+    landmarks = [d for d in documents if str(d.get('wiki_summary_en', 'no information')) != 'no information']
+    for doc in landmarks[:VALIDATION_QUERIES]:
+        results = rag.rrf_search(qdrant_client, doc['name'], limit=VALIDATION_TOP_K,
+                                 collection_name=collection_name, profile=profile)
+        if doc['id'] not in [point.id for point in results]:
+            raise IndexValidationError(f"{collection_name}: smoke query {doc['name']!r} did not return POI {doc['id']}")
+
+def switch_alias(qdrant_client, collection_name: str, alias: str = ALIAS) -> None:
+    """Point the alias at `collection_name` in a single alias update."""
+    operations = []
+    if live_collection(qdrant_client, alias) is not None:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    elif qdrant_client.collection_exists(collection_name=alias):
+        # one-off migration from the unversioned collection: it has to go before its name can become the alias
+        print(f"{alias}: dropping the unversioned collection")
+        qdrant_client.delete_collection(alias)
+    operations.append(models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias)))
+    qdrant_client.update_collection_aliases(change_aliases_operations=operations)
+    print(f"{alias} -> {collection_name}")
+
+def prune(qdrant_client, alias: str = ALIAS, keep: int = KEEP_VERSIONS) -> List[str]:
+    """Delete all but the live version and the `keep` newest other versions."""
+    live = live_collection(qdrant_client, alias)
+    others = [name for name in versions(qdrant_client, alias) if name != live]
+    stale = others[:max(len(others) - keep, 0)]
+    for name in stale:
+        qdrant_client.delete_collection(name)
+        print(f"deleted {name}")
+    return stale
+
+def publish(qdrant_client, alias: str = ALIAS, profile: Optional[str] = None, manifest_path: Optional[str] = None,
+            keep: int = KEEP_VERSIONS) -> str:
+    """
+    Build, validate and switch to a version for the current data. An existing
+    version with the same data hash is reused; with a dataset_build.py
+    manifest only the changed POIs are embedded, the rest is copied from the
+    live version.
+    """
+    digest = data_hash(profile)
+    documents = ingest.load_documents()
+    live = live_collection(qdrant_client, alias)
+    candidates = [name for name in versions(qdrant_client, alias) if version_hash(name, alias) == digest]
+    if candidates:
+        collection_name = candidates[-1]
+        if collection_name == live:
+            print(f"{alias}: {live} is up to date")
+            return live
+        print(f"{alias}: reusing {collection_name}")
+    else:
+        collection_name = f"{alias}_{time.strftime('%Y%m%d%H%M%S', time.gmtime())}_{digest}"
+        print(f"{alias}: building {collection_name}")
+        if manifest_path and live is not None:
+            ingest.update_data(qdrant_client, manifest_path, collection_name, profile, source_collection=live)
+        else:
+            ingest.create_collection(qdrant_client, collection_name, profile)
+            qdrant_client.upsert(collection_name=collection_name, points=[ingest.build_point(doc) for doc in documents])
+    try:
+        validate(qdrant_client, collection_name, documents, profile)
+    except IndexValidationError:
+        if not candidates:
+            qdrant_client.delete_collection(collection_name)
+        raise
+    switch_alias(qdrant_client, collection_name, alias)
+    prune(qdrant_client, alias, keep)
+    return collection_name
+
+def rollback(qdrant_client, alias: str = ALIAS, to: Optional[str] = None) -> str:
+    """
+    Move the alias back to `to` or to the version before the live one. The POI
+    CSV is not rolled back: ids missing from it are dropped from the search results.
+    """
+    live = live_collection(qdrant_client, alias)
+    available = versions(qdrant_client, alias)
+    if to is None:
+        older = available[:available.index(live)] if live in available else available
+        if not older:
+            raise ValueError(f"{alias}: no version older than {live} to roll back to")
+        to = older[-1]
+    elif to not in available:
+        raise ValueError(f"{alias}: unknown version {to}. Available: {available}")
+    switch_alias(qdrant_client, to, alias)
+    return to
+
+def snapshot(qdrant_client, alias: str = ALIAS) -> str:
+    """Snapshot the live version; returns the snapshot name (download it from /collections/<name>/snapshots/)."""
+    live = live_collection(qdrant_client, alias)
+    if live is None:
+        raise ValueError(f"{alias}: no live version to snapshot")
+    return qdrant_client.create_snapshot(collection_name=live, wait=True).name
+
+def snapshot_collection(location: str) -> str:
+    # Qdrant names snapshots <collection>-<peer id>-<timestamp>.snapshot
+    return os.path.basename(location).split("-")[0]
+
+def restore(qdrant_client, location: str, alias: str = ALIAS, profile: Optional[str] = None) -> str:
+    """Recover a published version from a snapshot, validate it and switch the alias to it."""
+    collection_name = snapshot_collection(location)
+    if version_hash(collection_name, alias) is None:
+        raise ValueError(f"{location} is not a snapshot of a {alias} version")
+    if not qdrant_client.collection_exists(collection_name=collection_name):
+        qdrant_client.recover_snapshot(collection_name=collection_name, location=location, wait=True)
+    validate(qdrant_client, collection_name, ingest.load_documents(), profile)
+    switch_alias(qdrant_client, collection_name, alias)
+    return collection_name
+
+def ensure_index(qdrant_client, alias: str = ALIAS, profile: Optional[str] = None,
+                 snapshot_location: Optional[str] = SNAPSHOT_URL) -> str:
+    """
+    Start-up entry point: nothing to do when the live version matches the
+    data; otherwise restore it from a matching snapshot, or build it.
+    """
+    digest = data_hash(profile)
+    live = live_collection(qdrant_client, alias)
+    if live is not None and version_hash(live, alias) == digest:
+        return live
+    if snapshot_location and version_hash(snapshot_collection(snapshot_location), alias) == digest:
+        try:
+            return restore(qdrant_client, snapshot_location, alias, profile)
+        except Exception as e:
+            print(f"{alias}: restoring {snapshot_location} failed ({e!r}), building instead")
+    return publish(qdrant_client, alias, profile)
+
+if __name__ == "__main__":
+    from qdrant_client import QdrantClient
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["list", "publish", "rollback", "snapshot", "restore"])
+    parser.add_argument("location", nargs="?", help="snapshot location for restore")
+    parser.add_argument("--alias", default=ALIAS)
+    parser.add_argument("--manifest", help="publish: embed only the POIs changed in this dataset_build.py manifest")
+    parser.add_argument("--to", help="rollback: version to switch to (default: the previous one)")
+    parser.add_argument("--keep", type=int, default=KEEP_VERSIONS)
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL", "http://localhost:6333"))
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.qdrant_url)
+    if args.command == "list":
+        live = live_collection(client, args.alias)
+        for name in versions(client, args.alias):
+            print(f"{'*' if name == live else ' '} {name}")
+    elif args.command == "publish":
+        publish(client, args.alias, manifest_path=args.manifest, keep=args.keep)
+    elif args.command == "rollback":
+        rollback(client, args.alias, args.to)
+    elif args.command == "snapshot":
+        print(snapshot(client, args.alias))
+    elif args.command == "restore":
+        if not args.location:
+            parser.error("restore needs a snapshot location")
+        restore(client, args.location, args.alias)
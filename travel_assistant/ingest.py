@@ -1,59 +1,186 @@
 import os
+import json
 import pandas as pd
 from qdrant_client import models
+import collection_profiles
+import embedding_models
 
-def load_data(qdrant_client):
-        
-    base_dir = os.path.dirname(os.path.abspath(__file__))  # folder where ingest.py is
-    data_path = os.path.join(base_dir, "data", "krakow_pois_selected.csv")
-    
-    poi_data = pd.read_csv(data_path)
-    documents = poi_data.to_dict(orient='records')
+# Categorical POI attributes stored as keyword payload fields so retrieval can
+# pre-filter server-side (see rag.extract_query_constraints).
+CATEGORICAL_FIELDS = [
+    'amenity',
+    'tourism',
+    'cuisine',
+    'wheelchair',
+    'pets_allowed',
+    'outdoor_seating',
+    'takeaway',
+    'museum',
+    'historic',
+]
+
+MISSING_VALUES = {'', 'no information', 'nan'}
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "krakow_pois_selected.csv")
+DENSE_MODEL = embedding_models.get_model()["model"]
+SPARSE_MODEL = embedding_models.SPARSE_MODEL
 
-    
+def keyword_values(value) -> list[str]:
+    """Normalize a raw CSV cell into a list of keywords (OSM uses ';' for multi-values)."""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return []
+    values = []
+    for part in str(value).split(';'):
+        part = part.strip().lower()
+        if part and part not in MISSING_VALUES:
+            values.append(part)
+    return values
+
+def build_payload(doc: dict) -> dict:
+    payload = {
+        "name": doc['name'],
+        "wiki_summary_en": doc['wiki_summary_en'],
+        'id': doc['id'],
+    }
+    for field in CATEGORICAL_FIELDS:
+        payload[field] = keyword_values(doc.get(field))
+    return payload
 
-    if qdrant_client.collection_exists(collection_name="hybrid_search"):
-        qdrant_client.delete_collection("hybrid_search")
+def point_text(doc: dict) -> str:
+    """The text embedded by both the dense and the BM25 vector."""
+    return doc['name'] + ' ' + doc['amenity'] + ' ' + doc['leisure'] + ' ' + doc['natural'] + ' ' + doc['tourism'] + ' ' + doc['historic'] + ' ' + doc['wiki_summary_en']
 
-    
+def build_point(doc: dict, embedding_model: str | None = None) -> models.PointStruct:
+    text = point_text(doc)
+    dense = embedding_models.get_model(embedding_model)
+    return models.PointStruct(
+        id=doc['id'],
+        vector={
+            dense["vector_name"]: models.Document(
+                text=text,
+                model=dense["model"],
+            ),
+            embedding_models.SPARSE_VECTOR_NAME: models.Document(
+                text=text,
+                model=SPARSE_MODEL,
+            ),
+        },
+        payload=build_payload(doc)
+    )
+
+def load_documents() -> list[dict]:
+    poi_data = pd.read_csv(DATA_PATH)
+    return poi_data.to_dict(orient='records')
+
+def create_collection(qdrant_client, collection_name: str, profile: str | None = None,
+                      embedding_model: str | None = None) -> None:
+    collection_profile = collection_profiles.get_profile(profile)
+    dense = embedding_models.get_model(embedding_model)
     qdrant_client.create_collection(
-        collection_name="hybrid_search",
+        collection_name=collection_name,
         vectors_config={
-            # Named dense vector for jinaai/jina-embeddings-v2-small-en
-            "jina-small": models.VectorParams(
-                size=512,
-                distance=models.Distance.COSINE,
-            ),
+            # Named dense vector of the registry model (embedding_models.py)
+            dense["vector_name"]: collection_profiles.dense_vector_params(collection_profile, dense["dim"]),
         },
         sparse_vectors_config={
-            "bm25": models.SparseVectorParams(
+            embedding_models.SPARSE_VECTOR_NAME: models.SparseVectorParams(
                 modifier=models.Modifier.IDF,
             )
-        }
+        },
+        hnsw_config=collection_profiles.hnsw_config(collection_profile),
+        quantization_config=collection_profiles.quantization_config(collection_profile),
 )
 
+    for field in CATEGORICAL_FIELDS:
+        qdrant_client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field,
+            field_schema=models.PayloadSchemaType.KEYWORD,
+        )
+
+def load_data(qdrant_client, collection_name: str = "hybrid_search", profile: str | None = None,
+              embedding_model: str | None = None):
+    """
+    (Re)build `collection_name` in place. The served index is versioned behind
+    an alias instead (index_versions.publish); this is for scratch collections
+    such as the profile and embedding model benchmarks.
+    """
+    documents = load_documents()
+
+    if qdrant_client.collection_exists(collection_name=collection_name):
+        qdrant_client.delete_collection(collection_name)
+
+    create_collection(qdrant_client, collection_name, profile, embedding_model)
+
     qdrant_client.upsert(
-collection_name="hybrid_search",
-points=[
-    models.PointStruct(
-        id=doc['id'],
-        vector={
-            "jina-small": models.Document(
-                text=doc['name'] + ' ' + doc['amenity'] + ' ' + doc['leisure'] + ' ' + doc['natural'] + ' ' + doc['tourism'] + ' ' + doc['historic'] + ' ' + doc['wiki_summary_en'],
-                model="jinaai/jina-embeddings-v2-small-en",
-            ),
-            "bm25": models.Document(
-                text=doc['name'] + ' ' + doc['amenity'] + ' ' + doc['leisure'] + ' ' + doc['natural'] + ' ' + doc['tourism'] + ' ' + doc['historic'] + ' ' + doc['wiki_summary_en'],
-                model="Qdrant/bm25",
-            ),
-        },
-        payload={
-            "name": doc['name'],
-        "wiki_summary_en": doc['wiki_summary_en'],
-        'id'    : doc['id'],
-        }
+        collection_name=collection_name,
+        points=[build_point(doc, embedding_model) for doc in documents],
     )
-    for doc in documents
-]
-)
-    return documents,qdrant_client
\ No newline at end of file
+    return documents,qdrant_client
+
+def copy_points(qdrant_client, source: str, target: str, skip_ids: set, batch_size: int = 256) -> int:
+    """Copy points with their stored vectors (no re-embedding) from one collection to another."""
+    copied = 0
+    offset = None
+    while True:
+        records, offset = qdrant_client.scroll(
+            collection_name=source, limit=batch_size, offset=offset, with_payload=True, with_vectors=True,
+        )
+        points = [models.PointStruct(id=r.id, vector=r.vector, payload=r.payload) for r in records if r.id not in skip_ids]
+        if points:
+            qdrant_client.upsert(collection_name=target, points=points)
+            copied += len(points)
+        if offset is None:
+            return copied
+
+def update_data(qdrant_client, manifest_path: str, collection_name: str = "hybrid_search", profile: str | None = None,
+                source_collection: str | None = None):
+    """
+    Apply a dataset_build.py manifest: upsert added / changed POIs and delete
+    removed ones instead of re-embedding everything (full load when there is
+    nothing to start from). With `source_collection` the result is a new
+    collection: unchanged points are copied from the source with their vectors.
+    """
+    if source_collection is None and not qdrant_client.collection_exists(collection_name=collection_name):
+        return load_data(qdrant_client, collection_name, profile)
+
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    documents = load_documents()
+    upsert_ids = set(manifest["added"]) | set(manifest["changed"])
+    if source_collection is not None:
+        create_collection(qdrant_client, collection_name, profile)
+        copied = copy_points(qdrant_client, source_collection, collection_name, upsert_ids | set(manifest["removed"]))
+        print(f"{collection_name}: copied {copied} points from {source_collection}")
+    points = [build_point(doc) for doc in documents if doc['id'] in upsert_ids]
+    if points:
+        qdrant_client.upsert(collection_name=collection_name, points=points)
+    if manifest["removed"] and source_collection is None:
+        qdrant_client.delete(
+            collection_name=collection_name,
+            points_selector=models.PointIdsList(points=manifest["removed"]),
+        )
+    print(f"{collection_name}: upserted {len(points)}, deleted {len(manifest['removed'])} points")
+    return documents,qdrant_client
+
+if __name__ == "__main__":
+    import argparse
+    from qdrant_client import QdrantClient
+    import index_versions
+    import poi_graph
+
+    parser = argparse.ArgumentParser(description="(Re)index the POI CSV into Qdrant.")
+    parser.add_argument("--manifest", help="apply only the changes listed by dataset_build.py (data/build/manifest.json)")
+    parser.add_argument("--collection", help="rebuild this collection in place instead of publishing a new version behind the alias")
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL", "http://localhost:6333"))
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.qdrant_url)
+    if args.collection is None:
+        index_versions.publish(client, manifest_path=args.manifest)
+        poi_graph.build(client)
+    elif args.manifest:
+        update_data(client, args.manifest, args.collection)
+    else:
+        documents, _ = load_data(client, args.collection)
+        print(f"{args.collection}: indexed {len(documents)} points")
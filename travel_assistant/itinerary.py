@@ -0,0 +1,444 @@
+"""
+Walking itineraries over a precomputed POI-to-POI travel-time matrix.
+
+An offline stage builds the pedestrian street network once with osmnx (its
+Overpass responses are cached in notebooks/cache, next to dataset_build's, so
+a rebuild does not hit the network), snaps every POI centroid to the nearest
+street node and runs Dijkstra from each of them. The result is a compact
+matrix of walking seconds (uint16, data/walk_times.npy plus
+data/walk_times.json with the POI ids) that the app memory-maps: a tour only
+reads the rows of its stops. `--source estimate` (and any stop missing from
+the matrix) uses the great-circle distance times DETOUR_FACTOR instead.
+
+plan_tour orders 5-15 stops for one day: a time-aware nearest-neighbour tour
+(next = the stop that can be started earliest) from every possible first stop,
+improved with 2-opt, where a tour's cost is (stops that do not fit, end of the
+day, minutes walked). Each stop is visited inside its `opening_hours` for that
+date (a subset of the OSM syntax: weekdays, months, times, "off", 24/7; POIs
+with missing or unparsed hours count as open) for its `visiting_time`, or a
+default per kind of place. rag answers "plan my day" questions from the plan
+(format_plan) instead of the raw geometry of the stops.
+
+    python travel_assistant/itinerary.py build [--source estimate]
+    python travel_assistant/itinerary.py plan "Wawel Castle" "Wierzynek" "Planty" --start "2026-10-19 09:00"
+    python travel_assistant/itinerary.py benchmark [--stops 5 10 15 --runs 200]
+"""
+import os
+import re
+import json
+import math
+import time
+import random
+import argparse
+import datetime
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import ingest
+import poi_graph
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MATRIX_PATH = os.getenv("ITINERARY_MATRIX_PATH", os.path.join(BASE_DIR, "data", "walk_times.npy"))
+OSM_CACHE_DIR = os.path.join(BASE_DIR, "..", "notebooks", "cache")
+WALK_SPEED_KMH = float(os.getenv("ITINERARY_WALK_SPEED_KMH", "4.5"))
+DAY_START = os.getenv("ITINERARY_DAY_START", "09:00")
+DAY_END = os.getenv("ITINERARY_DAY_END", "20:00")
+# street distance / great-circle distance, for the estimate
+DETOUR_FACTOR = 1.3
+BBOX_MARGIN_DEG = 0.01
+DIJKSTRA_ROWS = 64
+UNREACHABLE = np.iinfo(np.uint16).max
+MAX_TWO_OPT_PASSES = 10
+
+# Minutes spent at a stop without a `visiting_time`: the first matching
+# (payload field, keyword) wins; None matches any value of the field.
+DEFAULT_VISIT_MINUTES = 45
+VISIT_MINUTES = [
+    ("zoo", None, 120),
+    ("museum", None, 90),
+    ("tourism", "museum", 90),
+    ("tourism", "gallery", 60),
+    ("tourism", "zoo", 120),
+    ("leisure", "park", 60),
+    ("leisure", "garden", 45),
+    ("amenity", "restaurant", 60),
+    ("amenity", "cafe", 30),
+    ("amenity", "place_of_worship", 30),
+    ("historic", "memorial", 15),
+    ("tourism", "viewpoint", 15),
+]
+
+WEEKDAYS = ["Mo", "Tu", "We", "Th", "Fr", "Sa", "Su"]
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+_DAY = r"(?:Mo|Tu|We|Th|Fr|Sa|Su|PH)"
+_DATE = rf"(?:{'|'.join(MONTHS)})(?:\s+\d{{1,2}}(?!\d|:\d))?"
+_SPAN = r"\d{1,2}:\d\d\s*-\s*\d{1,2}:\d\d"
+RULE_PATTERN = re.compile(
+    rf"(?:(?P<months>{_DATE}(?:\s*-\s*{_DATE})?)\s*:?\s*)?"
+    rf"(?:(?P<days>{_DAY}(?:\s*-\s*{_DAY})?(?:\s*,\s*{_DAY}(?:\s*-\s*{_DAY})?)*)\s*:?\s+)?"
+    rf"(?P<times>off|closed|{_SPAN}(?:\s*,\s*{_SPAN})*)"
+)
+
+# --- opening hours and visit length ------------------------------------------------
+
+def _minutes(clock: str) -> int:
+    hours, minutes = clock.split(":")
+    return int(hours) * 60 + int(minutes)
+
+def _month_day(text: str, end: bool) -> Tuple[int, int]:
+    parts = text.split()
+    return MONTHS.index(parts[0]) + 1, int(parts[1]) if len(parts) > 1 else (31 if end else 1)
+
+def _in_months(months: str, date: datetime.date) -> bool:
+    first, _, last = (part.strip() for part in months.partition("-"))
+    start, end = _month_day(first, False), _month_day(last or first, True)
+    today = (date.month, date.day)
+    return start <= today <= end if start <= end else (today >= start or today <= end)
+
+def _on_day(days: str, date: datetime.date) -> bool:
+    for part in re.split(r"\s*,\s*", days):
+        first, _, last = (p.strip() for p in part.partition("-"))
+        if "PH" in (first, last):
+            continue
+        i, j = WEEKDAYS.index(first), WEEKDAYS.index(last or first)
+        span = range(i, j + 1) if i <= j else [*range(i, 7), *range(0, j + 1)]
+        if date.weekday() in span:
+            return True
+    return False
+
+def opening_windows(spec: Any, date: datetime.date) -> Optional[List[Tuple[int, int]]]:
+    """
+    Opening times on `date` as (start, end) minutes since midnight ([] when
+    closed), or None when the hours are missing or not understood. Later rules
+    override earlier ones, as in OSM; public-holiday rules are ignored.
+    """
+    if not ingest.keyword_values(spec):
+        return None
+    spec = str(spec).strip()
+    if spec == "24/7":
+        return [(0, 24 * 60)]
+    windows = None
+    for chunk in spec.split(";"):
+        chunk, position = chunk.strip(), 0
+        for match in RULE_PATTERN.finditer(chunk):
+            if chunk[position:match.start()].strip(" ,"):
+                return None
+            position = match.end()
+            months, days, times = match.group("months"), match.group("days"), match.group("times")
+            if days and re.fullmatch(r"PH", days):
+                continue
+            if (months and not _in_months(months, date)) or (days and not _on_day(days, date)):
+                continue
+            windows = []
+            for start, end in re.findall(r"(\d{1,2}:\d\d)\s*-\s*(\d{1,2}:\d\d)", times):
+                start, end = _minutes(start), _minutes(end)
+                windows.append((start, end if end > start else end + 24 * 60))
+        if chunk[position:].strip(" ,"):
+            return None
+    return windows if windows is not None else []
+
+def visit_minutes(doc: Dict[str, Any]) -> int:
+    """`visiting_time` ("1h", "90 min", "1.5 h") or the default for the kind of place."""
+    text = " ".join(ingest.keyword_values(doc.get("visiting_time")))
+    parts = re.findall(r"(\d+(?:\.\d+)?)\s*(h|hours?|min|minutes?)\b", text)
+    if parts:
+        return round(sum(float(n) * (60 if unit.startswith("h") else 1) for n, unit in parts))
+    for field, keyword, minutes in VISIT_MINUTES:
+        values = ingest.keyword_values(doc.get(field))
+        if values and (keyword is None or keyword in values):
+            return minutes
+    return DEFAULT_VISIT_MINUTES
+
+def clock(minutes: float) -> str:
+    minutes = round(minutes)
+    return f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"
+
+# --- travel-time matrix -------------------------------------------------------------
+
+def estimate_seconds(coords: np.ndarray, speed_kmh: float = WALK_SPEED_KMH) -> np.ndarray:
+    """Walking seconds between (lat, lon) radians, from the great-circle distance."""
+    km = np.concatenate([poi_graph.distances_km(coords[start:start + poi_graph.BLOCK_ROWS], coords)
+                         for start in range(0, len(coords), poi_graph.BLOCK_ROWS)]) if len(coords) else np.zeros((0, 0))
+    return km * DETOUR_FACTOR / speed_kmh * 3600
+
+def street_seconds(coords: np.ndarray, speed_kmh: float = WALK_SPEED_KMH) -> np.ndarray:
+    """Walking seconds over the OSM pedestrian network; np.inf where no path exists."""
+    import osmnx
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import dijkstra
+
+    osmnx.settings.cache_folder = OSM_CACHE_DIR
+    osmnx.settings.use_cache = True
+    lat, lon = np.degrees(coords[:, 0]), np.degrees(coords[:, 1])
+    bbox = (lon.min() - BBOX_MARGIN_DEG, lat.min() - BBOX_MARGIN_DEG,
+            lon.max() + BBOX_MARGIN_DEG, lat.max() + BBOX_MARGIN_DEG)
+    graph = osmnx.graph_from_bbox(bbox, network_type="walk")
+    nodes = {node: i for i, node in enumerate(graph.nodes)}
+    snapped, snap_m = osmnx.distance.nearest_nodes(graph, lon, lat, return_dist=True)
+    # parallel edges: keep the shortest (tocsr would sum them)
+    edges: Dict[Tuple[int, int], float] = {}
+    for u, v, length in graph.edges(data="length"):
+        key = (nodes[u], nodes[v])
+        edges[key] = min(length, edges.get(key, math.inf))
+    (rows, columns), lengths = zip(*edges), list(edges.values())
+    adjacency = coo_matrix((lengths, (rows, columns)), shape=(len(nodes), len(nodes))).tocsr()
+    sources = np.array([nodes[node] for node in snapped])
+    metres = np.empty((len(sources), len(sources)))
+    for start in range(0, len(sources), DIJKSTRA_ROWS):
+        block = dijkstra(adjacency, directed=False, indices=sources[start:start + DIJKSTRA_ROWS])
+        metres[start:start + DIJKSTRA_ROWS] = block[:, sources]
+    # plus the walk from each POI centroid to its street node and back out
+    metres += np.asarray(snap_m)[:, None] + np.asarray(snap_m)[None, :]
+    np.fill_diagonal(metres, 0)
+    return metres / 1000 / speed_kmh * 3600
+
+def build(source: str = "osm", path: str = MATRIX_PATH, speed_kmh: float = WALK_SPEED_KMH) -> "WalkTimes":
+    """Compute the matrix for every POI of the dataset and save it next to its metadata."""
+    started = time.perf_counter()
+    documents = ingest.load_documents()
+    coords = poi_graph.coordinates(documents)
+    seconds = street_seconds(coords, speed_kmh) if source == "osm" else estimate_seconds(coords, speed_kmh)
+    matrix = np.where(np.isfinite(seconds), np.minimum(np.round(seconds), UNREACHABLE - 1), UNREACHABLE).astype(np.uint16)
+    meta = {"ids": [doc["id"] for doc in documents], "source": source, "speed_kmh": speed_kmh,
+            "unreachable": int((matrix == UNREACHABLE).sum()),
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+    tmp_path = f"{path}.tmp-{os.getpid()}.npy"
+    np.save(tmp_path, matrix)
+    with open(f"{tmp_path}.json", "w") as f:
+        json.dump(meta, f)
+    os.replace(f"{tmp_path}.json", _meta_path(path))
+    os.replace(tmp_path, path)
+    print(f"Walk times: {len(documents)} POIs from {source}, {meta['unreachable']} unreachable pairs, "
+          f"{matrix.nbytes / 1024:.0f} KiB in {time.perf_counter() - started:.1f} s")
+    _cache.pop(path, None)
+    return load(path)
+
+def _meta_path(path: str) -> str:
+    return f"{os.path.splitext(path)[0]}.json"
+
+class WalkTimes:
+    """The memory-mapped matrix; lookups read only the rows of the requested stops."""
+
+    def __init__(self, matrix: np.ndarray, meta: Dict[str, Any]):
+        self.matrix = matrix
+        self.meta = meta
+        self._rows = {int(poi_id): row for row, poi_id in enumerate(meta["ids"])}
+
+    def __contains__(self, poi_id: Any) -> bool:
+        return poi_id in self._rows
+
+    def minutes(self, poi_ids: Sequence[Any]) -> Optional[np.ndarray]:
+        """Walking minutes between the stops, None when one of them is not in the matrix."""
+        rows = [self._rows.get(poi_id) for poi_id in poi_ids]
+        if None in rows:
+            return None
+        seconds = self.matrix[np.ix_(rows, rows)].astype(np.float64)
+        seconds[seconds == UNREACHABLE] = np.nan
+        return seconds / 60
+
+_cache: Dict[str, Optional[WalkTimes]] = {}
+_lock = threading.Lock()
+
+def load(path: str = MATRIX_PATH) -> Optional[WalkTimes]:
+    """The saved matrix (one mapping per process), None when it has not been built."""
+    with _lock:
+        if path not in _cache:
+            if not os.path.exists(path):
+                return None
+            with open(_meta_path(path)) as f:
+                _cache[path] = WalkTimes(np.load(path, mmap_mode="r"), json.load(f))
+        return _cache[path]
+
+def travel_minutes(docs: List[Dict[str, Any]], walk_times: Optional[WalkTimes] = None) -> Tuple[np.ndarray, str]:
+    """(walking minutes between the stops, "osm" | "estimate"); pairs the matrix cannot route are estimated."""
+    walk_times = walk_times if walk_times is not None else load()
+    estimate = estimate_seconds(poi_graph.coordinates(docs)) / 60
+    minutes = walk_times.minutes([doc["id"] for doc in docs]) if walk_times is not None else None
+    if minutes is None:
+        return estimate, "estimate"
+    return np.where(np.isnan(minutes), estimate, minutes), walk_times.meta["source"]
+
+# --- tours ------------------------------------------------------------------------
+
+def _earliest_start(windows: Optional[List[Tuple[int, int]]], arrive: float, visit: int) -> Optional[float]:
+    if windows is None:
+        return arrive
+    for start, end in sorted(windows):
+        begin = max(arrive, start)
+        if begin + visit <= end:
+            return begin
+    return None
+
+def _schedule(order: Sequence[int], travel: List[List[float]], visits: List[int], windows: List[Optional[List[Tuple[int, int]]]],
+              day_start: float, day_end: float) -> Dict[str, Any]:
+    """Walk the stops in order from day_start; stops that cannot be fitted in are skipped."""
+    now, previous, walked, stops, skipped = day_start, None, 0.0, [], []
+    for i in order:
+        walk = travel[previous][i] if previous is not None else 0.0
+        begin = _earliest_start(windows[i], now + walk, visits[i])
+        if begin is None or begin + visits[i] > day_end:
+            skipped.append(i)
+            continue
+        stops.append({"index": i, "walk_min": walk, "arrive": now + walk, "start": begin, "leave": begin + visits[i]})
+        walked += walk
+        now, previous = begin + visits[i], i
+    return {"stops": stops, "skipped": skipped, "walk_min": walked, "end": now,
+            "cost": (len(skipped), now, walked)}
+
+def _nearest_neighbour(first: int, travel: List[List[float]], visits: List[int],
+                       windows: List[Optional[List[Tuple[int, int]]]], day_start: float, day_end: float) -> List[int]:
+    """From `first`, repeatedly go to the stop that can be started earliest (ties: the shorter walk)."""
+    order, remaining = [first], set(range(len(visits))) - {first}
+    begin = _earliest_start(windows[first], day_start, visits[first])
+    now, previous = (day_start, None) if begin is None else (begin + visits[first], first)
+    while remaining:
+        def key(i):
+            walk = travel[previous][i] if previous is not None else 0.0
+            begin = _earliest_start(windows[i], now + walk, visits[i])
+            if begin is None or begin + visits[i] > day_end:
+                return (1, 0.0, 0.0, i)
+            return (0, begin, walk, i)
+        skipped, begin, _, best = min(map(key, remaining))
+        order.append(best)
+        remaining.remove(best)
+        if not skipped:
+            now, previous = begin + visits[best], best
+    return order
+
+def _two_opt(order: List[int], schedule, fixed_first: bool) -> List[int]:
+    best, best_cost = order, schedule(order)["cost"]
+    for _ in range(MAX_TWO_OPT_PASSES):
+        improved = False
+        for i in range(1 if fixed_first else 0, len(best) - 1):
+            for j in range(i + 1, len(best)):
+                candidate = best[:i] + best[i:j + 1][::-1] + best[j + 1:]
+                cost = schedule(candidate)["cost"]
+                if cost < best_cost:
+                    best, best_cost, improved = candidate, cost, True
+        if not improved:
+            break
+    return best
+
+def plan_tour(docs: List[Dict[str, Any]], start: Optional[datetime.datetime] = None, first: Optional[Any] = None,
+              day_end: str = DAY_END, walk_times: Optional[WalkTimes] = None) -> Dict[str, Any]:
+    """
+    A one-day walking tour of the POI records `docs` starting at `start`
+    (default: DAY_START today), optionally from the POI id `first`.
+    """
+    if start is None:
+        start = datetime.datetime.combine(datetime.date.today(), datetime.time.fromisoformat(DAY_START))
+    travel, source = travel_minutes(docs, walk_times)
+    visits = [visit_minutes(doc) for doc in docs]
+    windows = [opening_windows(doc.get("opening_hours"), start.date()) for doc in docs]
+    day_start = start.hour * 60 + start.minute
+    day_end_min = max(_minutes(day_end), day_start)
+    travel_rows = travel.tolist()
+    schedule = lambda order: _schedule(order, travel_rows, visits, windows, day_start, day_end_min)
+
+    firsts = [i for i, doc in enumerate(docs) if doc["id"] == first] or list(range(len(docs)))
+    tours = [_nearest_neighbour(i, travel_rows, visits, windows, day_start, day_end_min) for i in firsts] if docs else [[]]
+    order = _two_opt(min(tours, key=lambda tour: schedule(tour)["cost"]), schedule, fixed_first=len(firsts) == 1)
+    result = schedule(order)
+    for stop in result["stops"]:
+        i = stop.pop("index")
+        stop.update(id=docs[i]["id"], name=str(docs[i]["name"]).split(";")[0], visit_min=visits[i], hours=_hours_note(windows[i]))
+    return {"date": start.date().isoformat(), "weekday": start.strftime("%A"), "source": source,
+            "stops": result["stops"], "walk_min": result["walk_min"], "start": day_start, "end": result["end"],
+            "skipped": [{"id": docs[i]["id"], "name": str(docs[i]["name"]).split(";")[0], "hours": _hours_note(windows[i])}
+                        for i in result["skipped"]]}
+
+def _hours_note(windows: Optional[List[Tuple[int, int]]]) -> str:
+    if windows is None:
+        return "opening hours unknown"
+    if not windows:
+        return "closed that day"
+    return "open " + ", ".join(f"{clock(start)}-{clock(end)}" for start, end in windows)
+
+def format_plan(plan: Dict[str, Any]) -> str:
+    """The plan as prompt text: one line per stop with times, walks and opening hours."""
+    walks = "street network" if plan["source"] == "osm" else "straight-line estimate"
+    lines = [f"Walking plan for {plan['weekday']} {plan['date']}, starting {clock(plan['start'])} "
+             f"(walking times from the {walks}):"]
+    for n, stop in enumerate(plan["stops"], start=1):
+        walk = f"walk {stop['walk_min']:.0f} min, " if n > 1 else ""
+        wait = f", wait {stop['start'] - stop['arrive']:.0f} min for opening" if stop["start"] - stop["arrive"] >= 1 else ""
+        lines.append(f"{n}. {clock(stop['start'])}-{clock(stop['leave'])} {stop['name']} "
+                     f"({walk}visit {stop['visit_min']} min{wait}; {stop['hours']})")
+    for stop in plan["skipped"]:
+        lines.append(f"Does not fit in the day: {stop['name']} ({stop['hours']})")
+    lines.append(f"{len(plan['stops'])} stops, {plan['walk_min']:.0f} min walking in total, "
+                 f"done at {clock(plan['end'])}.")
+    return "\n".join(lines)
+
+WEEKDAY_NAMES = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+def parse_start(text: str, now: Optional[datetime.datetime] = None) -> datetime.datetime:
+    """Start of the tour named in a question ("on Saturday", "tomorrow", "from 10am"), else DAY_START today."""
+    now = now or datetime.datetime.now()
+    lowered = text.lower()
+    date = now.date()
+    day = re.search(r"\b(" + "|".join(WEEKDAY_NAMES) + r")\b", lowered)
+    if day:
+        date += datetime.timedelta(days=(WEEKDAY_NAMES.index(day.group(1)) - date.weekday()) % 7)
+    elif re.search(r"\btomorrow\b", lowered):
+        date += datetime.timedelta(days=1)
+    start = datetime.time.fromisoformat(DAY_START)
+    match = re.search(r"\b(?:at|from|starting|start)\s+(\d{1,2})(?::(\d\d))?\s*(am|pm)?\b", lowered)
+    if match and (match.group(2) or match.group(3)):
+        hour = int(match.group(1)) % 12 + (12 if match.group(3) == "pm" else 0) if match.group(3) else int(match.group(1))
+        if hour < 24:
+            start = datetime.time(hour, int(match.group(2) or 0))
+    return datetime.datetime.combine(date, start)
+
+def benchmark(sizes: Sequence[int] = (5, 10, 15), runs: int = 200, seed: int = 0) -> List[Dict[str, Any]]:
+    """Planning latency (matrix lookup + solver) on random tours of each size."""
+    from retrieval_eval import percentile
+
+    documents = ingest.load_documents()
+    load()
+    rng = random.Random(seed)
+    start = datetime.datetime.combine(datetime.date.today(), datetime.time.fromisoformat(DAY_START))
+    rows = []
+    for size in sizes:
+        latencies, skipped = [], 0
+        for _ in range(runs):
+            docs = rng.sample(documents, size)
+            started = time.perf_counter()
+            plan = plan_tour(docs, start)
+            latencies.append((time.perf_counter() - started) * 1000)
+            skipped += len(plan["skipped"])
+        rows.append({"stops": size, "runs": runs, "p50_ms": round(percentile(latencies, 50), 2),
+                     "p95_ms": round(percentile(latencies, 95), 2), "max_ms": round(max(latencies), 2),
+                     "skipped_per_tour": round(skipped / runs, 2)})
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["build", "plan", "benchmark"])
+    parser.add_argument("names", nargs="*", help="plan: POI names (first match each)")
+    parser.add_argument("--source", choices=["osm", "estimate"], default="osm",
+                        help="build: street network (needs osmnx) or great-circle estimate")
+    parser.add_argument("--speed-kmh", type=float, default=WALK_SPEED_KMH)
+    parser.add_argument("--start", help='plan: "YYYY-MM-DD HH:MM" (default: DAY_START today)')
+    parser.add_argument("--first", action="store_true", help="plan: start at the first named POI")
+    parser.add_argument("--stops", type=int, nargs="+", default=[5, 10, 15], help="benchmark: tour sizes")
+    parser.add_argument("--runs", type=int, default=200, help="benchmark: tours per size")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build(args.source, speed_kmh=args.speed_kmh)
+    elif args.command == "plan":
+        documents = ingest.load_documents()
+        docs = []
+        for name in args.names:
+            doc = next((d for d in documents if name.lower() in str(d["name"]).lower()), None)
+            if doc is None:
+                raise SystemExit(f"No POI named like {name!r}")
+            docs.append(doc)
+        start = datetime.datetime.fromisoformat(args.start) if args.start else None
+        print(format_plan(plan_tour(docs, start, docs[0]["id"] if args.first and docs else None)))
+    else:
+        import pandas as pd
+
+        print(pd.DataFrame(benchmark(args.stops, args.runs)).to_string(index=False))
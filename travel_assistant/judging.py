@@ -0,0 +1,126 @@
+"""
+Evaluation policy for the LLM judge.
+
+Not every answer is judged: `should_evaluate` samples RAG_JUDGE_SAMPLE_RATE of
+the answers per stratum (the routed model/prompt, see router.py), with
+per-stratum overrides in RAG_JUDGE_STRATUM_RATES ("gemini_llm/prompt_B=0.1,...")
+and the first RAG_JUDGE_MIN_PER_STRATUM answers of every stratum always judged,
+so rarely used routes still get quality estimates. Answers with negative
+feedback are always judged (eval_status "negative_feedback").
+
+Sampled answers are judged in batches (`BATCHER`): up to RAG_JUDGE_BATCH_SIZE
+answers share one judge request, flushed at the latest after
+RAG_JUDGE_BATCH_WAIT_S, and whatever is still queued when the process exits.
+An answer whose batch failed, or which the judge's reply left out, goes back
+in the queue up to RAG_JUDGE_RETRIES times before it is saved as judge_failed.
+eval_status on each conversation is pending, sampled, negative_feedback,
+skipped or judge_failed, so monitoring can report judged vs total (fast_path
+for templated fact answers, which are never judged).
+"""
+import os
+import atexit
+import random
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+JUDGE_SAMPLE_RATE = float(os.getenv("RAG_JUDGE_SAMPLE_RATE", "0.2"))
+JUDGE_MIN_PER_STRATUM = int(os.getenv("RAG_JUDGE_MIN_PER_STRATUM", "5"))
+JUDGE_BATCH_SIZE = int(os.getenv("RAG_JUDGE_BATCH_SIZE", "5"))
+JUDGE_BATCH_WAIT_S = float(os.getenv("RAG_JUDGE_BATCH_WAIT_S", "20"))
+JUDGE_RETRIES = int(os.getenv("RAG_JUDGE_RETRIES", "1"))
+
+def _parse_rates(value: str) -> Dict[str, float]:
+    rates = {}
+    for part in value.split(","):
+        if "=" in part:
+            name, rate = part.split("=", 1)
+            rates[name.strip()] = float(rate)
+    return rates
+
+JUDGE_STRATUM_RATES = _parse_rates(os.getenv("RAG_JUDGE_STRATUM_RATES", ""))
+
+_lock = threading.Lock()
+COUNTERS: Dict[str, Dict[str, int]] = {}
+
+def stratum(results: Dict[str, Any]) -> str:
+    routing = results.get("routing") or {}
+    return routing.get("winner") or routing.get("route") or results.get("model_name") or "unknown"
+
+def should_evaluate(results: Dict[str, Any]) -> bool:
+    """Sampling decision for one drafted answer; counts total / sampled per stratum."""
+    name = stratum(results)
+    rate = JUDGE_STRATUM_RATES.get(name, JUDGE_SAMPLE_RATE)
+    with _lock:
+        counts = COUNTERS.setdefault(name, {"total": 0, "sampled": 0})
+        counts["total"] += 1
+        sampled = counts["total"] <= JUDGE_MIN_PER_STRATUM or random.random() < rate
+        counts["sampled"] += sampled
+    results["eval_status"] = "pending" if sampled else "skipped"
+    return sampled
+
+def context_docs(ids: List[Any]) -> List[dict]:
+    """POI documents for stored context ids, from the shared memory-mapped store."""
+    import poi_store
+    return poi_store.load().get_many(ids)
+
+class JudgeBatcher:
+    """Collects answers to judge and sends them to the judge in batches, off the request path."""
+
+    def __init__(self, batch_size: int = JUDGE_BATCH_SIZE, wait_s: float = JUDGE_BATCH_WAIT_S):
+        self.batch_size = batch_size
+        self.wait_s = wait_s
+        self._pending: List[tuple] = []
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def submit(self, results: Dict[str, Any], OPENAI_API_KEY: str,
+               on_done: Callable[[Dict[str, Any]], Any], status: str = "sampled", attempt: int = 0) -> None:
+        with self._lock:
+            self._pending.append((results, OPENAI_API_KEY, on_done, status, attempt))
+            full = len(self._pending) >= self.batch_size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.wait_s, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not batch:
+            return
+        import rag
+
+        for status in {item[3] for item in batch}:
+            group = [item for item in batch if item[3] == status]
+            results_list = [item[0] for item in group]
+            # evaluate_batch_async drops the judge context; a retry needs it again
+            contexts = [results.get("context") for results in results_list]
+            try:
+                rag.run_sync(rag.evaluate_batch_async(results_list, group[0][1], status))
+            except Exception as e:
+                print(f"Judging a batch of {len(group)} answers failed: {e!r}")
+                for results in results_list:
+                    results["eval_status"] = "judge_failed"
+            for (results, OPENAI_API_KEY, on_done, _, attempt), context in zip(group, contexts):
+                if results["eval_status"] == "judge_failed" and attempt < JUDGE_RETRIES:
+                    self.submit({**results, "context": context}, OPENAI_API_KEY, on_done, status, attempt + 1)
+                    continue
+                # judge_failed is saved as such, so it does not stay pending forever
+                try:
+                    on_done(results)
+                except Exception as e:
+                    print(f"Saving the judgement of {results.get('id')} failed: {e!r}")
+
+    def drain(self) -> None:
+        """Flush until nothing is queued, retries included."""
+        while self._pending:
+            self.flush()
+
+BATCHER = JudgeBatcher()
+# answers still waiting for the timer would be lost with the process
+atexit.register(BATCHER.drain)
@@ -0,0 +1,84 @@
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+# Bounded conversation memory kept in the (JSON-serializable) conversation state.
+# The newest MEMORY_MAX_TURNS turns go into the prompt verbatim; older turns are
+# compacted according to MEMORY_COMPACTION:
+#   summary  - question plus the first sentence of the answer
+#   poi_ids  - question plus the POIs (name and id) it was answered from
+#   drop     - left out of the prompt
+# Everything is rendered newest-first until MEMORY_TOKEN_BUDGET is spent.
+MEMORY_MAX_TURNS = int(os.getenv("RAG_MEMORY_MAX_TURNS", "2"))
+MEMORY_TOKEN_BUDGET = int(os.getenv("RAG_MEMORY_TOKEN_BUDGET", "800"))
+MEMORY_COMPACTION = os.getenv("RAG_MEMORY_COMPACTION", "summary")
+MEMORY_MAX_STORED_TURNS = int(os.getenv("RAG_MEMORY_MAX_STORED_TURNS", "20"))
+SUMMARY_MAX_CHARS = 200
+
+def new_memory() -> Dict[str, Any]:
+    return {"turns": []}
+
+def estimate_tokens(text: str) -> int:
+    """Cheap estimate (~4 characters per token) used for budgeting."""
+    return max(1, len(text) // 4)
+
+def summarize(answer: str, max_chars: int = SUMMARY_MAX_CHARS) -> str:
+    """First sentence of the answer without markdown, no LLM call."""
+    text = re.sub(r"[*#`>_]+", "", answer or "").strip()
+    text = re.sub(r"\s+", " ", text)
+    sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars].rsplit(" ", 1)[0] + "..."
+    return sentence
+
+def add_turn(memory: Optional[Dict[str, Any]], question: str, answer: str, pois: List[Dict[str, Any]],
+             max_turns: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Return a new memory with the turn appended. Only the newest `max_turns`
+    keep their full answer text, and at most MEMORY_MAX_STORED_TURNS are kept.
+    """
+    max_turns = MEMORY_MAX_TURNS if max_turns is None else max_turns
+    turns = [dict(t) for t in (memory or new_memory()).get("turns", [])]
+    turns.append({
+        "question": question,
+        "answer": answer,
+        "summary": summarize(answer),
+        "pois": [{"id": p["id"], "name": p.get("name")} for p in pois],
+    })
+    turns = turns[-MEMORY_MAX_STORED_TURNS:]
+    for turn in turns[:-max_turns] if max_turns > 0 else turns:
+        turn.pop("answer", None)
+    return {**(memory or {}), "turns": turns}
+
+def _render_turn(turn: Dict[str, Any], verbatim: bool, compaction: str) -> Optional[str]:
+    if verbatim and turn.get("answer"):
+        return f"User: {turn['question']}\nAssistant: {turn['answer']}"
+    if compaction == "summary":
+        return f"User: {turn['question']}\nAssistant (summary): {turn['summary']}"
+    if compaction == "poi_ids":
+        places = ", ".join(f"{p['name']} [{p['id']}]" for p in turn.get("pois", []))
+        return f"User: {turn['question']}\n(answered from: {places or 'no places'})"
+    return None
+
+def render(memory: Optional[Dict[str, Any]], token_budget: Optional[int] = None,
+           max_turns: Optional[int] = None, compaction: Optional[str] = None) -> str:
+    """Prompt text for the prior turns, oldest first, within the token budget."""
+    token_budget = MEMORY_TOKEN_BUDGET if token_budget is None else token_budget
+    max_turns = MEMORY_MAX_TURNS if max_turns is None else max_turns
+    compaction = compaction or MEMORY_COMPACTION
+
+    blocks = []
+    used = 0
+    for age, turn in enumerate(reversed((memory or {}).get("turns", []))):
+        text = _render_turn(turn, age < max_turns, compaction)
+        if text is not None and used + estimate_tokens(text) > token_budget and age < max_turns:
+            # a verbatim turn that does not fit may still fit compacted
+            text = _render_turn(turn, False, compaction)
+        if text is None:
+            continue
+        cost = estimate_tokens(text)
+        if used + cost > token_budget:
+            break
+        blocks.append(text)
+        used += cost
+    return "\n\n".join(reversed(blocks))
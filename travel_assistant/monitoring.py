@@ -4,11 +4,24 @@ import streamlit as st
 import pandas as pd
 from auth import check_authorization
 import db
+import admission
+import judging
+import retention
 
 METRICS_COLS = ['faithfulness', 'groundedness', 'relevance', 'completeness', 'coherence', 'conciseness']
 
-def _load_db_tables():
-    """Load conversation and feedback data from DB (defensive)."""
+def _load_db_tables(include_archive: bool = False):
+    """Load conversation and feedback data from DB, plus the Parquet archive on request (defensive)."""
+    if include_archive:
+        try:
+            conv_df = retention.load_conversations()
+        except Exception:
+            conv_df = retention.read_archive("conversations")
+        try:
+            fb_df = retention.load_feedback()
+        except Exception:
+            fb_df = retention.read_archive("feedback")
+        return conv_df, fb_df
     try:
         conversation_history = db.get_conversation_data() or []
     except Exception:
@@ -165,12 +178,45 @@ def _map_label_to_score(v):
     except Exception:
         return None
 
+def _sampling_stratum(row: pd.Series) -> str:
+    """judging.stratum of a stored conversation row."""
+    routing = row.get('routing')
+    if isinstance(routing, str):
+        routing = json.loads(routing)
+    model_name = row.get('model_name')
+    return judging.stratum({"routing": routing if isinstance(routing, dict) else None,
+                            "model_name": model_name if isinstance(model_name, str) else None})
+
 def _render_quality_metrics(conv_df: pd.DataFrame):
     st.subheader("Evaluation / Quality Metrics")
     if conv_df.empty:
         st.info("No conversation data for evaluation metrics.")
         return
 
+    # only a sample of the answers is judged (see judging.py); keep that visible
+    if 'eval_status' in conv_df.columns:
+        status = conv_df['eval_status'].fillna('sampled')
+        # templated fast path answers are never judged: not part of the total
+        judgeable = conv_df[status != 'fast_path']
+        status = status[status != 'fast_path']
+        status_counts = status.value_counts()
+        judged = int(status_counts.get('sampled', 0) + status_counts.get('negative_feedback', 0))
+        s1, s2, s3 = st.columns(3)
+        with s1:
+            st.metric("Judged / Total Answers", f"{judged} / {len(judgeable)}")
+        with s2:
+            st.metric("Judged Share", f"{judged / len(judgeable) * 100:.1f}%" if len(judgeable) else "n/a")
+        with s3:
+            st.metric("Judged After Negative Feedback", int(status_counts.get('negative_feedback', 0)))
+        if not judgeable.empty:
+            # the strata the sampler draws from (judging.stratum)
+            strata = judgeable.apply(_sampling_stratum, axis=1)
+            st.markdown("Judged vs total per sampling stratum")
+            st.dataframe(pd.crosstab(strata, status))
+        st.caption("Quality figures below are estimates from the random sample only; answers judged "
+                   "after negative feedback are left out because they would skew them downwards.")
+        conv_df = conv_df[conv_df['eval_status'].fillna('sampled') == 'sampled'].copy()
+
     if 'quality_score' in conv_df.columns:
         conv_df['quality_score'] = pd.to_numeric(conv_df['quality_score'], errors='coerce')
         avg_q = conv_df['quality_score'].mean()
@@ -223,6 +269,70 @@ def _render_quality_metrics(conv_df: pd.DataFrame):
     else:
         st.info("No evaluation metric columns found (faithfulness, groundedness, relevance, completeness, coherence, conciseness).")
 
+def _render_routing(conv_df: pd.DataFrame):
+    st.subheader("🔀 Model Routing")
+    if conv_df.empty or 'routing' not in conv_df.columns or conv_df['routing'].isna().all():
+        st.info("No routing decisions recorded yet.")
+        return
+    routing = conv_df['routing'].dropna().map(lambda r: json.loads(r) if isinstance(r, str) else r)
+    routing_df = pd.json_normalize(list(routing))
+    c1, c2 = st.columns(2)
+    with c1:
+        st.markdown("Route mix")
+        st.bar_chart(routing_df['route'].value_counts())
+    with c2:
+        st.markdown("Decision reasons")
+        st.bar_chart(routing_df['reason'].value_counts())
+
+def _render_fast_path(conv_df: pd.DataFrame, fb_df: pd.DataFrame):
+    st.subheader("⚡ Fact Lookup Fast Path")
+    if conv_df.empty or 'model_name' not in conv_df.columns:
+        st.info("No conversations yet.")
+        return
+    fast = conv_df['model_name'] == 'fast_path'
+    f1, f2, f3 = st.columns(3)
+    with f1:
+        st.metric("Fast-path Answers", int(fast.sum()))
+    with f2:
+        st.metric("Fast-path Share", f"{fast.mean() * 100:.1f}%")
+    if fast.any() and 'routing' in conv_df.columns:
+        routing = conv_df.loc[fast, 'routing'].map(lambda r: json.loads(r) if isinstance(r, str) else r or {})
+        latencies = routing.map(lambda r: r.get('latency_s')).dropna()
+        with f3:
+            st.metric("Median Fast-path Latency", f"{latencies.median() * 1000:.0f} ms" if not latencies.empty else "N/A")
+        st.markdown("Answered attributes")
+        st.bar_chart(routing.map(lambda r: r.get('attributes') or []).explode().value_counts())
+    if not fb_df.empty and {'feedback_type', 'conversation_id'} <= set(fb_df.columns) and 'id' in conv_df.columns:
+        path = conv_df.set_index('id')['model_name'].eq('fast_path').map({True: 'fast path', False: 'generated'})
+        rated = fb_df.assign(path=fb_df['conversation_id'].map(path)).dropna(subset=['path'])
+        if not rated.empty:
+            st.markdown("Feedback by answer path")
+            satisfaction = rated.groupby('path')['feedback_type'].agg(
+                responses='count', satisfaction=lambda t: f"{(t == 'positive').mean() * 100:.1f}%")
+            st.dataframe(satisfaction)
+
+def _render_admission():
+    st.subheader("🚦 Admission Control")
+    stats = admission.stats()
+    if not stats["enabled"]:
+        st.info("Admission control is off (RAG_ADMISSION=0).")
+        return
+    st.caption("Counters of this Streamlit process since it started; RAG API workers report theirs on /health.")
+    gates = {name: stats[name] for name in admission.GATES}
+    a1, a2, a3, a4 = st.columns(4)
+    with a1:
+        st.metric("Questions Admitted", stats["sessions"]["admitted"])
+    with a2:
+        st.metric("Rate-limited Questions", stats["sessions"]["rate_limited"])
+    with a3:
+        st.metric("Queued LLM Calls", sum(g["queued"] for g in gates.values()))
+    with a4:
+        st.metric("Shed LLM Calls", sum(g["shed"] for g in gates.values()))
+    columns = ["limit", "in_flight", "max_queue", "queue_depth", "admitted", "queued", "shed_queue_full", "shed_timeout"]
+    table = pd.DataFrame(gates).T[columns]
+    table["mean_queue_wait_ms"] = [g["queue_wait_ms"]["mean"] for g in gates.values()]
+    st.dataframe(table)
+
 def _render_recent_conversations(conv_df: pd.DataFrame):
     st.subheader("💬 Recent Conversations")
     if conv_df.empty:
@@ -287,7 +397,11 @@ def monitoring_page():
         except Exception as e:
             st.error(f"Import feedback failed: {e}")
 
-    conv_df, fb_df = _load_db_tables()
+    include_archive = st.checkbox(
+        "Include archived history",
+        help=f"Conversations older than {retention.HOT_DAYS} days are moved to Parquet by retention.py",
+    )
+    conv_df, fb_df = _load_db_tables(include_archive)
     conv_df = _normalize_conversation_df(conv_df)
 
     _render_top_level_metrics(conv_df, fb_df)
@@ -302,6 +416,12 @@ def monitoring_page():
     st.markdown("---")
     _render_quality_metrics(conv_df)
     st.markdown("---")
+    _render_routing(conv_df)
+    st.markdown("---")
+    _render_fast_path(conv_df, fb_df)
+    st.markdown("---")
+    _render_admission()
+    st.markdown("---")
     _render_recent_conversations(conv_df)
     st.markdown("---")
     _render_exports(conv_df, fb_df)
@@ -1,25 +1,51 @@
 import os
 import json
-from typing import Any, Dict
+import threading
+import contextlib
+from typing import Any, Dict, List, Tuple
 import streamlit as st
 import datetime
 import db
 
+try:
+    import fcntl
+except ImportError:  # Windows: the thread lock alone
+    fcntl = None
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# The JSON mirrors are rewritten from ui's background pool, the judge batcher's
+# timer threads and retention.compact_mirror (another process): every
+# read-modify-write holds this lock plus an flock on "<mirror>.lock".
+_MIRROR_LOCK = threading.Lock()
+
+@contextlib.contextmanager
+def mirror_lock(path: str):
+    with _MIRROR_LOCK, open(f"{path}.lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+def write_json_list(path: str, records: List[Dict[str, Any]]) -> None:
+    """Replace a mirror atomically: readers see the old or the new file, never half of one."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(records, f, indent=2, default=str, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
 def _save_json_list_item(filename: str, item: Dict[str, Any]) -> bool:
     path = os.path.join(DATA_DIR, filename)
     try:
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                existing = json.load(f)
-        else:
-            existing = []
-        existing.append(item)
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(existing, f, indent=2, default=str, ensure_ascii=False)
+        with mirror_lock(path):
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    existing = json.load(f)
+            else:
+                existing = []
+            existing.append(item)
+            write_json_list(path, existing)
         return True
     except Exception as e:
         # non-fatal: log to Streamlit and return False
@@ -33,15 +59,63 @@ def save_feedback(feedback: Dict[str, Any]) -> bool:
     """Persist feedback to DB (if available) and to disk."""
     try:
         db.save_feedback(feedback)
-    except Exception:
-        # do not fail the UI if DB is unavailable
-        pass
+    except Exception as e:
+        print(f"DB write failed (feedback): {e!r}")
     return _save_json_list_item("feedback_data.json", feedback)
 
 def save_conversation(answer: Dict[str, Any]) -> bool:
     """Persist conversation/answer to DB and disk."""
     try:
         db.save_conversation(answer)
+    except Exception as e:
+        # the JSON mirror below still gets the record
+        print(f"DB write failed (conversation): {e!r}")
+    return _save_json_list_item("answer_data.json", answer)
+
+def _load_json_list(filename: str) -> List[Dict[str, Any]]:
+    path = os.path.join(DATA_DIR, filename)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_conversations(ids: List[str]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Saved conversations and their feedback by id: DB first, the JSON mirrors if it is unavailable."""
+    try:
+        return db.get_conversations_by_ids(ids)
     except Exception:
         pass
-    return _save_json_list_item("answer_data.json", answer)
\ No newline at end of file
+    wanted = set(ids)
+    conversations = [c for c in _load_json_list("answer_data.json") if c.get('id') in wanted]
+    feedback = [f for f in _load_json_list("feedback_data.json") if f.get('conversation_id') in wanted]
+    return conversations, feedback
+
+def _update_json_list_item(filename: str, item: Dict[str, Any], key: str = "id") -> bool:
+    path = os.path.join(DATA_DIR, filename)
+    try:
+        with mirror_lock(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                existing = json.load(f)
+            for i, record in enumerate(existing):
+                if record.get(key) == item.get(key):
+                    existing[i] = {**record, **item}
+                    break
+            else:
+                existing.append(item)
+            write_json_list(path, existing)
+        return True
+    except Exception as e:
+        print(f"Error updating {filename}: {e}")
+        return False
+
+EVAL_FIELDS = ['quality_score', 'faithfulness', 'groundedness', 'relevance', 'completeness', 'coherence',
+               'conciseness', 'eval_tokens_used', 'eval_input_tokens', 'eval_estimated_cost_usd', 'eval_status']
+
+def update_conversation_eval(answer: Dict[str, Any]) -> bool:
+    """Store the judge labels of an already saved conversation (DB and disk)."""
+    fields = {k: answer.get(k) for k in EVAL_FIELDS}
+    try:
+        db.update_conversation_eval(answer['id'], fields)
+    except Exception as e:
+        print(f"DB write failed (conversation eval): {e!r}")
+    return _update_json_list_item("answer_data.json", {"id": answer['id'], **fields})
@@ -0,0 +1,230 @@
+"""
+Precomputed POI neighbour graph for "places like X" / "what else is near X".
+
+An offline stage (after ingest) reads every POI's stored dense vector from
+the live index version and keeps, per POI, two neighbour lists of length k
+(POI_GRAPH_K) in a compact adjacency array (data/poi_graph.npz):
+
+- similar: top-k by a blend of cosine similarity of the dense vectors,
+  geographic proximity (exp(-km / --geo-scale-km)) and the Jaccard overlap
+  of the categorical payload fields (ingest.CATEGORICAL_FIELDS);
+- near: the k closest POIs by great-circle distance.
+
+rag.plan_retrieval routes "similar to X" / "near X" questions that name one
+POI to the graph: the context is X plus its neighbours, an O(k) lookup with no
+query embedding and no Qdrant call. RAG_GRAPH_EXPAND > 0 also appends that
+many similar neighbours of the top hit to ordinary retrievals.
+
+    python travel_assistant/poi_graph.py build [--k 20] [--dense-weight 0.8 --geo-weight 0.1 --category-weight 0.1]
+    python travel_assistant/poi_graph.py show "Czartoryski Museum" [--relation near]
+
+The graph records the collection it was built from; warmup rebuilds it when
+the alias has moved to another version since.
+"""
+import os
+import re
+import json
+import math
+import time
+import argparse
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import embedding_models
+import ingest
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GRAPH_PATH = os.getenv("POI_GRAPH_PATH", os.path.join(BASE_DIR, "data", "poi_graph.npz"))
+K = int(os.getenv("POI_GRAPH_K", "20"))
+WEIGHTS = {"dense": 0.8, "geo": 0.1, "category": 0.1}
+GEO_SCALE_KM = 1.0
+EARTH_RADIUS_KM = 6371.0
+BLOCK_ROWS = 1024
+RELATIONS = ("similar", "near")
+
+def coordinates(documents: List[Dict[str, Any]]) -> np.ndarray:
+    """(lat, lon) in radians per POI: the point itself, or the centroid of a line / polygon."""
+    from shapely import wkt
+
+    coords = []
+    for doc in documents:
+        geometry = str(doc.get('geometry', ''))
+        match = re.fullmatch(r"POINT \(([-\d.]+) ([-\d.]+)\)", geometry)
+        if match:
+            lon, lat = float(match.group(1)), float(match.group(2))
+        else:
+            centroid = wkt.loads(geometry).centroid
+            lon, lat = centroid.x, centroid.y
+        coords.append((math.radians(lat), math.radians(lon)))
+    return np.array(coords)
+
+def distances_km(block: np.ndarray, coords: np.ndarray) -> np.ndarray:
+    """Haversine distances between the rows of `block` and all `coords`."""
+    lat1, lon1 = block[:, :1], block[:, 1:]
+    lat2, lon2 = coords[:, 0], coords[:, 1]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def category_matrix(documents: List[Dict[str, Any]]) -> np.ndarray:
+    """One-hot (field, keyword) matrix over the categorical payload fields."""
+    vocabulary: Dict[str, int] = {}
+    rows = []
+    for doc in documents:
+        keys = {f"{field}={value}" for field in ingest.CATEGORICAL_FIELDS for value in ingest.keyword_values(doc.get(field))}
+        rows.append([vocabulary.setdefault(key, len(vocabulary)) for key in keys])
+    matrix = np.zeros((len(documents), max(len(vocabulary), 1)), dtype=np.float32)
+    for row, columns in enumerate(rows):
+        matrix[row, columns] = 1.0
+    return matrix
+
+def _top_k(scores: np.ndarray, k: int, largest: bool) -> np.ndarray:
+    order = -scores if largest else scores
+    top = np.argpartition(order, k - 1, axis=1)[:, :k]
+    ranked = np.take_along_axis(order, top, axis=1).argsort(axis=1)
+    return np.take_along_axis(top, ranked, axis=1)
+
+def build_graph(ids: List[int], vectors: np.ndarray, documents: List[Dict[str, Any]], k: int = K,
+                weights: Optional[Dict[str, float]] = None, geo_scale_km: float = GEO_SCALE_KM) -> Dict[str, np.ndarray]:
+    """Adjacency arrays for POIs `ids` (rows of `vectors`, same order as `documents`); computed in row blocks."""
+    weights = {**WEIGHTS, **(weights or {})}
+    n = len(ids)
+    k = min(k, n - 1)
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    coords = coordinates(documents)
+    categories = category_matrix(documents)
+    sizes = categories.sum(axis=1)
+    graph = {
+        "ids": np.asarray(ids, dtype=np.int64),
+        "similar": np.empty((n, k), dtype=np.int32), "similar_score": np.empty((n, k), dtype=np.float16),
+        "near": np.empty((n, k), dtype=np.int32), "near_km": np.empty((n, k), dtype=np.float16),
+    }
+    for start in range(0, n, BLOCK_ROWS):
+        rows = np.arange(start, min(start + BLOCK_ROWS, n))
+        km = distances_km(coords[rows], coords)
+        overlap = categories[rows] @ categories.T
+        union = sizes[rows, None] + sizes[None, :] - overlap
+        jaccard = np.divide(overlap, union, out=np.zeros_like(overlap), where=union > 0)
+        score = (weights["dense"] * (unit[rows] @ unit.T) + weights["geo"] * np.exp(-km / geo_scale_km)
+                 + weights["category"] * jaccard)
+        score[np.arange(len(rows)), rows] = -np.inf  # not its own neighbour
+        km[np.arange(len(rows)), rows] = np.inf
+        similar = _top_k(score, k, largest=True)
+        near = _top_k(km, k, largest=False)
+        graph["similar"][rows] = similar
+        graph["similar_score"][rows] = np.take_along_axis(score, similar, axis=1)
+        graph["near"][rows] = near
+        graph["near_km"][rows] = np.take_along_axis(km, near, axis=1)
+    return graph
+
+def fetch_vectors(qdrant_client, collection_name: str, vector_name: str, batch_size: int = 256) -> Tuple[List[int], np.ndarray]:
+    ids, vectors, offset = [], [], None
+    while True:
+        records, offset = qdrant_client.scroll(collection_name=collection_name, limit=batch_size, offset=offset,
+                                               with_payload=False, with_vectors=[vector_name])
+        for record in records:
+            ids.append(record.id)
+            vectors.append(record.vector[vector_name])
+        if offset is None:
+            return ids, np.asarray(vectors, dtype=np.float32)
+
+def save(graph: Dict[str, np.ndarray], meta: Dict[str, Any], path: str = GRAPH_PATH) -> str:
+    tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+    np.savez(tmp_path, meta=np.array(json.dumps(meta)), **graph)
+    os.replace(tmp_path, path)
+    return path
+
+def build(qdrant_client, collection_name: Optional[str] = None, k: int = K, weights: Optional[Dict[str, float]] = None,
+          geo_scale_km: float = GEO_SCALE_KM, path: str = GRAPH_PATH) -> "PoiGraph":
+    """Build the graph from the stored vectors of `collection_name` (default: the live version) and save it."""
+    import index_versions
+
+    collection_name = collection_name or index_versions.live_collection(qdrant_client) or index_versions.ALIAS
+    started = time.perf_counter()
+    ids, vectors = fetch_vectors(qdrant_client, collection_name, embedding_models.get_model()["vector_name"])
+    by_id = {doc['id']: doc for doc in ingest.load_documents()}
+    kept = [i for i, poi_id in enumerate(ids) if poi_id in by_id]
+    ids, vectors = [ids[i] for i in kept], vectors[kept]
+    graph = build_graph(ids, vectors, [by_id[poi_id] for poi_id in ids], k, weights, geo_scale_km)
+    meta = {"collection": collection_name, "k": graph["similar"].shape[1], "weights": {**WEIGHTS, **(weights or {})},
+            "geo_scale_km": geo_scale_km, "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+    save(graph, meta, path)
+    print(f"POI graph: {len(ids)} POIs, k={meta['k']}, from {collection_name} in {time.perf_counter() - started:.1f} s")
+    _cache.pop(path, None)
+    return load(path)
+
+class PoiGraph:
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.meta = json.loads(str(arrays["meta"]))
+        self.ids = arrays["ids"]
+        self.adjacency = {"similar": (arrays["similar"], arrays["similar_score"]), "near": (arrays["near"], arrays["near_km"])}
+        self._rows = {int(poi_id): row for row, poi_id in enumerate(self.ids)}
+
+    def __contains__(self, poi_id: Any) -> bool:
+        return poi_id in self._rows
+
+    def neighbours(self, poi_id: Any, relation: str = "similar", k: Optional[int] = None) -> List[Tuple[int, float]]:
+        """(id, score) pairs, best first; the score is the blend for "similar" and km for "near"."""
+        row = self._rows.get(poi_id)
+        if row is None:
+            return []
+        columns, values = self.adjacency[relation]
+        return [(int(self.ids[c]), float(v)) for c, v in zip(columns[row, :k], values[row, :k])]
+
+_cache: Dict[str, Optional[PoiGraph]] = {}
+_lock = threading.Lock()
+
+def load(path: str = GRAPH_PATH) -> Optional[PoiGraph]:
+    """The saved graph (one instance per process), None when it has not been built."""
+    with _lock:
+        if path not in _cache:
+            if not os.path.exists(path):
+                return None
+            with np.load(path) as arrays:
+                _cache[path] = PoiGraph({name: arrays[name] for name in arrays.files})
+        return _cache[path]
+
+def ensure_graph(qdrant_client, path: str = GRAPH_PATH) -> Optional[PoiGraph]:
+    """Start-up step: rebuild when missing or built from another index version; never raises."""
+    import index_versions
+
+    try:
+        graph = load(path)
+        live = index_versions.live_collection(qdrant_client)
+        if graph is not None and (live is None or graph.meta["collection"] == live):
+            return graph
+        return build(qdrant_client, live, path=path)
+    except Exception as e:
+        print(f"POI graph unavailable: {e!r}")
+        return None
+
+if __name__ == "__main__":
+    from qdrant_client import QdrantClient
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["build", "show"])
+    parser.add_argument("name", nargs="?", help="show: POI name")
+    parser.add_argument("--relation", choices=RELATIONS, default="similar")
+    parser.add_argument("--k", type=int, default=K)
+    parser.add_argument("--dense-weight", type=float, default=WEIGHTS["dense"])
+    parser.add_argument("--geo-weight", type=float, default=WEIGHTS["geo"])
+    parser.add_argument("--category-weight", type=float, default=WEIGHTS["category"])
+    parser.add_argument("--geo-scale-km", type=float, default=GEO_SCALE_KM)
+    parser.add_argument("--collection", help="build: collection to read the vectors from (default: the live version)")
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL", "http://localhost:6333"))
+    args = parser.parse_args()
+
+    if args.command == "build":
+        weights = {"dense": args.dense_weight, "geo": args.geo_weight, "category": args.category_weight}
+        build(QdrantClient(url=args.qdrant_url), args.collection, args.k, weights, args.geo_scale_km)
+    else:
+        graph = load()
+        if graph is None:
+            raise SystemExit("No graph yet: run `poi_graph.py build` first")
+        names = {doc['id']: doc['name'] for doc in ingest.load_documents()}
+        matches = [poi_id for poi_id, name in names.items() if args.name and args.name.lower() in str(name).lower()]
+        if not matches:
+            raise SystemExit(f"No POI named like {args.name!r}")
+        print(f"{names[matches[0]]} ({args.relation}):")
+        for poi_id, value in graph.neighbours(matches[0], args.relation, args.k):
+            print(f"  {value:8.3f}  {names.get(poi_id)}")
@@ -0,0 +1,150 @@
+"""
+Compact read-only POI store.
+
+The CSV is converted once into an uncompressed Arrow IPC file next to it
+(data/krakow_pois_selected.arrow): missing values ("no information", NaN) are
+stored as nulls and low-cardinality text columns are dictionary-encoded. The
+file is memory-mapped, so loading is near-instant and the pages are shared by
+every process on the host (Streamlit, RAG API workers) through the OS page
+cache instead of each holding a list of 49-key dicts.
+
+Records are materialized as dicts only when asked for, by id:
+
+    store = poi_store.load()
+    store.get(42), store.get_many([42, 7])
+
+Nulls come back as "no information", the dataset's own marker, so the prompt
+templates can format every field.
+
+    python travel_assistant/poi_store.py --build     # (re)build the Arrow file
+    python travel_assistant/poi_store.py --report    # load time and heap use vs. the dict list
+"""
+import os
+import time
+import argparse
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CSV_PATH = os.path.join(BASE_DIR, "data", "krakow_pois_selected.csv")
+STORE_PATH = os.path.join(BASE_DIR, "data", "krakow_pois_selected.arrow")
+MISSING = "no information"
+# text columns with at most this share of distinct values are dictionary-encoded
+DICTIONARY_MAX_RATIO = 0.5
+
+def build(csv_path: str = CSV_PATH, path: str = STORE_PATH) -> str:
+    import pandas as pd
+
+    df = pd.read_csv(csv_path)
+    df = df.astype(object).where(df.notna(), None).replace({MISSING: None})
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    columns = []
+    for name, column in zip(table.column_names, table.columns):
+        if name == "id":
+            column = column.cast(pa.int64())
+        elif column.null_count == len(column):
+            column = column.cast(pa.string())
+        elif pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            valid = len(column) - column.null_count
+            if pc.count_distinct(column).as_py() <= DICTIONARY_MAX_RATIO * valid:
+                column = pc.dictionary_encode(column)
+        columns.append(column)
+    table = pa.table(dict(zip(table.column_names, columns)))
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+    return path
+
+class PoiStore:
+    """Read-only view over the Arrow table with id lookups; iterating yields dicts."""
+
+    def __init__(self, table: pa.Table):
+        self.table = table
+        self._rows = {poi_id: row for row, poi_id in enumerate(table.column("id").to_pylist())}
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    def __contains__(self, poi_id: Any) -> bool:
+        return poi_id in self._rows
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for batch in self.table.to_batches(max_chunksize=128):
+            for record in batch.to_pylist():
+                yield self._fill(record)
+
+    @staticmethod
+    def _fill(record: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: MISSING if v is None else v for k, v in record.items()}
+
+    def get(self, poi_id: Any) -> Optional[Dict[str, Any]]:
+        found = self.get_many([poi_id])
+        return found[0] if found else None
+
+    def get_many(self, ids: List[Any]) -> List[Dict[str, Any]]:
+        """Records for the known ids, in the given order, without duplicates."""
+        rows = list(dict.fromkeys(self._rows[i] for i in ids if i in self._rows))
+        if not rows:
+            return []
+        return [self._fill(record) for record in self.table.take(rows).to_pylist()]
+
+    def column(self, name: str) -> List[Any]:
+        return self.table.column(name).to_pylist()
+
+_store: Optional[PoiStore] = None
+_lock = threading.Lock()
+
+def load(path: str = STORE_PATH, csv_path: str = CSV_PATH) -> PoiStore:
+    """Memory-map the store (built first if missing or older than the CSV); one instance per process."""
+    global _store
+    with _lock:
+        if _store is None:
+            if not os.path.exists(path) or (os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(path)):
+                build(csv_path, path)
+            table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+            _store = PoiStore(table)
+        return _store
+
+def report(csv_path: str = CSV_PATH, path: str = STORE_PATH) -> Dict[str, float]:
+    import tracemalloc
+    import pandas as pd
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    documents = pd.read_csv(csv_path).to_dict(orient="records")
+    dict_s = time.perf_counter() - start
+    dict_heap = tracemalloc.get_traced_memory()[0]
+    del documents
+    tracemalloc.reset_peak()
+
+    base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    store = PoiStore(pa.ipc.open_file(pa.memory_map(path, "r")).read_all())
+    store_s = time.perf_counter() - start
+    store_heap = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return {
+        "csv_dicts_load_ms": dict_s * 1000,
+        "csv_dicts_heap_kb": dict_heap / 1024,
+        "store_load_ms": store_s * 1000,
+        "store_heap_kb": store_heap / 1024,
+        "store_file_kb": os.path.getsize(path) / 1024,
+        "store_arrow_kb": store.table.nbytes / 1024,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--build", action="store_true")
+    parser.add_argument("--report", action="store_true")
+    args = parser.parse_args()
+    if args.build or not os.path.exists(STORE_PATH):
+        print(f"wrote {build()}")
+    if args.report:
+        for key, value in report().items():
+            print(f"{key}: {value:.1f}")
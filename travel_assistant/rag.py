@@ -1,10 +1,37 @@
-import pandas as pd
+import os
+import atexit
+import asyncio
+import weakref
+import threading
 from qdrant_client import models
-import google.generativeai as genai
 import streamlit as st
-from openai import OpenAI
 import re
 import json
+import admission
+import collection_profiles
+import embedding_models
+import embedding_service
+import memory
+import router
+import judging
+import time
+
+# google.generativeai and openai are imported on first use (see _genai and
+# judge_label) to keep app start-up fast.
+_genai_module = None
+
+def _genai():
+    global _genai_module
+    if _genai_module is None:
+        import google.generativeai as genai
+        endpoint = os.getenv("GEMINI_API_ENDPOINT")  # e.g. a local stub from stub_providers.py
+        if endpoint:
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"), transport="rest",
+                            client_options={"api_endpoint": endpoint})
+        else:
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        _genai_module = genai
+    return _genai_module
 
 
 ENTRY_TEMPLATE = """
@@ -71,36 +98,640 @@ CONTEXT: {context}
 
 Answer:"""
 
+# Prompt variants compared in notebooks/04_RAG_evaluation.ipynb; the router picks one per request.
+PROMPT_VARIANTS = {
+    "prompt_A": """### Act as a **Kraków travel expert** with access to a comprehensive POI (Points of Interest) database (context).
+Your role is to provide **precise, personalized, and actionable recommendations** for visitors by dynamically retrieving and
+synthesizing information from context.
+
+QUESTION: {question}
+
+CONTEXT: {context}
+   
+Answer:""",
+    "prompt_B": PROMPT_TEMPLATE,
+    "prompt_C": """### You are a Krakow travel assistant and expert guide. 
+Your task is to answer the QUESTION based **strictly** on the information provided in the CONTEXT.
+Do not use any external knowledge or make assumptions — rely only on the facts from the CONTEXT.
+
+- Be clear and concise.
+- Make your answer complete but do not add information not in the CONTEXT.
+- If the CONTEXT does not contain the answer, say: "I don't have enough information to answer that."
+
+QUESTION: {question}
+
+CONTEXT: {context}
+
+Answer:""",
+}
+
+
+# Local query-intent rules: (regex, payload field, accepted keyword values).
+# Category nouns only fire in plural or "a|any|some <noun>" form.
+QUERY_CONSTRAINT_RULES = [
+    (r"\bwheelchair[- ]?(accessible|friendly|access)\b|\baccessible (for|to) wheelchairs?\b", "wheelchair", ["yes", "limited"]),
+    (r"\boutdoor seating\b|\b(sit|seating|eat) outside\b|\bterrace\b", "outdoor_seating", ["yes", "pedestrian_zone"]),
+    (r"\btake[- ]?away\b|\btake[- ]?out\b", "takeaway", ["yes"]),
+    (r"\brestaurants\b|\b(a|an|any|some) restaurant\b", "amenity", ["restaurant"]),
+    (r"\bcaf[eé]s\b|\b(a|any|some) caf[eé]\b|\bcoffee shops?\b", "amenity", ["cafe"]),
+    (r"\bfast[- ]food\b", "amenity", ["fast_food"]),
+    (r"\bice[- ]cream\b", "amenity", ["ice_cream"]),
+    (r"\b(bars|pubs)\b|\b(a|any|some) (bar|pub)\b", "amenity", ["bar", "pub"]),
+    (r"\bhotels\b|\b(a|any|some) hotel\b", "tourism", ["hotel"]),
+    (r"\bhostels\b|\b(a|any|some) hostel\b", "tourism", ["hostel"]),
+    (r"\bmuseums\b|\b(a|any|some) museum\b", "tourism", ["museum"]),
+    (r"\bviewpoints\b|\b(a|any|some) viewpoint\b", "tourism", ["viewpoint"]),
+    (r"\b(art|history|historical|science|nature|archaeological|aviation) museums?\b", "museum", None),
+    (r"\bcastles\b", "historic", ["castle"]),
+    (r"\bmemorials\b", "historic", ["memorial"]),
+    (r"\bmonuments\b", "historic", ["monument"]),
+    (r"\bruins\b", "historic", ["ruins"]),
+    (r"\bvegetarian\b", "cuisine", ["vegetarian", "vegan"]),
+    (r"\bvegan\b", "cuisine", ["vegan"]),
+    (r"\bitalian\b", "cuisine", ["italian", "italian_pizza"]),
+    (r"\bpizz(a|as|eria|erias)\b", "cuisine", ["pizza", "italian_pizza"]),
+    (r"\bpolish (food|cuisine|dishes|restaurants?)\b", "cuisine", ["polish", "regional"]),
+    (r"\bkebabs?\b", "cuisine", ["kebab"]),
+    (r"\bburgers?\b", "cuisine", ["burger"]),
+    (r"\b(indian|chinese|japanese|thai|vietnamese|mexican|georgian|ramen|sushi)\b", "cuisine", None),
+]
+
+MUSEUM_KIND_ALIASES = {"historical": "history"}
+
+# Constraints only narrow retrieval when the user is looking for places, not
+# asking about one specific POI ("Is the chapel wheelchair accessible?",
+# "Does Slay Space offer takeaway?", "outdoor seating at this restaurant"). Capitalized words other than the city
+# and its districts are treated as a POI name.
+SPECIFIC_POI_PATTERN = r"^(is|are|does|do|can|what|when|how|who) (the|it)\b|\b(this|that)\b|\b(at|in|inside|within|exploring|visiting) the\b"
+AREA_NAMES = {
+    "i", "kraków", "krakow", "cracow", "poland", "polish", "old", "town", "main", "market", "square",
+    "kazimierz", "podgórze", "podgorze", "nowa", "huta", "wawel", "hill",
+}
+
+def mentions_specific_poi(query: str) -> bool:
+    if re.search(SPECIFIC_POI_PATTERN, query.strip().lower()):
+        return True
+    words = re.findall(r"[^\W\d_][\w'’-]*", query)
+    return any(w[0].isupper() and w.lower() not in AREA_NAMES for w in words[1:])
+
+def extract_query_constraints(query: str) -> dict[str, list[str]]:
+    """
+    Map recognized constraints in the question to payload keyword values,
+    e.g. "wheelchair-accessible restaurants" -> {"wheelchair": [...], "amenity": ["restaurant"]}.
+    Rule based, no LLM call.
+    """
+    if mentions_specific_poi(query):
+        return {}
+    text = query.strip()
+    text = text[:1].lower() + text[1:]
+    constraints: dict[str, list[str]] = {}
+    for pattern, field, values in QUERY_CONSTRAINT_RULES:
+        match = re.search(pattern, text)
+        if not match:
+            continue
+        if values is None:
+            # the matched word itself is the keyword value
+            word = match.group(1)
+            values = [MUSEUM_KIND_ALIASES.get(word, word)]
+        for value in values:
+            if value not in constraints.setdefault(field, []):
+                constraints[field].append(value)
+    return constraints
+
+# What the user is looking for ("restaurants", "museums"): relaxed last.
+PLACE_KIND_FIELDS = ("amenity", "tourism", "historic", "museum")
+
+_constraint_index: dict = {}
+
+def constraint_index(DOCUMENTS) -> dict[str, dict[str, set]]:
+    """{field: {keyword value: POI ids}} over the categorical payload fields; built once per document set."""
+    if _constraint_index.get("documents") is not DOCUMENTS:
+        import ingest
+
+        values: dict[str, dict[str, set]] = {field: {} for field in ingest.CATEGORICAL_FIELDS}
+        for doc in DOCUMENTS:
+            for field, by_value in values.items():
+                for value in ingest.keyword_values(doc.get(field)):
+                    by_value.setdefault(value, set()).add(doc["id"])
+        _constraint_index.update(documents=DOCUMENTS, values=values)
+    return _constraint_index["values"]
+
+def matching_ids(constraints: dict[str, list[str]], DOCUMENTS) -> set:
+    """Ids of the POIs satisfying the constraints: the local equivalent of build_query_filter."""
+    index = constraint_index(DOCUMENTS)
+    ids = None
+    for field, values in constraints.items():
+        by_value = index.get(field, {})
+        field_ids = set().union(*(by_value.get(value, ()) for value in values))
+        ids = field_ids if ids is None else ids & field_ids
+    return ids if ids is not None else {doc["id"] for doc in DOCUMENTS}
+
+def relax_constraints(constraints: dict[str, list[str]], DOCUMENTS) -> dict[str, list[str]]:
+    """
+    The constraints some POI satisfies: fields no POI matches ("vegetarian":
+    no cuisine value in the data) are dropped first, then one field at a time
+    until a POI matches - attributes before the kind of place
+    (PLACE_KIND_FIELDS), and among those the one whose removal leaves the most
+    matching POIs.
+    """
+    matching = {field: matching_ids({field: values}, DOCUMENTS) for field, values in constraints.items()}
+    kept = [field for field in constraints if matching[field]]
+
+    def matches(fields):
+        return len(set.intersection(*(matching[f] for f in fields))) if fields else 1
+
+    while kept and not matches(kept):
+        candidates = [f for f in kept if f not in PLACE_KIND_FIELDS] or kept
+        # ties drop the later field
+        kept.remove(max(reversed(candidates), key=lambda field: matches([f for f in kept if f != field])))
+    return {field: constraints[field] for field in kept}
+
+def build_query_filter(constraints: dict[str, list[str]]):
+    """Values of one field are OR-ed, different fields are AND-ed."""
+    if not constraints:
+        return None
+    return models.Filter(
+        must=[
+            models.FieldCondition(key=field, match=models.MatchAny(any=values))
+            for field, values in constraints.items()
+        ]
+    )
+
+# --- Fact lookups answered without an LLM ------------------------------------
+# Direct attribute questions about one named POI ("What are the opening hours
+# for Wierzynek?") are answered from the retrieved record with a template: no
+# generator and no judge call. The fast path only fires when the top hit's name
+# (or a name variant) appears in the question, every asked attribute has a
+# value and nothing but stopwords is left of the question once the name and
+# the attribute phrases are removed; everything else takes the full RAG path.
+FAST_PATH_ENABLED = os.getenv("RAG_FAST_PATH", "1") == "1"
+
+# (regex, attribute, record fields tried in order)
+FACT_ATTRIBUTE_RULES = [
+    (r"\b(opening|operating|business|visiting) hours\b|\bhours of operation\b|\bwhen (is|are|does|do)\b.*\b(open|close)s?\b|\bwhat time\b.*\b(open|close)s?\b",
+     "opening_hours", ["opening_hours"]),
+    (r"\b(tele)?phone( number)?\b|\bcontact number\b", "phone", ["phone", "contact_phone"]),
+    (r"\bwebsite\b|\bweb ?page\b|\bhomepage\b", "website", ["website", "contact_website"]),
+    (r"\be-?mail\b", "email", ["email"]),
+    (r"\b(street )?address\b|\b(which|what) street\b", "address", ["addr_street"]),
+    (r"\bwheelchairs?( (accessible|accessibility|access|friendly|users?))?\b", "wheelchair", ["wheelchair"]),
+]
+# Words that may be left over once the POI name and the attribute phrases are
+# removed ("What's the phone number of ..."); anything else means the question
+# asks for more than the lookup and goes to the LLM.
+FACT_FILLER_WORDS = frozenset("s whats please tell give know find get number official their".split())
+FACT_EXCLUDE_PATTERN = r"\b(recommend|suggest|nearby|near|around|similar|best|compare|history|historical|why|how to get|directions?)\b"
+
+FACT_TEMPLATES = {
+    "opening_hours": "Opening hours of **{name}**: {value}",
+    "phone": "Phone number of **{name}**: {value}",
+    "website": "Website of **{name}**: {value}",
+    "email": "E-mail of **{name}**: {value}",
+    "address": "**{name}** is at {value}",
+    "wheelchair": "**{name}** {value}.",
+}
+WHEELCHAIR_ANSWERS = {
+    "yes": "is wheelchair accessible",
+    "limited": "has limited wheelchair access",
+    "no": "is not wheelchair accessible",
+}
+
+def _fold(text: str) -> str:
+    """Lower-case, accents removed, punctuation to spaces: 'Pałac Sztuki' -> 'palac sztuki'."""
+    import unicodedata
+    text = unicodedata.normalize("NFKD", str(text).lower().replace("ł", "l"))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.findall(r"\w+", text))
+
+def _name_variants(doc: dict) -> list[str]:
+    return [_fold(v) for field in ("name", "alt_name") if not _is_missing(doc.get(field))
+            for v in str(doc[field]).split(";") if _fold(v)]
+
+_name_counts: dict = {}
+
+def name_counts(DOCUMENTS) -> dict:
+    """How many POIs carry each name variant (chains like Biedronka are ambiguous); computed once per document set."""
+    if _name_counts.get("documents") is not DOCUMENTS:
+        counts: dict = {}
+        for doc in DOCUMENTS:
+            for variant in set(_name_variants(doc)):
+                counts[variant] = counts.get(variant, 0) + 1
+        _name_counts.update(documents=DOCUMENTS, counts=counts)
+    return _name_counts["counts"]
+
+def poi_named_in(query: str, doc: dict, counts: dict | None = None) -> str | None:
+    """The (unambiguous) name variant of the POI mentioned in the question, if any."""
+    folded = f" {_fold(query)} "
+    for variant in sorted(_name_variants(doc), key=len, reverse=True):
+        if len(variant) >= 4 and f" {variant} " in folded and (counts is None or counts.get(variant, 1) == 1):
+            return variant
+    return None
+
+def _fact_value(doc: dict, attribute: str, fields: list[str]) -> str | None:
+    value = next((doc[f] for f in fields if not _is_missing(doc.get(f))), None)
+    if value is None:
+        return None
+    if attribute == "wheelchair":
+        return WHEELCHAIR_ANSWERS.get(str(value).lower())
+    if attribute == "address":
+        city = doc.get("addr_city")
+        postal_code = doc.get("postal_code")
+        parts = [str(value), *(str(p) for p in (postal_code, city) if not _is_missing(p))]
+        return ", ".join(parts)
+    return str(value)
+
+def _fact_residue(text: str, variant: str) -> list[str]:
+    """Words of the question left after the POI name, the attribute phrases, stopwords and filler."""
+    for pattern, _, _ in FACT_ATTRIBUTE_RULES:
+        text = re.sub(pattern, " ", text)
+    words = f" {_fold(text)} ".replace(f" {variant} ", " ").split()
+    return [w for w in words if w not in QUERY_STOPWORDS and w not in FACT_FILLER_WORDS]
 
+def fact_lookup(query: str, search_results: list[dict], DOCUMENTS=None) -> dict | None:
+    """
+    {"poi_id", "attributes", "answer"} when the question is a plain attribute
+    lookup about the top retrieved POI, else None. With DOCUMENTS, names shared
+    by several POIs do not count as a match.
+    """
+    if not search_results or len(split_subqueries(query)) > 1:
+        return None
+    text = query.strip().lower()
+    if re.search(FACT_EXCLUDE_PATTERN, text):
+        return None
+    asked = [(attribute, fields) for pattern, attribute, fields in FACT_ATTRIBUTE_RULES if re.search(pattern, text)]
+    doc = search_results[0]
+    variant = poi_named_in(query, doc, name_counts(DOCUMENTS) if DOCUMENTS is not None else None) if asked else None
+    if not variant or _fact_residue(text, variant):
+        return None
+    name = str(doc["name"]).split(";")[0]
+    lines = []
+    for attribute, fields in asked:
+        value = _fact_value(doc, attribute, fields)
+        if value is None:
+            return None
+        lines.append(FACT_TEMPLATES[attribute].format(name=name, value=value))
+    return {"poi_id": doc["id"], "attributes": [a for a, _ in asked], "answer": "\n\n".join(lines)}
 
-def rrf_search(qdrant_client,query: str, limit: int = 1) -> list[models.ScoredPoint]:
-    results = qdrant_client.query_points(
-        collection_name="hybrid_search",
+# Searches go through the alias that index_versions.py moves between index versions.
+COLLECTION_ALIAS = os.getenv("QDRANT_COLLECTION_ALIAS", "hybrid_search")
+
+# Retrieval parameters: fused results per query (the documents in the prompt),
+# candidates prefetched per branch, fusion method and dense HNSW ef (None = the
+# collection profile's). The defaults are what the search always did: 5
+# candidates per branch and Qdrant's default of 10 fused results.
+# tune_retrieval.py writes tuned values to RAG_RETRIEVAL_CONFIG.
+DEFAULT_RETRIEVAL_CONFIG = {"limit": 10, "dense_prefetch": 5, "sparse_prefetch": 5, "fusion": "rrf", "hnsw_ef": None}
+RETRIEVAL_CONFIG_PATH = os.getenv(
+    "RAG_RETRIEVAL_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "retrieval_config.json"))
+FUSION_METHODS = {"rrf": models.Fusion.RRF, "dbsf": models.Fusion.DBSF}
+
+def load_retrieval_config(path: str = RETRIEVAL_CONFIG_PATH) -> dict:
+    config = dict(DEFAULT_RETRIEVAL_CONFIG)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            config.update(json.load(f)["config"])
+    if config["fusion"] not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion '{config['fusion']}' in {path}. Available: {sorted(FUSION_METHODS)}")
+    return config
+
+RETRIEVAL_CONFIG = load_retrieval_config()
+
+def _rrf_query(query: str, limit: int | None, query_filter, collection_name: str, profile: str | None,
+               config: dict | None = None, dense_vector: list[float] | None = None,
+               embedding_model: str | None = None) -> dict:
+    """query_points arguments shared by the sync and async search (dense_vector: precomputed by embedding_service)."""
+    config = config or RETRIEVAL_CONFIG
+    dense = embedding_models.get_model(embedding_model)
+    # configured depths as given; an explicit limit above them deepens the branches to match
+    dense_depth, sparse_depth = (max(config[f"{branch}_prefetch"], limit or 0) for branch in ("dense", "sparse"))
+    limit = limit or config["limit"]
+    dense_params = collection_profiles.search_params(collection_profiles.get_profile(profile))
+    if config["hnsw_ef"] is not None:
+        dense_params = models.SearchParams(hnsw_ef=config["hnsw_ef"],
+                                           quantization=dense_params.quantization if dense_params else None)
+    return dict(
+        collection_name=collection_name,
         prefetch=[
             models.Prefetch(
-                query=models.Document(
+                query=dense_vector if dense_vector is not None else models.Document(
                     text=query,
-                    model="jinaai/jina-embeddings-v2-small-en",
+                    model=dense["model"],
                 ),
-                using="jina-small",
-                limit=(5 * limit),
+                using=dense["vector_name"],
+                filter=query_filter,
+                params=dense_params,
+                limit=dense_depth,
             ),
             models.Prefetch(
                 query=models.Document(
                     text=query,
-                    model="Qdrant/bm25",
+                    model=embedding_models.SPARSE_MODEL,
                 ),
-                using="bm25",
-                limit=(5 * limit),
+                using=embedding_models.SPARSE_VECTOR_NAME,
+                filter=query_filter,
+                limit=sparse_depth,
             ),
         ],
         # Fusion query enables fusion on the prefetched results
-        query=models.FusionQuery(fusion=models.Fusion.RRF),
+        query=models.FusionQuery(fusion=FUSION_METHODS[config["fusion"]]),
+        limit=limit,
         with_payload=True,
     )
 
+def rrf_search(qdrant_client,query: str, limit: int | None = None, query_filter=None,
+               collection_name: str = COLLECTION_ALIAS, profile: str | None = None,
+               config: dict | None = None, embedding_model: str | None = None) -> list[models.ScoredPoint]:
+    """embedding_model: registry name (embedding_models.py) of the collection's dense vector; default the served one."""
+    # the batching service embeds with the served model only
+    batched = embedding_service.BATCHING_ENABLED and \
+        embedding_models.get_model(embedding_model)["model"] == embedding_service.SERVICE.model_name
+    dense_vector = embedding_service.SERVICE.embed(query) if batched else None
+    results = qdrant_client.query_points(**_rrf_query(query, limit, query_filter, collection_name, profile, config,
+                                                      dense_vector, embedding_model))
+
     return results.points
 
+# --- Async pipeline ----------------------------------------------------------
+# Per-provider concurrency limits, shared by all sessions served by one event loop.
+PROVIDER_CONCURRENCY = {
+    "qdrant": int(os.getenv("RAG_MAX_CONCURRENT_QDRANT", "16")),
+    "gemini": int(os.getenv("RAG_MAX_CONCURRENT_GEMINI", "8")),
+    "openai": int(os.getenv("RAG_MAX_CONCURRENT_OPENAI", "8")),
+}
+
+# asyncio primitives and the async provider clients belong to one loop: the
+# API workers run on theirs, the sync wrappers (rag, answer_query, judge_label,
+# judging.BATCHER) share one long-lived loop in a daemon thread (run_sync), so
+# the gemini grpc-aio client, which google.generativeai caches per process,
+# always runs on the loop it was created on.
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+_openai_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+_sync_loop: asyncio.AbstractEventLoop | None = None
+_sync_loop_lock = threading.Lock()
+
+def provider_semaphore(provider: str) -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    per_loop = _semaphores.setdefault(loop, {})
+    if provider not in per_loop:
+        per_loop[provider] = asyncio.Semaphore(PROVIDER_CONCURRENCY[provider])
+    return per_loop[provider]
+
+def _openai_client(api_key: str | None = None):
+    """The AsyncOpenAI client of the running loop for this key, created once."""
+    from openai import AsyncOpenAI
+
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    per_loop = _openai_clients.setdefault(asyncio.get_running_loop(), {})
+    if api_key not in per_loop:
+        per_loop[api_key] = AsyncOpenAI(api_key=api_key)
+    return per_loop[api_key]
+
+async def close_clients() -> None:
+    """Close the AsyncOpenAI clients of the running loop (at worker shutdown)."""
+    for client in _openai_clients.pop(asyncio.get_running_loop(), {}).values():
+        await client.close()
+
+def run_sync(coro):
+    """Run a coroutine on the shared background loop and wait for its result."""
+    global _sync_loop
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        coro.close()
+        raise RuntimeError("run_sync() cannot be called from a running event loop; await the coroutine")
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name="rag-sync-loop", daemon=True).start()
+            atexit.register(_close_sync_clients)
+    return asyncio.run_coroutine_threadsafe(coro, _sync_loop).result()
+
+def _close_sync_clients() -> None:
+    # answers still queued for the judge need the clients
+    judging.BATCHER.drain()
+    run_sync(close_clients())
+
+async def rrf_search_async(qdrant_client, query: str, limit: int | None = None, query_filter=None,
+                           collection_name: str = COLLECTION_ALIAS, profile: str | None = None) -> list[models.ScoredPoint]:
+    """Uses AsyncQdrantClient natively; a sync client is run in a worker thread."""
+    from qdrant_client import AsyncQdrantClient
+    async with provider_semaphore("qdrant"):
+        if isinstance(qdrant_client, AsyncQdrantClient):
+            dense_vector = await embedding_service.SERVICE.embed_async(query) if embedding_service.BATCHING_ENABLED else None
+            results = await qdrant_client.query_points(**_rrf_query(query, limit, query_filter, collection_name, profile,
+                                                                    dense_vector=dense_vector))
+            return results.points
+        return await asyncio.to_thread(rrf_search, qdrant_client, query, limit, query_filter, collection_name, profile)
+
+# --- Adaptive retrieval planner ----------------------------------------------
+# Dense (jina-small) inference is the expensive part of a search. A question
+# that names exactly one POI takes the exact-name path: that POI first, the
+# rest of the context from BM25 alone. A short keyword query with a rare
+# indexed term takes the sparse-only path. "Places like X" / "near X" go to
+# the POI graph (see GRAPH_RELATION_PATTERNS). Everything else, and anything
+# comparative or open-ended (FACT_EXCLUDE_PATTERN), uses the hybrid fusion.
+# benchmark_planner.py reports the routing mix and the quality delta on the
+# ground-truth set.
+PLANNER_ENABLED = os.getenv("RAG_RETRIEVAL_PLANNER", "1") == "1"
+PLANNER_MAX_TERMS = int(os.getenv("RAG_PLANNER_MAX_TERMS", "4"))
+PLANNER_MIN_IDF = float(os.getenv("RAG_PLANNER_MIN_IDF", "3.0"))
+QUERY_STOPWORDS = frozenset(
+    "a an and any are at be by can do does for from how i in is it its me my of on or "
+    "the there this to what when where which who with you krakow".split()
+)
+RETRIEVAL_ROUTES: dict = {"hybrid": 0, "sparse": 0, "exact_name": 0, "graph": 0}
+
+# "similar to X" / "near X" naming one POI: X and its neighbours from the
+# precomputed graph (poi_graph.py), no query embedding. RAG_GRAPH_EXPAND > 0
+# appends that many similar neighbours of each sub-query's top hit.
+GRAPH_ENABLED = os.getenv("RAG_POI_GRAPH", "1") == "1"
+GRAPH_EXPAND = int(os.getenv("RAG_GRAPH_EXPAND", "0"))
+GRAPH_RELATION_PATTERNS = {
+    "similar": r"\b(similar to|(?<!would )(?<!'d )(?<!i )like(?! to\b)|resembl\w*|comparable to|alternatives? to)\b",
+    "near": r"\b(near|nearby|close to|around|next to|walking distance (of|from))\b",
+}
+
+_planner_index: dict = {}
+
+def planner_index(DOCUMENTS) -> dict:
+    """Unambiguous POI names, the records behind every name, and the BM25 IDF of the indexed text; computed once per document set."""
+    if _planner_index.get("documents") is not DOCUMENTS:
+        import math
+        import ingest
+
+        counts = name_counts(DOCUMENTS)
+        # "planty" is part of "bienczyckie planty": only whole names identify a POI
+        contained = set()
+        for variant in counts:
+            words = variant.split()
+            contained.update(" ".join(words[i:j]) for i in range(len(words)) for j in range(i + 1, len(words) + 1)
+                             if j - i < len(words))
+        names, carriers, document_frequency, total = {}, {}, {}, 0
+        for doc in DOCUMENTS:
+            total += 1
+            for variant in set(_name_variants(doc)):
+                if len(variant) >= 4:
+                    carriers.setdefault(variant, []).append(doc)
+                if len(variant) >= 4 and counts[variant] == 1 and variant not in contained:
+                    names[variant] = doc["id"]
+            for term in set(_fold(ingest.point_text(doc)).split()):
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+        idf = {term: math.log((total - df + 0.5) / (df + 0.5) + 1) for term, df in document_frequency.items()}
+        _planner_index.update(documents=DOCUMENTS, names=names, carriers=carriers, idf=idf,
+                              max_name_words=max((len(v.split()) for v in names), default=0),
+                              max_carrier_words=max((len(v.split()) for v in carriers), default=0))
+    return _planner_index
+
+def _named_pois(tokens: list[str], index: dict) -> set:
+    """Ids of the POIs whose full name appears in the tokens (longest match first)."""
+    found, i = set(), 0
+    while i < len(tokens):
+        for n in range(min(index["max_name_words"], len(tokens) - i), 0, -1):
+            poi_id = index["names"].get(" ".join(tokens[i:i + n]))
+            if poi_id is not None:
+                found.add(poi_id)
+                i += n
+                break
+        else:
+            i += 1
+    return found
+
+def _graph_plan(query: str, index: dict) -> dict | None:
+    """A graph route when the question asks for places like / near exactly one POI named after the relation."""
+    import poi_graph
+
+    graph = poi_graph.load()
+    if graph is None:
+        return None
+    lowered = query.lower()
+    for relation, pattern in GRAPH_RELATION_PATTERNS.items():
+        match = re.search(pattern, lowered)
+        if match:
+            named = _named_pois(_fold(query[match.end():]).split(), index)
+            if len(named) == 1 and next(iter(named)) in graph:
+                return {"route": "graph", "relation": relation, "poi_id": named.pop()}
+    return None
+
+def plan_retrieval(query: str, DOCUMENTS) -> dict:
+    """{"route": "graph" | "exact_name" | "sparse" | "hybrid", ...} for one (sub-)query."""
+    index = planner_index(DOCUMENTS)
+    if GRAPH_ENABLED:
+        graph_plan = _graph_plan(query, index)
+        if graph_plan:
+            return graph_plan
+    if re.search(FACT_EXCLUDE_PATTERN, query.lower()):
+        return {"route": "hybrid"}
+    tokens = _fold(query).split()
+    named = _named_pois(tokens, index)
+    if len(named) == 1:
+        return {"route": "exact_name", "poi_id": named.pop()}
+    terms = [t for t in tokens if t not in QUERY_STOPWORDS]
+    # a term BM25 has never seen ("Sukiennice" for the Cloth Hall) is where the dense model earns its cost
+    if not named and 0 < len(terms) <= PLANNER_MAX_TERMS and all(t in index["idf"] for t in terms):
+        # the keyword has to be name-like: question words ("hours", "type") are rare in the POI text too
+        proper = {t for word in re.findall(r"\w+", query) if word[0].isupper() for t in _fold(word).split()}
+        keywords = [t for t in terms if t in proper and index["idf"][t] >= PLANNER_MIN_IDF]
+        if keywords:
+            return {"route": "sparse", "term": max(keywords, key=index["idf"].get)}
+    return {"route": "hybrid"}
+
+def _sparse_query(query: str, limit: int | None, query_filter, collection_name: str, config: dict | None = None) -> dict:
+    return dict(
+        collection_name=collection_name,
+        query=models.Document(text=query, model=embedding_models.SPARSE_MODEL),
+        using=embedding_models.SPARSE_VECTOR_NAME,
+        query_filter=query_filter,
+        limit=limit or (config or RETRIEVAL_CONFIG)["limit"],
+        with_payload=True,
+    )
+
+def sparse_search(qdrant_client, query: str, limit: int | None = None, query_filter=None,
+                  collection_name: str = COLLECTION_ALIAS, config: dict | None = None) -> list[models.ScoredPoint]:
+    return qdrant_client.query_points(**_sparse_query(query, limit, query_filter, collection_name, config)).points
+
+async def sparse_search_async(qdrant_client, query: str, limit: int | None = None, query_filter=None,
+                              collection_name: str = COLLECTION_ALIAS) -> list[models.ScoredPoint]:
+    from qdrant_client import AsyncQdrantClient
+    async with provider_semaphore("qdrant"):
+        if isinstance(qdrant_client, AsyncQdrantClient):
+            results = await qdrant_client.query_points(**_sparse_query(query, limit, query_filter, collection_name))
+            return results.points
+        return await asyncio.to_thread(sparse_search, qdrant_client, query, limit, query_filter, collection_name)
+
+async def planned_search_async(qdrant_client, query: str, plan: dict, query_filter=None) -> list[models.ScoredPoint]:
+    if plan["route"] == "graph":
+        return graph_search(plan, None)
+    if plan["route"] == "hybrid":
+        return await rrf_search_async(qdrant_client, query, query_filter=query_filter)
+    points = await sparse_search_async(qdrant_client, query, query_filter=query_filter)
+    if plan["route"] == "exact_name":
+        named = next((p for p in points if p.id == plan["poi_id"]), None) or models.ScoredPoint(
+            id=plan["poi_id"], version=0, score=1.0)
+        return [named] + [p for p in points if p.id != plan["poi_id"]][:RETRIEVAL_CONFIG["limit"] - 1]
+    if not points:
+        # no indexed term matched after all
+        return await rrf_search_async(qdrant_client, query, query_filter=query_filter)
+    return points
+
+def split_subqueries(query: str) -> list[str]:
+    """Split a multi-question input ("Where is Wawel? When is Sukiennice open?") into sub-queries."""
+    parts = [p.strip() for p in re.split(r"(?<=[?!])\s+|\s*;\s*|\n+", query) if p.strip()]
+    parts = [p for p in parts if len(p.split()) >= 3]
+    return parts if len(parts) > 1 else [query]
+
+def graph_search(plan: dict, DOCUMENTS, constraints: dict[str, list[str]] | None = None) -> list[models.ScoredPoint]:
+    """The named POI followed by its graph neighbours that satisfy the constraints; an O(k) lookup."""
+    import poi_graph
+
+    neighbours = poi_graph.load().neighbours(plan["poi_id"], plan["relation"])
+    if constraints:
+        allowed = matching_ids(constraints, DOCUMENTS)
+        neighbours = [(i, value) for i, value in neighbours if i in allowed]
+        if not neighbours:
+            return []
+    # "near" lists carry distances: closer is better
+    score = (lambda km: 1 / (1 + km)) if plan["relation"] == "near" else (lambda value: value)
+    return [models.ScoredPoint(id=plan["poi_id"], version=0, score=1.0)] + [
+        models.ScoredPoint(id=i, version=0, score=score(value)) for i, value in neighbours[:RETRIEVAL_CONFIG["limit"] - 1]]
+
+async def _constrained_search_async(qdrant_client, query: str, DOCUMENTS=None) -> list[models.ScoredPoint]:
+    plan = plan_retrieval(query, DOCUMENTS) if PLANNER_ENABLED and DOCUMENTS is not None else {"route": "hybrid"}
+    constraints = extract_query_constraints(query)
+    if plan["route"] == "graph":
+        points = graph_search(plan, DOCUMENTS, constraints)
+        if points:
+            RETRIEVAL_ROUTES["graph"] += 1
+            return points
+        # no neighbour satisfies the constraints
+        plan = {"route": "hybrid"}
+    RETRIEVAL_ROUTES[plan["route"]] += 1
+    if constraints and DOCUMENTS is not None:
+        constraints = relax_constraints(constraints, DOCUMENTS)
+    points = await planned_search_async(qdrant_client, query, plan, query_filter=build_query_filter(constraints))
+    while constraints and not points:
+        # no local records to check the constraints against, or the search found no match anyway:
+        # drop the last field and search again, down to no filter at all
+        constraints = dict(list(constraints.items())[:-1])
+        points = await planned_search_async(qdrant_client, query, plan, query_filter=build_query_filter(constraints))
+    return points
+
+async def retrieve_async(qdrant_client, query: str, DOCUMENTS) -> list[dict]:
+    """Retrieve every sub-query concurrently and merge the hits."""
+    batches = await asyncio.gather(*(_constrained_search_async(qdrant_client, q, DOCUMENTS) for q in split_subqueries(query)))
+    points = {point.id: point for batch in batches for point in batch}
+    graph = None
+    if GRAPH_EXPAND:
+        import poi_graph
+
+        graph = poi_graph.load()
+    if graph is not None:
+        for batch in batches:
+            for neighbour, score in graph.neighbours(batch[0].id, "similar", GRAPH_EXPAND) if batch else []:
+                points.setdefault(neighbour, models.ScoredPoint(id=neighbour, version=0, score=score))
+    return filter_rrf_results(points.values(), DOCUMENTS)
+
 def build_context(search_results,entry_template):
     
     context = ""
@@ -119,17 +750,18 @@ def filter_rrf_results(results,documents):
     context_selected_ids = []
     for record in results:
         context_selected_ids.append(record.id)
+    if hasattr(documents, "get_many"):
+        # poi_store.PoiStore: id lookups, in rank order
+        return documents.get_many(context_selected_ids)
     return [doc for doc in documents if doc["id"] in context_selected_ids]
 
-def gemini_llm(prompt):
-    
-    model = genai.GenerativeModel('gemini-2.5-flash-lite')
-    response = model.generate_content(
-        prompt,
-            generation_config=genai.GenerationConfig(
-                temperature=0.0
-            )
-    )
+GEMINI_MODEL = 'gemini-2.5-flash-lite'
+GENERATION_TIMEOUT_S = float(os.getenv("RAG_GENERATION_TIMEOUT_S", "30"))
+
+class EmptyResponseError(RuntimeError):
+    """The provider answered without any text (e.g. no candidates)."""
+
+def _gemini_result(response) -> dict:
     if response.candidates and response.candidates[0].content.parts:
         answer_text = response.candidates[0].content.parts[0].text
         
@@ -160,53 +792,387 @@ def gemini_llm(prompt):
         "estimated_cost_usd": None,
         "model_name": None,
         }
+
+def gemini_llm(prompt):
     
+    genai = _genai()
+    model = genai.GenerativeModel(GEMINI_MODEL)
+    response = model.generate_content(
+        prompt,
+            generation_config=genai.GenerationConfig(
+                temperature=0.0
+            ),
+            request_options={"timeout": GENERATION_TIMEOUT_S},
+    )
+    return _gemini_result(response)
 
-def rag(st,query,DOCUMENTS, qdrant_client,OPENAI_API_KEY, prompt_template = PROMPT_TEMPLATE,entry_template = ENTRY_TEMPLATE):
-    if 'previous_answer' not in st.session_state:
-        st.session_state.previous_answer = None
-    search_results = rrf_search(qdrant_client, query)
-    search_results =filter_rrf_results(search_results, DOCUMENTS)
-    context = build_context(search_results,entry_template)
+async def gemini_llm_async(prompt, model_name=GEMINI_MODEL):
+    genai = _genai()
+    model = genai.GenerativeModel(model_name)
+    generate = model.generate_content_async
+    if os.getenv("GEMINI_API_ENDPOINT"):
+        # the REST transport used for custom endpoints has no async client
+        generate = lambda *args, **kwargs: asyncio.to_thread(model.generate_content, *args, **kwargs)
+    async with provider_semaphore("gemini"):
+        response = await generate(
+            prompt,
+            generation_config=genai.GenerationConfig(temperature=0.0),
+            request_options={"timeout": GENERATION_TIMEOUT_S},
+        )
+    return _gemini_result(response)
 
-    if st.session_state.previous_answer:
-        context += f"\n\nPrevious answer:\n{st.session_state.previous_answer}"
+async def openai_llm_async(prompt, model="gpt-4o-mini"):
+    openai_client = _openai_client()
+    async with provider_semaphore("openai"):
+        resp = await openai_client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.0)
+    usage = getattr(resp, "usage", None)
+    token_count = usage.total_tokens if usage else None
+    return {
+        "answer": resp.choices[0].message.content or "",
+        "tokens_used": token_count,
+        "input_tokens": usage.prompt_tokens if usage else None,
+        "estimated_cost_usd": token_count / 1_000_000 * router.MODELS["openai_llm"]["usd_per_mtok"] if token_count else None,
+        "model_name": resp.model,
+    }
+
+async def _call_provider(provider, model, prompt):
+    """One generation call with a timeout; feeds the router's rolling stats and circuit breaker."""
+    start = time.perf_counter()
+    try:
+        if provider == "openai":
+            call = openai_llm_async(prompt, model)
+        else:
+            call = gemini_llm_async(prompt, model)
+        answer = await asyncio.wait_for(call, GENERATION_TIMEOUT_S)
+        if not answer["answer"]:
+            raise EmptyResponseError(f"{provider}/{model} returned no text")
+    except Exception:
+        router.record(provider, time.perf_counter() - start, ok=False)
+        raise
+    router.record(provider, time.perf_counter() - start, ok=True)
+    return answer
+
+async def generate_async(decision, prompt):
+    """
+    Call the generator chosen by router.choose. If it has not answered within
+    router.hedge_delay (or failed), the same prompt goes to decision["hedge"];
+    the first answer wins and the other call is cancelled. The outcome is
+    added to the decision ("hedged", "winner").
+    """
+    router.count("requests")
+    primary = asyncio.create_task(_call_provider(decision["provider"], decision["model"], prompt))
+    hedge = decision.get("hedge")
+    decision.update({"hedged": False, "winner": decision["route"]})
+    if not hedge:
+        try:
+            return await primary
+        except Exception:
+            router.count("failed")
+            raise
+
+    done, _ = await asyncio.wait({primary}, timeout=router.hedge_delay(decision["provider"]))
+    if primary in done and primary.exception() is None:
+        return primary.result()
+
+    router.count("hedged")
+    decision["hedged"] = True
+    secondary = asyncio.create_task(_call_provider(hedge["provider"], hedge["model"], prompt))
+    pending = {secondary} if primary in done else {primary, secondary}
+    error = primary.exception() if primary in done else None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                if task is secondary:
+                    decision["winner"] = hedge["route"]
+                    router.count("failovers" if primary.done() and primary.exception() else "hedge_wins")
+                return task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+    router.count("failed")
+    raise error
+
+# "Plan my day around Wawel, Wierzynek and the Barbican" / "a walking
+# itinerary for Saturday" (ITINERARY_PATTERN), or a visit / route question
+# (ITINERARY_VISIT_PATTERN) that names two or more POIs ("a route visiting
+# Wawel, Barbakan and Sukiennice") or a number of places ("visit 5 museums and
+# lunch in Kazimierz"). The stops are the named POIs, else that many top hits
+# (RAG_ITINERARY_STOPS without a number). itinerary.py orders them over the
+# walking-time matrix within their opening hours, and the prompt gets that plan
+# instead of the stops' raw geometry.
+ITINERARY_ENABLED = os.getenv("RAG_ITINERARY", "1") == "1"
+ITINERARY_STOPS = int(os.getenv("RAG_ITINERARY_STOPS", "6"))
+ITINERARY_MAX_STOPS = 15
+ITINERARY_PATTERN = (r"\b(itinerar(y|ies)|day plan|plan (a|my|the|our) (day|trip|tour|visit|route|walk)|"
+                     r"walking (tour|route)|in (what|which) order|route (through|between|covering))\b")
+ITINERARY_VISIT_PATTERN = r"\b(visit(ing)?|see(ing)?|route|tour|go(ing)? to|stop(ping)? at|explor(e|ing))\b"
+ITINERARY_COUNT_PATTERN = (r"\b(\d{1,2}|two|three|four|five|six|seven|eight|nine|ten|a few|several) (\w+ ){0,2}?"
+                           r"(museums|places|sights|attractions|churches|galleries|parks|gardens|monuments|"
+                           r"landmarks|castles|stops|spots)\b")
+NUMBER_WORDS = {"two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+ITINERARY_GEOMETRY = "(see the walking plan)"
+
+def _itinerary_count(text: str) -> int | None:
+    """Number of places asked for ("5 museums", "a few sights"), None when no count is given."""
+    match = re.search(ITINERARY_COUNT_PATTERN, text)
+    if not match:
+        return None
+    word = match.group(1)
+    count = int(word) if word.isdigit() else NUMBER_WORDS.get(word, ITINERARY_STOPS)
+    return min(max(count, 2), ITINERARY_MAX_STOPS)
+
+def _mentioned_pois(query: str, search_results: list[dict], DOCUMENTS) -> list[dict]:
+    """
+    POIs named in the question, in order, longest name first. Unlike
+    _named_pois, a name that is part of a longer one ("Sukiennice") or shared
+    by several POIs ("Wawel") counts too: it goes to the best-ranked hit
+    carrying it, else the first such record.
+    """
+    index = planner_index(DOCUMENTS)
+    rank = {doc["id"]: n for n, doc in enumerate(search_results)}
+    tokens, found, i = _fold(query).split(), {}, 0
+    while i < len(tokens):
+        for n in range(min(index["max_carrier_words"], len(tokens) - i), 0, -1):
+            carriers = index["carriers"].get(" ".join(tokens[i:i + n]))
+            if carriers:
+                doc = min(carriers, key=lambda d: rank.get(d["id"], len(rank)))
+                found.setdefault(doc["id"], doc)
+                i += n
+                break
+        else:
+            i += 1
+    return list(found.values())
+
+def plan_itinerary(query: str, search_results: list[dict], DOCUMENTS) -> tuple[dict | None, list[dict]]:
+    """(tour plan or None, context documents with the planned stops first) for an itinerary question."""
+    lowered = query.lower()
+    explicit = re.search(ITINERARY_PATTERN, lowered)
+    if not ITINERARY_ENABLED or DOCUMENTS is None or not (explicit or re.search(ITINERARY_VISIT_PATTERN, lowered)):
+        return None, search_results
+    named = _mentioned_pois(query, search_results, DOCUMENTS)
+    count = _itinerary_count(lowered)
+    if not explicit and ((len(named) < 2 and count is None) or re.search(r"\b(or|versus|vs)\b", lowered)):
+        # "Should I visit Wawel or Barbakan?" asks for a choice, not a tour
+        return None, search_results
+    if len(named) >= 2:
+        stops = named
+    else:
+        stops = search_results[:count or ITINERARY_STOPS]
+    if len(stops) < 2:
+        return None, search_results
+    import itinerary
+
+    planned = {doc["id"] for doc in stops}
+    return itinerary.plan_tour(stops[:ITINERARY_MAX_STOPS], itinerary.parse_start(query)), stops + [
+        doc for doc in search_results if doc["id"] not in planned]
+
+def new_conversation_state() -> dict:
+    """Per-conversation state carried between turns; JSON-serializable."""
+    return memory.new_memory()
+
+async def draft_answer_async(query, DOCUMENTS, qdrant_client, conversation_state=None,
+                             prompt_template = None, entry_template = ENTRY_TEMPLATE,
+                             max_cost_usd = None, latency_slo_s = None):
+    """
+    Retrieval + generation only. The returned results carry the judge context
+    under "context" and no labels yet; finish them with evaluate_results_async,
+    which can run after the answer has been shown. The generator (and, unless
+    prompt_template is given, the prompt variant) is picked by router.choose;
+    the decision is returned under "routing". Returns (results, conversation_state).
+    """
+    state = conversation_state or new_conversation_state()
+    started = time.perf_counter()
+    search_results = await retrieve_async(qdrant_client, query, DOCUMENTS)
+    plan, search_results = plan_itinerary(query, search_results, DOCUMENTS)
+    fact = fact_lookup(query, search_results, DOCUMENTS) if FAST_PATH_ENABLED and plan is None else None
+    if fact:
+        results = fast_path_results(query, fact, search_results, time.perf_counter() - started)
+        return results, memory.add_turn(state, query, fact["answer"], search_results)
+    judge_context = search_results
+    if plan is None:
+        context = build_context(search_results,entry_template)
+    else:
+        # the LLM gets the computed tour, not coordinates to reason about
+        import itinerary
+
+        plan_text = itinerary.format_plan(plan)
+        context = plan_text + "\n\n" + build_context([{**doc, "geometry": ITINERARY_GEOMETRY} for doc in search_results],
+                                                    entry_template)
+        judge_context = search_results + [{"id": "itinerary", "walking_plan": plan_text}]
+
+    # prior turns go to the generator only; the judge grades against the retrieved context
+    history = memory.render(state)
+    prompt_context = f"{context}\n\nConversation so far:\n{history}" if history else context
     
-    prompt = build_prompt(prompt_template,query, context)
-    answer = gemini_llm(prompt)
+    input_tokens = router.estimate_tokens(build_prompt(prompt_template or PROMPT_TEMPLATE, query, prompt_context))
+    decision = router.choose(input_tokens, max_cost_usd, latency_slo_s)
+    if prompt_template is None:
+        prompt_template = PROMPT_VARIANTS[decision["prompt"]]
+    else:
+        decision["prompt"] = "custom"
+    prompt = build_prompt(prompt_template,query, prompt_context)
+    # process-wide generation limit; raises admission.AdmissionRejected when shed
+    async with admission.slot("generation"):
+        answer = await generate_async(decision, prompt)
 
-    labels, judge_stats = judge_label(query, context, answer["answer"], OPENAI_API_KEY)
-    score = quality_score_from_labels(labels)
     results = {
         "question": query,
         "answer": answer['answer'],
-        "quality_score": score,
+        "quality_score": None,
+        "faithfulness": None,
+        "groundedness": None,
+        "relevance": None,
+        "completeness": None,
+        "coherence": None,
+        "conciseness": None,
+        "tokens_used": answer["tokens_used"],
+        "input_tokens": answer["input_tokens"],
+        "estimated_cost_usd": answer["estimated_cost_usd"],
+        "model_name": answer["model_name"],
+        "eval_tokens_used": None,
+        "eval_input_tokens": None,
+        "eval_estimated_cost_usd": None,
+        "routing": decision,
+        "context_ids": [doc["id"] for doc in search_results],
+        "eval_status": None,
+        "context": judge_context,
+    }
+
+    state = memory.add_turn(state, query, answer["answer"], search_results)
+    return results, state
+
+def fast_path_results(query, fact, search_results, latency_s):
+    """Results of a templated fact answer, shaped like draft_answer_async's; never judged."""
+    return {
+        "question": query,
+        "answer": fact["answer"],
+        "quality_score": None,
+        "faithfulness": None,
+        "groundedness": None,
+        "relevance": None,
+        "completeness": None,
+        "coherence": None,
+        "conciseness": None,
+        "tokens_used": 0,
+        "input_tokens": 0,
+        "estimated_cost_usd": 0.0,
+        "model_name": "fast_path",
+        "eval_tokens_used": None,
+        "eval_input_tokens": None,
+        "eval_estimated_cost_usd": None,
+        "routing": {
+            "route": "fast_path",
+            "reason": "fact_lookup",
+            "attributes": fact["attributes"],
+            "poi_id": fact["poi_id"],
+            "latency_s": latency_s,
+            "decided_at": time.time(),
+        },
+        "context_ids": [doc["id"] for doc in search_results],
+        "eval_status": "fast_path",
+        "context": search_results,
+    }
+
+def apply_judgement(results, labels, judge_stats, status="sampled"):
+    if labels is None:
+        # left out of the judge's reply: not judged, rather than judged 0
+        results["eval_status"] = "judge_failed"
+        return results
+    results.update({
+        "quality_score": quality_score_from_labels(labels),
         "faithfulness": labels.get("faithfulness"),
         "groundedness": labels.get("groundedness"),
         "relevance": labels.get("relevance"),
         "completeness": labels.get("completeness"),
         "coherence": labels.get("coherence"),
         "conciseness": labels.get("conciseness"),
-        "tokens_used": answer["tokens_used"],
-        "input_tokens": answer["input_tokens"],
-        "estimated_cost_usd": answer["estimated_cost_usd"],
-        "model_name": answer["model_name"],
         "eval_tokens_used": judge_stats["total_tokens"],
         "eval_input_tokens": judge_stats["prompt_tokens"],
         "eval_estimated_cost_usd": judge_stats["estimated_cost_usd"],
+        "eval_status": status,
+    })
+    return results
 
-    }
+async def evaluate_batch_async(results_list, OPENAI_API_KEY, status="sampled"):
+    """
+    Judge drafted answers with one judge request, in place. The judge context
+    is the "context" key (dropped) or the documents behind "context_ids".
+    """
+    items = [{"question": r["question"], "answer": r["answer"],
+              "context": r.pop("context", None) or judging.context_docs(r.get("context_ids", []))}
+             for r in results_list]
+    labels, judge_stats = await judge_batch_async(items, OPENAI_API_KEY)
+    for results, item_labels in zip(results_list, labels):
+        apply_judgement(results, item_labels, judge_stats, status)
+    return results_list
+
+async def evaluate_results_async(results, OPENAI_API_KEY):
+    """Judge a drafted answer in place (drops the "context" key) and return it."""
+    await evaluate_batch_async([results], OPENAI_API_KEY)
+    return results
+
+async def answer_query_async(query, DOCUMENTS, qdrant_client, OPENAI_API_KEY, conversation_state=None,
+                             prompt_template = None, entry_template = ENTRY_TEMPLATE,
+                             max_cost_usd = None, latency_slo_s = None, evaluate = None):
+    """
+    Stateless RAG pipeline: the conversation state is passed in and the updated
+    state returned, so it can run outside Streamlit (API workers, benchmarks).
+    evaluate=None judges according to the sampling policy in judging.py.
+    Returns (results, conversation_state).
+    """
+    results, state = await draft_answer_async(query, DOCUMENTS, qdrant_client, conversation_state,
+                                              prompt_template, entry_template, max_cost_usd, latency_slo_s)
+    if results["eval_status"] == "fast_path":
+        evaluate = False
+    elif evaluate is None:
+        evaluate = judging.should_evaluate(results)
+    if evaluate:
+        await evaluate_results_async(results, OPENAI_API_KEY)
+    else:
+        results.pop("context", None)
+        if results["eval_status"] != "fast_path":
+            results["eval_status"] = "skipped"
+    return results, state
 
- 
+def answer_query(query, DOCUMENTS, qdrant_client, OPENAI_API_KEY, conversation_state=None,
+                 prompt_template = None, entry_template = ENTRY_TEMPLATE,
+                 max_cost_usd = None, latency_slo_s = None, evaluate = None):
+    """Blocking wrapper around answer_query_async."""
+    return run_sync(answer_query_async(query, DOCUMENTS, qdrant_client, OPENAI_API_KEY, conversation_state,
+                                          prompt_template, entry_template, max_cost_usd, latency_slo_s, evaluate))
 
-    st.session_state.previous_answer = answer
+def rag(st,query,DOCUMENTS, qdrant_client,OPENAI_API_KEY, prompt_template = None,entry_template = ENTRY_TEMPLATE,
+        evaluate: bool = True):
+    """
+    Streamlit wrapper around the pipeline keeping the state in st.session_state.
+    With evaluate=True the answer is judged if the sampling policy picks it
+    (judging.should_evaluate); with evaluate=False it comes back unjudged
+    (see draft_answer_async).
+    """
+    if 'conversation_state' not in st.session_state:
+        st.session_state.conversation_state = new_conversation_state()
+    state = st.session_state.conversation_state
+    if evaluate:
+        results, state = answer_query(query, DOCUMENTS, qdrant_client, OPENAI_API_KEY, state,
+                                      prompt_template, entry_template)
+    else:
+        results, state = run_sync(draft_answer_async(query, DOCUMENTS, qdrant_client, state,
+                                                        prompt_template, entry_template))
+    st.session_state.conversation_state = state
     return results
 
     
 
 JUDGE_PROMPT_TEMPLATE = """
-You are an evaluator. Your task is to classify the quality of the answer provided by a RAG system.
-Return ONLY JSON with labels (no extra text). Use one of the allowed labels for each criterion.
+You are an evaluator. Your task is to classify the quality of the answers provided by a RAG system.
+Use one of the allowed labels for each criterion.
 
 Faithfulness: ["NON_FAITHFUL","PARTLY_FAITHFUL","FAITHFUL"]
 Groundedness: ["NON_GROUNDED","PARTLY_GROUNDED","GROUNDED"]
@@ -215,49 +1181,115 @@ Completeness: ["NON_COMPLETE","PARTLY_COMPLETE","COMPLETE"]
 Coherence: ["NON_COHERENT","PARTLY_COHERENT","COHERENT"]
 Conciseness: ["NON_CONCISE","PARTLY_CONCISE","CONCISE"]
 
-Question: {question}
+Places (the context; items refer to them by [id]):
+{places}
+
+{items}
+
+Label every item separately, using only the places it refers to as its context.
+"""
+
+JUDGE_ITEM_TEMPLATE = """Item {item}
 Context: {context}
+Question: {question}
 Answer: {answer}
-
-Return JSON exactly like:
-{{"faithfulness":"...", "groundedness":"...", "relevance":"...", "completeness":"...", "coherence":"...", "conciseness":"..."}}
 """
 
-def judge_label(question, context, answer,OPENAI_API_KEY):
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
-    prompt = JUDGE_PROMPT_TEMPLATE.format(question=question, context=context, answer=answer)
-    resp = openai_client.chat.completions.create(
-        model="gpt-4o-mini",  # LLM-sędzia
-        messages=[{"role":"user","content":prompt}],
-        temperature=0.0)
-    # Collect usage statistics if available
-    usage = getattr(resp, "usage", None)
-    stats = {
-        "prompt_tokens": usage.prompt_tokens if usage else None,
-        "total_tokens": usage.total_tokens if usage else None,
+JUDGE_MODEL = "gpt-4o-mini"
+JUDGE_LABELS = {
+    "faithfulness": ["NON_FAITHFUL", "PARTLY_FAITHFUL", "FAITHFUL"],
+    "groundedness": ["NON_GROUNDED", "PARTLY_GROUNDED", "GROUNDED"],
+    "relevance": ["NON_RELEVANT", "PARTLY_RELEVANT", "RELEVANT"],
+    "completeness": ["NON_COMPLETE", "PARTLY_COMPLETE", "COMPLETE"],
+    "coherence": ["NON_COHERENT", "PARTLY_COHERENT", "COHERENT"],
+    "conciseness": ["NON_CONCISE", "PARTLY_CONCISE", "CONCISE"],
+}
+# Structured output: the API guarantees this shape, so no free-text parsing.
+JUDGE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "judgements",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"items": {"type": "array", "items": {
+                "type": "object",
+                "properties": {"item": {"type": "integer"},
+                               **{crit: {"type": "string", "enum": labels} for crit, labels in JUDGE_LABELS.items()}},
+                "required": ["item", *JUDGE_LABELS],
+                "additionalProperties": False,
+            }}},
+            "required": ["items"],
+            "additionalProperties": False,
+        },
+    },
+}
 
-    }
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and value != value) or \
+        str(value).strip().lower() in ("", "no information", "nan")
 
-    # Calculate cost (example: $5 per million tokens for GPT-4o-mini, adjust as needed)
+def compact_place(doc) -> str:
+    """One line per POI with only the fields that carry information."""
+    fields = "; ".join(f"{k}: {v}" for k, v in doc.items() if k != "id" and not _is_missing(v))
+    return f"[{doc['id']}] {fields}"
+
+def build_judge_prompt(items):
+    """
+    items: dicts with question, answer and context - a list of POI documents
+    (shared places are sent once and referenced by id) or plain context text.
+    """
+    places = {}
+    rendered = []
+    for n, item in enumerate(items, start=1):
+        context = item.get("context") or []
+        if isinstance(context, str):
+            ref = context
+        else:
+            for doc in context:
+                places.setdefault(doc["id"], compact_place(doc))
+            ref = ", ".join(f"[{doc['id']}]" for doc in context) or "none"
+        rendered.append(JUDGE_ITEM_TEMPLATE.format(item=n, context=ref, question=item["question"], answer=item["answer"]))
+    return JUDGE_PROMPT_TEMPLATE.format(places="\n".join(places.values()) or "(none)", items="\n".join(rendered))
+
+def _judge_result(resp, n_items):
+    """
+    Per-item labels (in item order, None for an item the reply left out) and
+    per-item usage; the batch usage is split evenly.
+    """
+    usage = getattr(resp, "usage", None)
     cost = None
     if usage and usage.total_tokens is not None:
         cost = usage.total_tokens / 1_000_000 * 4
+    stats = {
+        "prompt_tokens": usage.prompt_tokens // n_items if usage else None,
+        "total_tokens": usage.total_tokens // n_items if usage else None,
+        "estimated_cost_usd": cost / n_items if cost is not None else None,
+    }
 
-    stats["estimated_cost_usd"] = cost
+    by_item = {entry.pop("item"): entry for entry in json.loads(resp.choices[0].message.content)["items"]}
+    return [by_item.get(n) for n in range(1, n_items + 1)], stats
 
-    text = resp.choices[0].message.content.strip()
+async def judge_batch_async(items, OPENAI_API_KEY):
+    """Judge several (question, answer, context) items in one request. Returns (labels list, per-item stats)."""
+    openai_client = _openai_client(OPENAI_API_KEY)
+    async with admission.slot("judge"), provider_semaphore("openai"):
+        resp = await openai_client.chat.completions.create(
+            model=JUDGE_MODEL,
+            messages=[{"role": "user", "content": build_judge_prompt(items)}],
+            response_format=JUDGE_RESPONSE_FORMAT,
+            temperature=0.0)
+    return _judge_result(resp, len(items))
 
-    text = re.sub(r"```json|```", "", text).strip()
-    
-    try:
-        labels = json.loads(text)
-    except json.JSONDecodeError:
-        try:
-            labels = eval(text)
-        except Exception as e:
-            print("Failed to parse JSON from model response:", repr(text))
-            raise e
-    return labels,stats
+def judge_label(question, context, answer,OPENAI_API_KEY):
+    return run_sync(judge_label_async(question, context, answer, OPENAI_API_KEY))
+
+async def judge_label_async(question, context, answer, OPENAI_API_KEY):
+    labels, stats = await judge_batch_async(
+        [{"question": question, "context": context, "answer": answer}], OPENAI_API_KEY)
+    if labels[0] is None:
+        raise ValueError("The judge reply has no labels for the answer")
+    return labels[0], stats
 
 POSITIVE_MAPPING = {
     "faithfulness": "FAITHFUL",
@@ -0,0 +1,139 @@
+"""
+HTTP API around the stateless RAG core (rag.answer_query).
+
+    python travel_assistant/rag_api.py --port 8000 --workers 4 [--reindex]
+
+POST /v1/answer   {"question": "...", "conversation_state": {...} | null,
+                   "max_cost_usd": 0.01, "latency_slo_s": 8,   (limits optional, see router.py)
+                   "session_id": "...",   (rate-limit key, default: client address)
+                   "evaluate": false}     (true: judge inline if sampled, see judging.py)
+               -> {"result": {...}, "conversation_state": {...}}
+                  By default the result is the unjudged draft (eval_status null,
+                  judge context under "context"): the caller samples and queues
+                  it on judging.BATCHER, so no request waits for the judge.
+                  429 / 503 with Retry-After and {"admission": {...}} when shed (admission.py)
+GET  /health      200 once the worker is warm, 503 while warming up;
+                  includes hedge counters, circuit breaker states, retrieval routes,
+                  the query embedding batch histograms and admission counters
+
+The conversation state travels with every request, so any worker can serve
+any turn. Requests run through the async pipeline (rag.draft_answer_async) on
+one event loop per worker, bounded by rag.PROVIDER_CONCURRENCY. With
+--workers N the listening socket is shared by N forked worker processes;
+--reindex publishes a new index version (index_versions.ensure_index) once,
+before forking, if the data changed; the alias keeps serving the old one meanwhile.
+The POI neighbour graph is rebuilt with it (poi_graph.ensure_graph).
+"""
+import os
+import json
+import asyncio
+import argparse
+import tornado.web
+import tornado.netutil
+import tornado.process
+import tornado.httpserver
+from dotenv import load_dotenv
+import warmup
+import router
+
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+
+class HealthHandler(tornado.web.RequestHandler):
+    def initialize(self, wu: warmup.Warmup):
+        self.wu = wu
+
+    def get(self):
+        if not self.wu.ready.is_set():
+            self.set_status(503)
+            self.write({"status": "warming_up"})
+        elif self.wu.error is not None:
+            self.set_status(503)
+            self.write({"status": "error", "error": repr(self.wu.error)})
+        else:
+            import rag
+            self.write({"status": "ready", "pid": os.getpid(), "timings": self.wu.timings, "routing": router.health(),
+                        "retrieval_routes": rag.RETRIEVAL_ROUTES, "embedding": rag.embedding_service.stats(),
+                        "admission": rag.admission.stats()})
+
+class AnswerHandler(tornado.web.RequestHandler):
+    def initialize(self, wu: warmup.Warmup):
+        self.wu = wu
+
+    async def post(self):
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except json.JSONDecodeError:
+            raise tornado.web.HTTPError(400, reason="Body must be JSON")
+        question = (body.get("question") or "").strip()
+        if not question:
+            raise tornado.web.HTTPError(400, reason="'question' is required")
+        if not self.wu.ready.is_set() or self.wu.error is not None:
+            raise tornado.web.HTTPError(503, reason="Worker is not ready")
+
+        import rag
+        try:
+            rag.admission.check_session(body.get("session_id") or self.request.remote_ip)
+            if body.get("evaluate"):
+                result, state = await rag.answer_query_async(
+                    question, self.wu.documents, self.wu.qdrant_client, OPENAI_API_KEY, body.get("conversation_state"),
+                    max_cost_usd=body.get("max_cost_usd"), latency_slo_s=body.get("latency_slo_s"),
+                )
+            else:
+                result, state = await rag.draft_answer_async(
+                    question, self.wu.documents, self.wu.qdrant_client, body.get("conversation_state"),
+                    max_cost_usd=body.get("max_cost_usd"), latency_slo_s=body.get("latency_slo_s"),
+                )
+        except rag.admission.AdmissionRejected as e:
+            self.set_status(429 if e.reason == "rate_limited" else 503)
+            self.set_header("Retry-After", str(max(1, round(e.retry_after_s))))
+            self.write({"admission": {"reason": e.reason, "retry_after_s": e.retry_after_s, "message": str(e)}})
+            return
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps({"result": result, "conversation_state": state}, default=str))
+
+def make_app(wu: warmup.Warmup) -> tornado.web.Application:
+    return tornado.web.Application([
+        (r"/health", HealthHandler, {"wu": wu}),
+        (r"/v1/answer", AnswerHandler, {"wu": wu}),
+    ])
+
+async def serve(sockets) -> None:
+    wu = warmup.Warmup(QDRANT_URL, reindex=False)
+    warm_task = asyncio.create_task(wu.run_async())  # keep a reference until done
+    server = tornado.httpserver.HTTPServer(make_app(wu))
+    server.add_sockets(sockets)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        server.stop()
+        warm_task.cancel()
+        import rag
+        await rag.close_clients()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("RAG_API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("RAG_API_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("RAG_API_WORKERS", "1")))
+    parser.add_argument("--reindex", action="store_true", help="publish a new index version before serving if the data changed")
+    args = parser.parse_args()
+
+    if args.reindex:
+        from qdrant_client import QdrantClient
+        import index_versions
+        import poi_graph
+        client = QdrantClient(url=QDRANT_URL)
+        index_versions.ensure_index(client)
+        poi_graph.ensure_graph(client)
+        client.close()
+
+    sockets = tornado.netutil.bind_sockets(args.port, address=args.host)
+    if args.workers > 1:
+        # each child continues from here with its own event loop and models
+        tornado.process.fork_processes(args.workers)
+    asyncio.run(serve(sockets))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+import admission
+import rag
+
+# When RAG_API_URL is set (e.g. http://rag-api:8000) the Streamlit front end
+# sends questions to the RAG API workers instead of running the pipeline
+# in-process; the conversation state still lives in st.session_state.
+RAG_API_URL = os.getenv("RAG_API_URL")
+RAG_API_TIMEOUT_S = float(os.getenv("RAG_API_TIMEOUT", "120"))
+
+def remote_enabled() -> bool:
+    return bool(RAG_API_URL)
+
+def answer_remote(query: str, conversation_state: Optional[Dict[str, Any]],
+                  session_id: Optional[str] = None, evaluate: bool = False) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    resp = httpx.post(
+        f"{RAG_API_URL.rstrip('/')}/v1/answer",
+        json={"question": query, "conversation_state": conversation_state, "session_id": session_id,
+              "evaluate": evaluate},
+        timeout=RAG_API_TIMEOUT_S,
+    )
+    if resp.status_code in (429, 503) and resp.headers.get("content-type", "").startswith("application/json"):
+        shed = resp.json().get("admission")
+        if shed:
+            raise admission.AdmissionRejected(shed["reason"], shed["retry_after_s"], shed["message"])
+    resp.raise_for_status()
+    body = resp.json()
+    return body["result"], body["conversation_state"]
+
+def ask(st, query: str, DOCUMENTS: Optional[List[dict]], qdrant_client, OPENAI_API_KEY: str,
+        evaluate: bool = True) -> Dict[str, Any]:
+    """
+    Same contract as rag.rag, served remotely when RAG_API_URL is configured.
+    With evaluate=False the unjudged draft comes back (judge context under
+    "context"), for the caller to queue on judging.BATCHER.
+    Raises admission.AdmissionRejected when the session is over its rate or
+    the generators are saturated.
+    """
+    session_id = st.session_state.get("session_id")
+    admission.check_session(session_id)
+    if not remote_enabled():
+        return rag.rag(st, query, DOCUMENTS, qdrant_client, OPENAI_API_KEY, evaluate=evaluate)
+    if 'conversation_state' not in st.session_state:
+        st.session_state.conversation_state = rag.new_conversation_state()
+    results, state = answer_remote(query, st.session_state.conversation_state, session_id, evaluate)
+    st.session_state.conversation_state = state
+    return results
@@ -0,0 +1,315 @@
+"""
+Retention for conversations and feedback.
+
+Rows older than the hot window (RETENTION_HOT_DAYS) are moved, in batches of
+RETENTION_BATCH_SIZE, from Postgres to zstd-compressed Parquet files
+partitioned by UTC day:
+
+    data/archive/conversations/date=2025-06-01/part-<batch>.parquet
+    data/archive/feedback/date=2025-06-01/part-<batch>.parquet
+
+Each batch is written to Parquet first; its daily aggregates are then added to
+the rollup tables (db.ROLLUP_TABLES) and the rows deleted in one transaction,
+so a crash can at worst leave a duplicate Parquet part (readers drop
+duplicate ids). The JSON mirrors get the same window: old entries are
+dropped, and the ones Postgres never had are archived first.
+
+`load_conversations` / `load_feedback` return hot rows plus, on request, the
+archived ones for a date range; the Monitoring page and `export` use them.
+
+    python travel_assistant/retention.py run [--hot-days 30] [--dry-run]
+    python travel_assistant/retention.py export --table conversations --since 2025-01-01 --output conversations.csv
+    python travel_assistant/retention.py stats
+"""
+import os
+import json
+import uuid
+import argparse
+import datetime as dt
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from psycopg2.extras import DictCursor
+import db
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", os.path.join(DATA_DIR, "archive"))
+HOT_DAYS = int(os.getenv("RETENTION_HOT_DAYS", "30"))
+BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+SCHEMAS = {
+    "conversations": pa.schema([
+        ("id", pa.string()), ("question", pa.string()), ("answer", pa.string()),
+        ("quality_score", pa.float64()), ("faithfulness", pa.string()), ("groundedness", pa.string()),
+        ("relevance", pa.string()), ("completeness", pa.string()), ("coherence", pa.string()),
+        ("conciseness", pa.string()), ("tokens_used", pa.int64()), ("input_tokens", pa.int64()),
+        ("estimated_cost_usd", pa.float64()), ("model_name", pa.string()), ("eval_input_tokens", pa.int64()),
+        ("eval_tokens_used", pa.int64()), ("eval_estimated_cost_usd", pa.float64()), ("eval_status", pa.string()),
+        ("routing", pa.string()), ("timestamp", TIMESTAMP),
+    ]),
+    "feedback": pa.schema([
+        ("timestamp", TIMESTAMP), ("feedback_type", pa.string()), ("text_feedback", pa.string()),
+        ("conversation_id", pa.string()),
+    ]),
+}
+KEYS = {"conversations": "id", "feedback": "conversation_id"}
+MIRRORS = {"conversations": "answer_data.json", "feedback": "feedback_data.json"}
+
+ROLLUP_SQL = {
+    "conversations": """
+        INSERT INTO conversation_daily
+        SELECT (timestamp AT TIME ZONE 'UTC')::date, model_name, count(*),
+               coalesce(sum(tokens_used), 0), coalesce(sum(input_tokens), 0), coalesce(sum(estimated_cost_usd), 0),
+               coalesce(sum(eval_tokens_used), 0), coalesce(sum(eval_estimated_cost_usd), 0),
+               count(quality_score), coalesce(sum(quality_score), 0)
+        FROM conversations WHERE id = ANY(%s) GROUP BY 1, 2
+        ON CONFLICT (day, model_name) DO UPDATE SET
+            questions = conversation_daily.questions + EXCLUDED.questions,
+            tokens_used = conversation_daily.tokens_used + EXCLUDED.tokens_used,
+            input_tokens = conversation_daily.input_tokens + EXCLUDED.input_tokens,
+            estimated_cost_usd = conversation_daily.estimated_cost_usd + EXCLUDED.estimated_cost_usd,
+            eval_tokens_used = conversation_daily.eval_tokens_used + EXCLUDED.eval_tokens_used,
+            eval_estimated_cost_usd = conversation_daily.eval_estimated_cost_usd + EXCLUDED.eval_estimated_cost_usd,
+            judged = conversation_daily.judged + EXCLUDED.judged,
+            quality_score_sum = conversation_daily.quality_score_sum + EXCLUDED.quality_score_sum
+    """,
+    "feedback": """
+        INSERT INTO feedback_daily
+        SELECT (timestamp AT TIME ZONE 'UTC')::date, feedback_type, count(*)
+        FROM feedback WHERE conversation_id = ANY(%s) GROUP BY 1, 2
+        ON CONFLICT (day, feedback_type) DO UPDATE SET responses = feedback_daily.responses + EXCLUDED.responses
+    """,
+}
+
+def cutoff(hot_days: int = HOT_DAYS) -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=hot_days)
+
+def _to_utc(value: Any) -> dt.datetime:
+    ts = db._parse_timestamp(value)
+    return ts.replace(tzinfo=dt.timezone.utc) if ts.tzinfo is None else ts.astimezone(dt.timezone.utc)
+
+def _archive_record(table: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    record = {name: record.get(name) for name in SCHEMAS[table].names}
+    record["timestamp"] = _to_utc(record["timestamp"])
+    if table == "conversations" and record["routing"] is not None and not isinstance(record["routing"], str):
+        record["routing"] = json.dumps(record["routing"], default=str)
+    return record
+
+def write_archive(table: str, records: List[Dict[str, Any]], archive_dir: str = ARCHIVE_DIR) -> List[str]:
+    """One zstd Parquet part per UTC day in the batch; returns the written paths."""
+    by_day: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        record = _archive_record(table, record)
+        by_day.setdefault(record["timestamp"].date().isoformat(), []).append(record)
+    batch = uuid.uuid4().hex[:12]
+    paths = []
+    for day, rows in sorted(by_day.items()):
+        partition = os.path.join(archive_dir, table, f"date={day}")
+        os.makedirs(partition, exist_ok=True)
+        path = os.path.join(partition, f"part-{batch}.parquet")
+        pq.write_table(pa.Table.from_pylist(rows, schema=SCHEMAS[table]), path, compression="zstd")
+        paths.append(path)
+    return paths
+
+def archive_table(table: str, before: dt.datetime, batch_size: int = BATCH_SIZE,
+                  archive_dir: str = ARCHIVE_DIR) -> int:
+    """Move rows older than `before` from Postgres to the archive, batch by batch; returns the row count."""
+    key = KEYS[table]
+    moved = 0
+    conn = db.get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            db.init_retention_schema(cur)
+        conn.commit()
+        while True:
+            with conn.cursor(cursor_factory=DictCursor) as cur:
+                cur.execute(
+                    f"SELECT * FROM {table} WHERE timestamp < %s ORDER BY timestamp LIMIT %s FOR UPDATE SKIP LOCKED",
+                    (before, batch_size),
+                )
+                rows = [dict(row) for row in cur.fetchall()]
+                if not rows:
+                    conn.rollback()
+                    return moved
+                write_archive(table, rows, archive_dir)
+                ids = [row[key] for row in rows]
+                cur.execute(ROLLUP_SQL[table], (ids,))
+                cur.execute(f"DELETE FROM {table} WHERE {key} = ANY(%s)", (ids,))
+            conn.commit()
+            moved += len(rows)
+            print(f"{table}: archived {moved} rows")
+            if len(rows) < batch_size:
+                return moved
+    finally:
+        conn.close()
+
+def _hot_ids(table: str, ids: List[str]) -> Optional[set]:
+    """Ids still in Postgres, None when it is unavailable."""
+    key = KEYS[table]
+    try:
+        conn = db.get_db_connection()
+    except Exception:
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {key} FROM {table} WHERE {key} = ANY(%s)", (ids,))
+            return {row[0] for row in cur.fetchall()}
+    finally:
+        conn.close()
+
+def compact_mirror(table: str, before: dt.datetime, archive_dir: str = ARCHIVE_DIR) -> Dict[str, int]:
+    """
+    Drop mirror entries older than `before`. Entries Postgres never had (saved
+    while it was down, or JSON-only setups) are archived first; the others
+    reach the archive through archive_table.
+    """
+    import persistence
+
+    path = os.path.join(DATA_DIR, MIRRORS[table])
+    if not os.path.exists(path):
+        return {"dropped": 0, "archived": 0}
+    # the app appends and updates entries concurrently
+    with persistence.mirror_lock(path):
+        with open(path, encoding="utf-8") as f:
+            records = json.load(f)
+        old = [r for r in records if _to_utc(r.get("timestamp")) < before]
+        if not old:
+            return {"dropped": 0, "archived": 0}
+        key = KEYS[table]
+        in_db = _hot_ids(table, [r.get(key) for r in old])
+        archived_ids = set(read_archive(table, columns=[key])[key]) if os.path.isdir(os.path.join(archive_dir, table)) else set()
+        # with Postgres down keep them all: archive_table may still move them later, readers drop duplicates
+        unsaved = [r for r in old if r.get(key) not in archived_ids and (in_db is None or r.get(key) not in in_db)]
+        if unsaved:
+            write_archive(table, unsaved, archive_dir)
+        old_ids = {id(r) for r in old}
+        persistence.write_json_list(path, [r for r in records if id(r) not in old_ids])
+    return {"dropped": len(old), "archived": len(unsaved)}
+
+def run(hot_days: int = HOT_DAYS, batch_size: int = BATCH_SIZE, archive_dir: str = ARCHIVE_DIR) -> Dict[str, Any]:
+    before = cutoff(hot_days)
+    summary: Dict[str, Any] = {"cutoff": before.isoformat()}
+    for table in SCHEMAS:
+        try:
+            summary[table] = archive_table(table, before, batch_size, archive_dir)
+        except Exception as e:
+            print(f"{table}: archiving from Postgres failed: {e!r}")
+            summary[table] = None
+        summary[f"{table}_mirror"] = compact_mirror(table, before, archive_dir)
+    return summary
+
+def _day_filter(since: Optional[dt.date], until: Optional[dt.date]):
+    condition = None
+    for op, value in ((">=", since), ("<=", until)):
+        if value is not None:
+            clause = ds.field("date") >= value.isoformat() if op == ">=" else ds.field("date") <= value.isoformat()
+            condition = clause if condition is None else condition & clause
+    return condition
+
+def read_archive(table: str, since: Optional[dt.date] = None, until: Optional[dt.date] = None,
+                 columns: Optional[List[str]] = None, archive_dir: str = ARCHIVE_DIR) -> pd.DataFrame:
+    """Archived rows with a UTC day in [since, until]; only the matching partitions are read."""
+    root = os.path.join(archive_dir, table)
+    if not os.path.isdir(root):
+        return pd.DataFrame(columns=columns or SCHEMAS[table].names)
+    partitioning = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+    dataset = ds.dataset(root, format="parquet", schema=SCHEMAS[table].append(pa.field("date", pa.string())),
+                         partitioning=partitioning)
+    frame = dataset.to_table(columns=columns or SCHEMAS[table].names, filter=_day_filter(since, until)).to_pandas()
+    return frame.drop_duplicates(subset=KEYS[table]) if KEYS[table] in frame.columns else frame
+
+def _load(table: str, hot_rows, since: Optional[dt.date], until: Optional[dt.date], include_archive: bool) -> pd.DataFrame:
+    frames = [pd.DataFrame(hot_rows)]
+    if include_archive:
+        frames.append(read_archive(table, since, until))
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=SCHEMAS[table].names)
+    frame = pd.concat(frames, ignore_index=True)
+    frame["timestamp"] = pd.to_datetime(frame["timestamp"], utc=True, errors="coerce")
+    days = frame["timestamp"].dt.date
+    if since is not None:
+        frame = frame[days >= since]
+    if until is not None:
+        frame = frame[days <= until]
+    # a hot row wins over an archived copy of it
+    return frame.drop_duplicates(subset=KEYS[table]).sort_values("timestamp", ascending=False).reset_index(drop=True)
+
+def load_conversations(since: Optional[dt.date] = None, until: Optional[dt.date] = None,
+                       include_archive: bool = True) -> pd.DataFrame:
+    """Conversations from Postgres plus (optionally) the archive, newest first."""
+    return _load("conversations", db.get_conversation_data(), since, until, include_archive)
+
+def load_feedback(since: Optional[dt.date] = None, until: Optional[dt.date] = None,
+                  include_archive: bool = True) -> pd.DataFrame:
+    return _load("feedback", db.get_feedback_data(), since, until, include_archive)
+
+def load_rollups(table: str = "conversation_daily") -> pd.DataFrame:
+    """Daily aggregates of the archived rows (conversation_daily or feedback_daily)."""
+    if table not in db.ROLLUP_TABLES:
+        raise ValueError(f"Unknown rollup table '{table}'. Available: {sorted(db.ROLLUP_TABLES)}")
+    conn = db.get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            db.init_retention_schema(cur)
+            cur.execute(f"SELECT * FROM {table} ORDER BY day")
+            return pd.DataFrame([dict(row) for row in cur.fetchall()])
+    finally:
+        conn.close()
+
+def stats(archive_dir: str = ARCHIVE_DIR) -> Dict[str, Any]:
+    result = {}
+    for table in SCHEMAS:
+        root = os.path.join(archive_dir, table)
+        files = [os.path.join(d, f) for d, _, names in os.walk(root) for f in names if f.endswith(".parquet")]
+        days = sorted(name[len("date="):] for name in os.listdir(root)) if os.path.isdir(root) else []
+        result[table] = {
+            "archived_rows": sum(pq.ParquetFile(f).metadata.num_rows for f in files),
+            "archive_mb": round(sum(os.path.getsize(f) for f in files) / 1024 ** 2, 3),
+            "days": f"{days[0]} .. {days[-1]}" if days else None,
+        }
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_p = sub.add_parser("run", help="archive rows older than the hot window")
+    run_p.add_argument("--hot-days", type=int, default=HOT_DAYS)
+    run_p.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    run_p.add_argument("--dry-run", action="store_true", help="only count the rows that would move")
+    export_p = sub.add_parser("export", help="hot and archived rows for a date range as CSV or Parquet")
+    export_p.add_argument("--table", choices=list(SCHEMAS), default="conversations")
+    export_p.add_argument("--since", type=dt.date.fromisoformat)
+    export_p.add_argument("--until", type=dt.date.fromisoformat)
+    export_p.add_argument("--output", required=True, help=".csv or .parquet")
+    sub.add_parser("stats", help="archived rows, size and day range per table")
+    args = parser.parse_args()
+
+    if args.command == "run" and args.dry_run:
+        before = cutoff(args.hot_days)
+        conn = db.get_db_connection()
+        try:
+            with conn.cursor() as cur:
+                for table in SCHEMAS:
+                    cur.execute(f"SELECT count(*) FROM {table} WHERE timestamp < %s", (before,))
+                    print(f"{table}: {cur.fetchone()[0]} rows older than {before:%Y-%m-%d %H:%M} UTC")
+        finally:
+            conn.close()
+    elif args.command == "run":
+        print(run(args.hot_days, args.batch_size))
+    elif args.command == "export":
+        loader = load_conversations if args.table == "conversations" else load_feedback
+        frame = loader(args.since, args.until)
+        if args.output.endswith(".parquet"):
+            frame.to_parquet(args.output, index=False)
+        else:
+            frame.to_csv(args.output, index=False)
+        print(f"wrote {len(frame)} rows to {args.output}")
+    else:
+        for table, values in stats().items():
+            print(table, values)
@@ -0,0 +1,81 @@
+import os
+import math
+import time
+from typing import Callable, List, Dict, Any
+import pandas as pd
+
+# Retrieval metrics as used in notebooks/03_evaluating_retrieval.ipynb.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GROUND_TRUTH_PATH = os.path.join(BASE_DIR, "..", "data", "ground-truth-retrieval.csv")
+
+def load_ground_truth(path: str = GROUND_TRUTH_PATH, split: str | None = None, sample: int | None = None) -> List[Dict[str, Any]]:
+    """
+    Load (id, question) pairs. `split` is None (all), "test" or "valid", using the
+    same 70/30 split (random_state=123) as the retrieval notebook.
+    """
+    df = pd.read_csv(path)
+    if split is not None:
+        from sklearn.model_selection import train_test_split
+        test, valid = train_test_split(df, test_size=0.3, random_state=123)
+        df = {"test": test, "valid": valid}[split]
+    if sample is not None and sample < len(df):
+        df = df.sample(sample, random_state=42)
+    return df.to_dict(orient='records')
+
+def hit_rate(relevance_total):
+    cnt = 0
+    for line in relevance_total:
+        if True in line:
+            cnt += 1
+    return cnt / len(relevance_total) if relevance_total else 0.0
+
+def mrr(relevance_total):
+    total_score = 0.0
+    for line in relevance_total:
+        for rank in range(len(line)):
+            if line[rank]:
+                total_score = total_score + 1 / (rank + 1)
+                break
+    return total_score / len(relevance_total) if relevance_total else 0.0
+
+def ndcg(relevance_total, k=None):
+    def dcg(relevances, k):
+        return sum(rel / math.log2(idx + 2) for idx, rel in enumerate(relevances[:k]))
+
+    scores = []
+    for relevances in relevance_total:
+        k_val = k if k is not None else len(relevances)
+        idcg = dcg(sorted(relevances, reverse=True), k_val)
+        scores.append(dcg(relevances, k_val) / idcg if idcg > 0 else 0.0)
+    return sum(scores) / len(scores) if scores else 0.0
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def evaluate(ground_truth: List[Dict[str, Any]], search_function: Callable[[str], list]) -> Dict[str, float]:
+    """
+    Run every question through `search_function` (returns ranked points or
+    dicts with an 'id') and report hit_rate, MRR, nDCG and latency percentiles.
+    """
+    relevance_total = []
+    latencies_ms = []
+    for q in ground_truth:
+        start = time.perf_counter()
+        results = search_function(q['question'])
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+        ids = [r['id'] if isinstance(r, dict) else r.id for r in results]
+        relevance_total.append([doc_id == q['id'] for doc_id in ids])
+
+    return {
+        "hit_rate": hit_rate(relevance_total),
+        "mrr": mrr(relevance_total),
+        "ndcg": ndcg(relevance_total),
+        "p50_ms": percentile(latencies_ms, 50),
+        "p95_ms": percentile(latencies_ms, 95),
+        "queries": len(ground_truth),
+    }
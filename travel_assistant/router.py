@@ -0,0 +1,324 @@
+"""
+Generator routing: picks the model and prompt variant for each request.
+
+Routes are (model, prompt) pairs. `choose()` keeps the routes that fit the
+context window, the per-request cost ceiling (ROUTER_MAX_COST_USD), the latency
+SLO (ROUTER_LATENCY_SLO_S) and the provider error-rate limit, then takes the one
+with the best expected quality (mean quality_score in
+data/experiments_output/agg_results.csv), the cheaper one on ties. Expected
+latency and error rate come from a rolling window of recent calls per provider,
+or from the route's prior until enough calls were seen. Providers whose circuit
+breaker is open are skipped, and the decision names a hedge route on another
+provider (see rag.generate_async).
+
+    python travel_assistant/router.py --simulate --max-cost 0.01 0.003 --slo 8 2
+
+replays data/experiments_output/all_runs.parquet: priors are computed on half
+of the questions and the routing policy is replayed on the other half. The
+runs have no timings, so simulated latency is the route prior.
+"""
+import os
+import csv
+import time
+import argparse
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EXPERIMENTS_DIR = os.path.join(BASE_DIR, "..", "data", "experiments_output")
+AGG_RESULTS_PATH = os.path.join(EXPERIMENTS_DIR, "agg_results.csv")
+ALL_RUNS_PATH = os.path.join(EXPERIMENTS_DIR, "all_runs.parquet")
+
+# Model keys follow notebooks/04_RAG_evaluation.ipynb. Costs are blended USD per
+# million tokens (same convention as rag._gemini_result); only `live` models
+# can be called by the app, mistral is kept for the offline simulation.
+MODELS = {
+    "gemini_llm": {"provider": "gemini", "model": "gemini-2.5-flash-lite", "usd_per_mtok": 0.4,
+                   "latency_prior_s": 1.5, "max_input_tokens": 1_000_000, "live": True},
+    "openai_llm": {"provider": "openai", "model": "gpt-4o-mini", "usd_per_mtok": 0.6,
+                   "latency_prior_s": 3.0, "max_input_tokens": 128_000, "live": True},
+    "mistral_llm": {"provider": "mistral", "model": "mistral-large-latest", "usd_per_mtok": 6.0,
+                    "latency_prior_s": 5.0, "max_input_tokens": 128_000, "live": False},
+}
+PROMPTS = ["prompt_A", "prompt_B", "prompt_C"]
+
+ROUTER_MODELS = [m.strip() for m in os.getenv("ROUTER_MODELS", "gemini_llm,openai_llm").split(",") if m.strip()]
+ROUTER_MAX_COST_USD = float(os.getenv("ROUTER_MAX_COST_USD", "0.01"))
+ROUTER_LATENCY_SLO_S = float(os.getenv("ROUTER_LATENCY_SLO_S", "8"))
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+ROUTER_STATS_WINDOW = int(os.getenv("ROUTER_STATS_WINDOW", "50"))
+ROUTER_MIN_SAMPLES = 5
+ANSWER_TOKENS_ESTIMATE = 300
+
+# Hedging: if the primary has not answered after ROUTER_HEDGE_FACTOR x the
+# median of its recent latencies, capped at ROUTER_HEDGE_DELAY_S (the delay
+# until enough calls were seen), the same prompt goes to the best route of
+# another provider; first answer wins. The median, not a high percentile:
+# slow calls still succeed, so with a 20% slow tail the p90 is the tail itself.
+ROUTER_HEDGING = os.getenv("ROUTER_HEDGING", "1") == "1"
+ROUTER_HEDGE_FACTOR = float(os.getenv("ROUTER_HEDGE_FACTOR", "2"))
+ROUTER_HEDGE_DELAY_S = float(os.getenv("ROUTER_HEDGE_DELAY_S", "2"))
+# Circuit breaker: open after N consecutive failures, retry after the cooldown.
+BREAKER_FAILURES = int(os.getenv("ROUTER_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_S = float(os.getenv("ROUTER_BREAKER_COOLDOWN_S", "30"))
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def load_quality_priors(path: str = AGG_RESULTS_PATH) -> Dict[str, float]:
+    """Mean quality_score per route ("<model>/<prompt>") from agg_results.csv."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline="", encoding="utf-8") as f:
+        return {f"{row['model']}/{row['prompt']}": float(row["mean"]) for row in csv.DictReader(f)}
+
+_quality_priors: Optional[Dict[str, float]] = None
+
+def quality_priors() -> Dict[str, float]:
+    global _quality_priors
+    if _quality_priors is None:
+        _quality_priors = load_quality_priors()
+    return _quality_priors
+
+class ProviderStats:
+    """Rolling latency / error window for one provider."""
+
+    def __init__(self, window: int = ROUTER_STATS_WINDOW):
+        self.calls = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency_s: float, ok: bool) -> None:
+        with self._lock:
+            self.calls.append((latency_s, ok))
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        """Latency percentile of successful calls, None until ROUTER_MIN_SAMPLES were seen."""
+        with self._lock:
+            latencies = sorted(latency for latency, ok in self.calls if ok)
+        if len(latencies) < ROUTER_MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(pct * len(latencies)))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = list(self.calls)
+        if not calls:
+            return {"samples": 0, "p95_latency_s": None, "error_rate": 0.0}
+        latencies = sorted(latency for latency, _ in calls)
+        return {
+            "samples": len(calls),
+            "p95_latency_s": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+            "error_rate": sum(1 for _, ok in calls if not ok) / len(calls),
+        }
+
+class CircuitBreaker:
+    """closed -> open after BREAKER_FAILURES consecutive failures -> half-open after the cooldown."""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown_s: float = BREAKER_COOLDOWN_S):
+        self.failures = failures
+        self.cooldown_s = cooldown_s
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - self.opened_at < self.cooldown_s else "half_open"
+
+    def available(self) -> bool:
+        return self.state != "open"
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.consecutive_failures = 0
+                self.opened_at = None
+            else:
+                self.consecutive_failures += 1
+                # a failed half-open trial re-opens straight away
+                if self.consecutive_failures >= self.failures or self.opened_at is not None:
+                    self.opened_at = time.monotonic()
+
+STATS: Dict[str, ProviderStats] = {}
+BREAKERS: Dict[str, CircuitBreaker] = {}
+_counters_lock = threading.Lock()
+HEDGE_COUNTERS = {"requests": 0, "hedged": 0, "hedge_wins": 0, "failovers": 0, "failed": 0}
+
+def provider_stats(provider: str) -> ProviderStats:
+    return STATS.setdefault(provider, ProviderStats())
+
+def breaker(provider: str) -> CircuitBreaker:
+    return BREAKERS.setdefault(provider, CircuitBreaker())
+
+def record(provider: str, latency_s: float, ok: bool) -> None:
+    provider_stats(provider).record(latency_s, ok)
+    breaker(provider).record(ok)
+
+def count(event: str) -> None:
+    with _counters_lock:
+        HEDGE_COUNTERS[event] += 1
+
+def hedge_delay(provider: str) -> float:
+    median = provider_stats(provider).latency_percentile(0.5)
+    return ROUTER_HEDGE_DELAY_S if median is None else min(median * ROUTER_HEDGE_FACTOR, ROUTER_HEDGE_DELAY_S)
+
+def health() -> Dict[str, Any]:
+    """Counters, breaker states and rolling stats of this process (for /health and benchmarks)."""
+    with _counters_lock:
+        counters = dict(HEDGE_COUNTERS)
+    requests = counters["requests"] or 1
+    return {
+        **counters,
+        "hedge_rate": counters["hedged"] / requests,
+        "breakers": {p: b.state for p, b in BREAKERS.items()},
+        "providers": {p: s.snapshot() for p, s in STATS.items()},
+    }
+
+def routes(models: Optional[List[str]] = None, priors: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    priors = quality_priors() if priors is None else priors
+    return [
+        {"route": f"{name}/{prompt}", "model_key": name, "prompt": prompt, **MODELS[name],
+         "quality_prior": priors.get(f"{name}/{prompt}", 0.0)}
+        for name in (models or ROUTER_MODELS) for prompt in PROMPTS
+    ]
+
+def choose(input_tokens: int, max_cost_usd: Optional[float] = None, latency_slo_s: Optional[float] = None,
+           output_tokens: int = ANSWER_TOKENS_ESTIMATE, candidates: Optional[List[Dict[str, Any]]] = None,
+           stats: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Routing decision for one request (JSON-serializable, stored with the
+    conversation). `stats` maps provider -> ProviderStats.snapshot(); defaults
+    to the live rolling stats of this process.
+    """
+    max_cost_usd = ROUTER_MAX_COST_USD if max_cost_usd is None else max_cost_usd
+    latency_slo_s = ROUTER_LATENCY_SLO_S if latency_slo_s is None else latency_slo_s
+    candidates = routes() if candidates is None else candidates
+
+    scored, rejected = [], {}
+    for route in candidates:
+        snap = (stats or {}).get(route["provider"]) if stats is not None else provider_stats(route["provider"]).snapshot()
+        snap = snap or {"samples": 0, "p95_latency_s": None, "error_rate": 0.0}
+        observed = snap["samples"] >= ROUTER_MIN_SAMPLES
+        est_latency = snap["p95_latency_s"] if observed else route["latency_prior_s"]
+        error_rate = snap["error_rate"] if observed else 0.0
+        est_cost = (input_tokens + output_tokens) / 1_000_000 * route["usd_per_mtok"]
+        option = {**route, "est_cost_usd": est_cost, "est_latency_s": est_latency, "error_rate": error_rate}
+
+        if input_tokens > route["max_input_tokens"]:
+            rejected[route["route"]] = "context_window"
+        elif stats is None and not breaker(route["provider"]).available():
+            rejected[route["route"]] = "circuit_open"
+        elif error_rate > ROUTER_MAX_ERROR_RATE:
+            rejected[route["route"]] = "error_rate"
+        elif est_cost > max_cost_usd:
+            rejected[route["route"]] = "cost"
+        elif est_latency > latency_slo_s:
+            rejected[route["route"]] = "latency"
+        scored.append(option)
+
+    eligible = [o for o in scored if o["route"] not in rejected]
+    if eligible:
+        best = max(eligible, key=lambda o: (o["quality_prior"], -o["est_cost_usd"]))
+        reason = "best_quality_within_limits"
+    else:
+        # nothing meets the limits: degrade to the fastest route that fits the context window
+        fitting = [o for o in scored if rejected.get(o["route"]) != "context_window"] or scored
+        best = min(fitting, key=lambda o: (rejected.get(o["route"]) == "circuit_open", o["error_rate"],
+                                           o["est_latency_s"], o["est_cost_usd"], -o["quality_prior"]))
+        reason = "fallback_fastest"
+
+    # hedge target: best usable route of another provider
+    hedge = None
+    if ROUTER_HEDGING:
+        others = [o for o in scored if o["provider"] != best["provider"]
+                  and rejected.get(o["route"]) not in ("context_window", "circuit_open")]
+        if others:
+            alt = max(others, key=lambda o: (o["route"] not in rejected, o["quality_prior"], -o["est_cost_usd"]))
+            hedge = {"route": alt["route"], "provider": alt["provider"], "model": alt["model"]}
+
+    return {
+        "route": best["route"],
+        "provider": best["provider"],
+        "model": best["model"],
+        "prompt": best["prompt"],
+        "reason": reason,
+        "input_tokens": input_tokens,
+        "est_cost_usd": best["est_cost_usd"],
+        "est_latency_s": best["est_latency_s"],
+        "quality_prior": best["quality_prior"],
+        "max_cost_usd": max_cost_usd,
+        "latency_slo_s": latency_slo_s,
+        "rejected": rejected,
+        "hedge": hedge,
+        "decided_at": time.time(),
+    }
+
+# --- Offline simulation ------------------------------------------------------
+
+def simulate(runs_path: str = ALL_RUNS_PATH, max_costs: Optional[List[float]] = None,
+             slos: Optional[List[float]] = None, seed: int = 123):
+    """Replay recorded runs under each (cost ceiling, SLO) pair and against static routes."""
+    import numpy as np
+    import pandas as pd
+
+    df = pd.read_parquet(runs_path)
+    df["route"] = df["model"] + "/" + df["prompt"]
+    df["input_tokens"] = (df["question"].str.len() + df["context"].str.len()) // 4 + 80
+    df["output_tokens"] = df["answer"].fillna("").str.len() // 4
+    df["cost_usd"] = (df["input_tokens"] + df["output_tokens"]) / 1_000_000 * df["model"].map(
+        lambda m: MODELS[m]["usd_per_mtok"])
+    df["latency_s"] = df["model"].map(lambda m: MODELS[m]["latency_prior_s"])
+
+    ids = df["id"].drop_duplicates().to_numpy().copy()
+    np.random.default_rng(seed).shuffle(ids)
+    prior_ids = set(ids[: len(ids) // 2])
+    priors = df[df["id"].isin(prior_ids)].groupby("route")["quality_score"].mean().to_dict()
+    replay = df[~df["id"].isin(prior_ids)].set_index(["id", "route"]).sort_index()
+    candidates = routes(list(MODELS), priors)
+    output_estimate = int(df[df["id"].isin(prior_ids)]["output_tokens"].mean())
+
+    rows = []
+    for max_cost in max_costs or [ROUTER_MAX_COST_USD]:
+        for slo in slos or [ROUTER_LATENCY_SLO_S]:
+            picked = []
+            for qid, group in replay.groupby(level="id"):
+                decision = choose(int(group["input_tokens"].iloc[0]), max_cost, slo, output_estimate,
+                                  candidates, stats={})
+                picked.append((qid, decision["route"]))
+            chosen = replay.loc[picked]
+            rows.append({
+                "policy": f"router(max_cost={max_cost}, slo={slo})",
+                "mean_quality": chosen["quality_score"].mean(),
+                "total_cost_usd": chosen["cost_usd"].sum(),
+                "mean_latency_s": chosen["latency_s"].mean(),
+                "route_mix": chosen.index.get_level_values("route").value_counts().to_dict(),
+            })
+    for route, group in replay.groupby(level="route"):
+        rows.append({
+            "policy": f"static {route}",
+            "mean_quality": group["quality_score"].mean(),
+            "total_cost_usd": group["cost_usd"].sum(),
+            "mean_latency_s": group["latency_s"].mean(),
+            "route_mix": {route: len(group)},
+        })
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--simulate", action="store_true", help="replay all_runs.parquet offline")
+    parser.add_argument("--runs", default=ALL_RUNS_PATH)
+    parser.add_argument("--max-cost", type=float, nargs="+", help="per-request cost ceilings (USD)")
+    parser.add_argument("--slo", type=float, nargs="+", help="latency SLOs (seconds)")
+    parser.add_argument("--output", help="optional CSV path for the results")
+    args = parser.parse_args()
+
+    if args.simulate:
+        report = simulate(args.runs, args.max_cost, args.slo)
+        print(report.to_string(index=False))
+        if args.output:
+            report.to_csv(args.output, index=False)
+    else:
+        parser.print_help()
@@ -0,0 +1,74 @@
+"""
+Start-up profiler: import time per module (each measured in a fresh
+interpreter, so shared dependencies are counted in every module that pulls
+them in) and the duration of each warm-up step.
+
+    python travel_assistant/startup_profile.py [--skip-warmup]
+"""
+import os
+import sys
+import argparse
+import subprocess
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (module, loaded at app start?)
+MODULES = [
+    ("streamlit", True),
+    ("qdrant_client", True),
+    ("fastembed", True),  # imported by qdrant_client
+    ("psycopg2", True),
+    ("ui", True),
+    ("db", True),
+    ("persistence", True),
+    ("warmup", True),
+    ("rag", True),
+    ("pandas", False),
+    ("ingest", False),
+    ("google.generativeai", False),
+    ("openai", False),
+    ("altair", False),
+    ("monitoring", False),
+]
+
+IMPORT_SNIPPET = "import time, warnings; warnings.simplefilter('ignore'); t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+def import_time(module: str) -> float | None:
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+        cwd=BASE_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--skip-warmup", action="store_true", help="only measure imports (no Qdrant needed)")
+    args = parser.parse_args()
+
+    print(f"{'module':<22}{'at start':>10}{'import s':>10}")
+    for module, eager in MODULES:
+        seconds = import_time(module)
+        shown = f"{seconds:.3f}" if seconds is not None else "error"
+        print(f"{module:<22}{'yes' if eager else 'deferred':>10}{shown:>10}")
+
+    if args.skip_warmup:
+        return
+
+    sys.path.insert(0, BASE_DIR)
+    import warmup
+    wu = warmup.Warmup(os.getenv("QDRANT_URL", "http://localhost:6333"))
+    wu.run()
+    print()
+    print(f"{'warm-up step':<32}{'s':>10}")
+    for step, seconds in wu.timings.items():
+        print(f"{step:<32}{seconds:>10.3f}")
+    if wu.error is not None:
+        print(f"warm-up failed: {wu.error!r}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Local stand-ins for the Gemini and OpenAI HTTP APIs with injected latency,
+errors and empty responses, for exercising hedging and circuit breakers
+without real API calls.
+
+    python travel_assistant/stub_providers.py serve --provider gemini --port 9001 --slow-rate 0.2 --slow-latency 6
+    python travel_assistant/stub_providers.py serve --provider openai --port 9002 --latency 0.8
+
+then point the app at them with GEMINI_API_ENDPOINT=http://localhost:9001 and
+OPENAI_BASE_URL=http://localhost:9002/v1.
+
+    python travel_assistant/stub_providers.py demo --requests 100
+
+starts both stubs in-process and runs rag.generate_async against them with
+and without hedging, printing latency percentiles, hedge rate/wins and the
+circuit breaker states.
+"""
+import os
+import json
+import time
+import random
+import logging
+import asyncio
+import argparse
+import tornado.web
+import tornado.httpserver
+import tornado.netutil
+
+class Behaviour:
+    def __init__(self, latency: float = 0.3, slow_rate: float = 0.0, slow_latency: float = 5.0,
+                 error_rate: float = 0.0, empty_rate: float = 0.0):
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.empty_rate = empty_rate
+
+    async def delay(self) -> None:
+        slow = random.random() < self.slow_rate
+        await asyncio.sleep(self.slow_latency if slow else self.latency * random.uniform(0.8, 1.2))
+
+class StubHandler(tornado.web.RequestHandler):
+    def initialize(self, behaviour: Behaviour):
+        self.behaviour = behaviour
+
+    async def post(self, *args):
+        await self.behaviour.delay()
+        roll = random.random()
+        if roll < self.behaviour.error_rate:
+            self.set_status(503)
+            self.write({"error": {"code": 503, "message": "stub: injected error", "status": "UNAVAILABLE"}})
+            return
+        empty = roll < self.behaviour.error_rate + self.behaviour.empty_rate
+        body = json.loads(self.request.body or b"{}")
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(self.response(body, "" if empty else "Stub answer: Wawel Castle is open 9:00-17:00.")))
+
+class GeminiHandler(StubHandler):
+    """POST /v1beta/models/<model>:generateContent"""
+
+    def response(self, body, text):
+        prompt_tokens = len(json.dumps(body)) // 4
+        candidates = [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}]
+        return {
+            "candidates": candidates if text else [],
+            "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": len(text) // 4,
+                              "totalTokenCount": prompt_tokens + len(text) // 4},
+            "modelVersion": self.path_args[0] if self.path_args else "stub",
+        }
+
+class OpenAIHandler(StubHandler):
+    """POST /v1/chat/completions"""
+
+    def response(self, body, text):
+        prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+        schema = (body.get("response_format") or {}).get("json_schema", {})
+        if text and schema.get("name") == "judgements":
+            # judge request (rag.judge_batch_async): one positive judgement per item
+            prompt = body["messages"][-1]["content"]
+            labels = schema["schema"]["properties"]["items"]["items"]["properties"]
+            items = [{"item": n, **{crit: spec["enum"][-1] for crit, spec in labels.items() if "enum" in spec}}
+                     for n in range(1, prompt.count("\nItem ") + 1)]
+            text = json.dumps({"items": items})
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4,
+                      "total_tokens": prompt_tokens + len(text) // 4},
+        }
+
+def make_app(provider: str, behaviour: Behaviour) -> tornado.web.Application:
+    if provider == "gemini":
+        routes = [(r"/v1beta/models/([^/:]+):generateContent", GeminiHandler, {"behaviour": behaviour})]
+    else:
+        routes = [(r"/v1/chat/completions", OpenAIHandler, {"behaviour": behaviour})]
+    return tornado.web.Application(routes)
+
+def start_stub(provider: str, behaviour: Behaviour, port: int = 0) -> int:
+    """Start a stub on the running loop; returns the bound port."""
+    sockets = tornado.netutil.bind_sockets(port, address="127.0.0.1")
+    tornado.httpserver.HTTPServer(make_app(provider, behaviour)).add_sockets(sockets)
+    return sockets[0].getsockname()[1]
+
+async def serve(args) -> None:
+    behaviour = Behaviour(args.latency, args.slow_rate, args.slow_latency, args.error_rate, args.empty_rate)
+    port = start_stub(args.provider, behaviour, args.port)
+    print(f"{args.provider} stub listening on http://127.0.0.1:{port}")
+    await asyncio.Event().wait()
+
+async def demo(args) -> None:
+    logging.getLogger("tornado.access").setLevel(logging.ERROR)
+    slow_latency = 3.0
+    gemini_port = start_stub("gemini", Behaviour(0.3, slow_rate=0.2, slow_latency=slow_latency, error_rate=0.05, empty_rate=0.05))
+    openai_port = start_stub("openai", Behaviour(0.6))
+    os.environ["GEMINI_API_ENDPOINT"] = f"http://127.0.0.1:{gemini_port}"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{openai_port}/v1"
+    os.environ.setdefault("GEMINI_API_KEY", "stub")
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    import rag
+    import router
+
+    for hedging in (False, True):
+        router.STATS.clear()
+        router.BREAKERS.clear()
+        router.HEDGE_COUNTERS.update({k: 0 for k in router.HEDGE_COUNTERS})
+        router.ROUTER_HEDGING = hedging
+        latencies, failures = [], 0
+        for _ in range(args.requests):
+            decision = router.choose(2000)
+            start = time.perf_counter()
+            try:
+                await rag.generate_async(decision, "When is Wawel Castle open?")
+            except Exception:
+                failures += 1
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        health = router.health()
+        print(f"hedging={'on ' if hedging else 'off'} "
+              f"p50={latencies[len(latencies) // 2]:.2f}s p95={latencies[int(0.95 * len(latencies))]:.2f}s "
+              f"max={latencies[-1]:.2f}s failures={failures} hedged={health['hedged']} "
+              f"hedge_wins={health['hedge_wins']} failovers={health['failovers']} breakers={health['breakers']}")
+    # let the cancelled (losing) calls drain before the stubs go away
+    await asyncio.sleep(slow_latency)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_p = sub.add_parser("serve", help="run one stub provider")
+    serve_p.add_argument("--provider", choices=["gemini", "openai"], required=True)
+    serve_p.add_argument("--port", type=int, default=9001)
+    serve_p.add_argument("--latency", type=float, default=0.3, help="typical response time (s)")
+    serve_p.add_argument("--slow-rate", type=float, default=0.0, help="share of responses taking --slow-latency")
+    serve_p.add_argument("--slow-latency", type=float, default=5.0)
+    serve_p.add_argument("--error-rate", type=float, default=0.0, help="share of HTTP 503 responses")
+    serve_p.add_argument("--empty-rate", type=float, default=0.0, help="share of responses without text")
+    demo_p = sub.add_parser("demo", help="compare generation with and without hedging against in-process stubs")
+    demo_p.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(serve(args) if args.command == "serve" else demo(args))
@@ -0,0 +1,140 @@
+"""
+Tune the retrieval parameters (rag.RETRIEVAL_CONFIG) with Optuna.
+
+Searches the fused result limit (documents in the prompt), the prefetch depth
+of the jina-small and BM25 branches, the fusion method (RRF / DBSF) and the
+dense HNSW ef on the validation split of data/ground-truth-retrieval.csv, as a
+multi-objective study: hit rate up, p95 search latency down, prompt documents
+down. The current configuration is always trial 0. The Pareto front is
+printed; the selected trial (best hit rate, then MRR, then p95, within
+--max-p95-ms and --max-limit) is checked on the test split and written to the
+config file rag loads at start-up (RAG_RETRIEVAL_CONFIG).
+
+    python travel_assistant/tune_retrieval.py --trials 60 [--max-p95-ms 40] [--max-limit 5] [--dry-run]
+
+hnsw_ef only changes anything once the collection is large enough for Qdrant
+to use the HNSW graph instead of a full scan.
+"""
+import os
+import json
+import argparse
+import datetime as dt
+from typing import Any, Dict
+
+import pandas as pd
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+import rag
+import retrieval_eval
+
+load_dotenv()
+
+LIMITS = (1, 10)
+PREFETCH_DEPTHS = (1, 50)
+HNSW_EF_CHOICES = [None, 16, 32, 64, 128, 256]
+
+def suggest_config(trial) -> Dict[str, Any]:
+    return {
+        "limit": trial.suggest_int("limit", *LIMITS),
+        "dense_prefetch": trial.suggest_int("dense_prefetch", *PREFETCH_DEPTHS, log=True),
+        "sparse_prefetch": trial.suggest_int("sparse_prefetch", *PREFETCH_DEPTHS, log=True),
+        "fusion": trial.suggest_categorical("fusion", sorted(rag.FUSION_METHODS)),
+        "hnsw_ef": trial.suggest_categorical("hnsw_ef", HNSW_EF_CHOICES),
+    }
+
+def evaluate_config(qdrant_client, config: Dict[str, Any], ground_truth, collection_name: str) -> Dict[str, float]:
+    def search(question):
+        return rag.rrf_search(qdrant_client, question, collection_name=collection_name, config=config)
+
+    search(ground_truth[0]['question'])  # keep model loading / cold caches out of the latency
+    return retrieval_eval.evaluate(ground_truth, search)
+
+def run_study(qdrant_client, ground_truth, trials: int, collection_name: str, seed: int = 42):
+    import optuna
+
+    study = optuna.create_study(
+        directions=["maximize", "minimize", "minimize"],
+        sampler=optuna.samplers.NSGAIISampler(seed=seed),
+    )
+    study.enqueue_trial(dict(rag.DEFAULT_RETRIEVAL_CONFIG))
+
+    def objective(trial):
+        config = suggest_config(trial)
+        metrics = evaluate_config(qdrant_client, config, ground_truth, collection_name)
+        for key, value in metrics.items():
+            trial.set_user_attr(key, value)
+        return metrics["hit_rate"], metrics["p95_ms"], config["limit"]
+
+    study.optimize(objective, n_trials=trials)
+    return study
+
+def trials_frame(study) -> pd.DataFrame:
+    front = {t.number for t in study.best_trials}
+    rows = [{"trial": t.number, **t.params, **t.user_attrs, "pareto": t.number in front}
+            for t in study.trials if t.values is not None]
+    return pd.DataFrame(rows).set_index("trial")
+
+def select(frame: pd.DataFrame, max_p95_ms: float | None, max_limit: int | None) -> pd.Series:
+    candidates = frame[frame["pareto"]]
+    if max_p95_ms is not None:
+        candidates = candidates[candidates["p95_ms"] <= max_p95_ms]
+    if max_limit is not None:
+        candidates = candidates[candidates["limit"] <= max_limit]
+    if candidates.empty:
+        raise SystemExit("No Pareto-optimal configuration within --max-p95-ms / --max-limit")
+    return candidates.sort_values(["hit_rate", "mrr", "p95_ms"], ascending=[False, False, True]).iloc[0]
+
+def config_of(row: pd.Series) -> Dict[str, Any]:
+    config = {key: row[key] for key in rag.DEFAULT_RETRIEVAL_CONFIG}
+    config["hnsw_ef"] = None if pd.isna(config["hnsw_ef"]) else int(config["hnsw_ef"])
+    return {key: value.item() if hasattr(value, "item") else value for key, value in config.items()}
+
+def write_config(path: str, config: Dict[str, Any], valid: Dict[str, float], test: Dict[str, float],
+                 baseline: Dict[str, float], trials: int) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "config": config,
+            "metrics": {"valid": valid, "test": test, "baseline_valid": baseline},
+            "trials": trials,
+            "tuned_at": dt.datetime.now().isoformat(timespec="seconds"),
+        }, f, indent=2)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=60)
+    parser.add_argument("--sample", type=int, default=None, help="validation questions per trial (default: all)")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="latency budget for the selected configuration")
+    parser.add_argument("--max-limit", type=int, default=rag.DEFAULT_RETRIEVAL_CONFIG["limit"],
+                        help="largest number of prompt documents to accept (default: today's)")
+    parser.add_argument("--collection", default=rag.COLLECTION_ALIAS)
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL", "http://localhost:6333"))
+    parser.add_argument("--output", default=rag.RETRIEVAL_CONFIG_PATH, help="config file rag loads")
+    parser.add_argument("--trials-csv", default=None, help="optional CSV with every trial")
+    parser.add_argument("--dry-run", action="store_true", help="report only, do not write the config")
+    args = parser.parse_args()
+
+    qdrant_client = QdrantClient(url=args.qdrant_url)
+    valid = retrieval_eval.load_ground_truth(split="valid", sample=args.sample)
+    study = run_study(qdrant_client, valid, args.trials, args.collection)
+    frame = trials_frame(study)
+    if args.trials_csv:
+        frame.to_csv(args.trials_csv)
+
+    columns = ["limit", "dense_prefetch", "sparse_prefetch", "fusion", "hnsw_ef", "hit_rate", "mrr", "p50_ms", "p95_ms"]
+    print("Pareto front (validation split):")
+    print(frame[frame["pareto"]][columns].sort_values("hit_rate", ascending=False).to_string())
+
+    chosen = select(frame, args.max_p95_ms, args.max_limit)
+    config = config_of(chosen)
+    baseline = frame.loc[0, ["hit_rate", "mrr", "ndcg", "p50_ms", "p95_ms"]].to_dict()
+    test = evaluate_config(qdrant_client, config, retrieval_eval.load_ground_truth(split="test"), args.collection)
+    print(f"\nSelected trial {chosen.name}: {config}")
+    print(f"baseline (valid): {baseline}")
+    print(f"selected (test):  {test}")
+    if not args.dry_run:
+        valid_metrics = chosen[["hit_rate", "mrr", "ndcg", "p50_ms", "p95_ms"]].to_dict()
+        write_config(args.output, config, valid_metrics, test, baseline, len(frame))
+        print(f"wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,46 @@
+import os
 import uuid
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 from typing import List, Dict, Any
 import rag
+import rag_client
+import admission
 import persistence
+import judging
+import history
+
+# Persistence and (sampled, batched) judging run here, after the answer has been rendered.
+_BACKGROUND = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TRAVEL_ASSISTANT_BACKGROUND_WORKERS", "4")),
+    thread_name_prefix="evaluate-and-save",
+)
+
+def _evaluate_and_save(answer: Dict[str, Any], OPENAI_API_KEY: str) -> None:
+    """Save right away; sampled answers are judged in a batch and their labels saved afterwards."""
+    try:
+        context = answer.pop("context", None)
+        persistence.save_conversation(answer)
+        if answer.get("eval_status") == "pending":
+            judging.BATCHER.submit({**answer, "context": context}, OPENAI_API_KEY,
+                                   persistence.update_conversation_eval)
+    except Exception as e:
+        print(f"Evaluating/saving conversation {answer.get('id')} failed: {e!r}")
+
+def _evaluate_on_feedback(entry: Dict[str, Any]) -> None:
+    """Negative feedback on an answer the sampler skipped: judge it anyway."""
+    judging.BATCHER.submit(
+        {key: entry.get(key) for key in ("id", "question", "answer", "context_ids")},
+        os.getenv("OPENAI_API_KEY"), persistence.update_conversation_eval, status="negative_feedback",
+    )
 
 def render_sidebar_stats() -> None:
     st.sidebar.header("📊 Statistics")
-    total_questions = len(st.session_state.conversation_history)
-    total_feedback = len(st.session_state.feedback_data)
-    positive_feedback = len([f for f in st.session_state.feedback_data if f.get('feedback_type') == 'positive'])
+    counts = st.session_state.history.counts
+    total_questions = counts["questions"]
+    total_feedback = counts["feedback"]
+    positive_feedback = counts["positive"]
     st.sidebar.metric("Total Questions", total_questions)
     st.sidebar.metric("Total Feedback", total_feedback)
     if total_feedback > 0:
@@ -17,10 +48,12 @@ def render_sidebar_stats() -> None:
         st.sidebar.metric("Satisfaction Rate", f"{satisfaction_rate:.1f}%")
     st.sidebar.markdown("---")
     if st.sidebar.button("Clear History"):
-        st.session_state.conversation_history = []
+        st.session_state.history.clear()
+        st.session_state.history_page = 1
+        st.session_state.conversation_state = rag.new_conversation_state()
         st.rerun()
 
-def collect_feedback(question: str, answer: str, conversation_id: str) -> None:
+def collect_feedback(question: str, answer: str, conversation_id: str, entry: Dict[str, Any] = None) -> None:
     st.markdown("---")
     st.subheader("📝 Feedback")
     st.write("How was this response?")
@@ -40,35 +73,55 @@ def collect_feedback(question: str, answer: str, conversation_id: str) -> None:
             "text_feedback": text_feedback.strip() if text_feedback else "",
             "conversation_id": conversation_id
         }
-        st.session_state.feedback_data.append(feedback)
+        st.session_state.history.add_feedback(feedback)
         persistence.save_feedback(feedback)
+        if feedback_type == "negative" and entry and entry.get("eval_status") == "skipped" and entry.get("context_ids") is not None:
+            _BACKGROUND.submit(_evaluate_on_feedback, entry)
         st.success(f"Thank you for your {'positive' if thumbs_up else 'negative'} feedback!")
         st.rerun()
 
+def render_history_entry(entry: Dict[str, Any], expanded: bool) -> None:
+    q_preview = (entry['question'][:100] + "...") if len(entry['question']) > 100 else entry['question']
+    with st.expander(f"Q: {q_preview}", expanded=expanded):
+        ts = entry.get('timestamp')
+        ts_str = ts.strftime('%Y-%m-%d %H:%M:%S') if isinstance(ts, datetime) else str(ts)
+        st.caption(f"Asked on {ts_str}")
+        st.markdown("**Question:**")
+        st.write(entry['question'])
+        st.markdown("**Answer:**")
+        st.write(entry.get('answer', ''))
+        fb = st.session_state.history.feedback.get(entry['id'])
+        if fb:
+            icon = "👍" if fb.get('feedback_type') == 'positive' else "👎"
+            st.success(f"{icon} Feedback submitted: {fb.get('feedback_type')}")
+            if fb.get('text_feedback'):
+                st.info(f"Comment: {fb.get('text_feedback')}")
+        else:
+            collect_feedback(entry['question'], entry.get('answer', ''), entry['id'], entry)
+
 def render_conversation_history() -> None:
-    if not st.session_state.conversation_history:
+    """One page of the history, newest first; only the newest HISTORY_EXPANDED entries are expanded."""
+    conversations = st.session_state.history
+    if not len(conversations):
         return
     st.markdown("---")
     st.header("💬 Conversation History")
-    for entry in reversed(st.session_state.conversation_history):
-        q_preview = (entry['question'][:100] + "...") if len(entry['question']) > 100 else entry['question']
-        with st.expander(f"Q: {q_preview}", expanded=True):
-            ts = entry.get('timestamp')
-            ts_str = ts.strftime('%Y-%m-%d %H:%M:%S') if isinstance(ts, datetime) else str(ts)
-            st.caption(f"Asked on {ts_str}")
-            st.markdown("**Question:**")
-            st.write(entry['question'])
-            st.markdown("**Answer:**")
-            st.write(entry.get('answer', ''))
-            existing_feedback = [f for f in st.session_state.feedback_data if f.get('conversation_id') == entry['id']]
-            if existing_feedback:
-                fb = existing_feedback[0]
-                icon = "👍" if fb.get('feedback_type') == 'positive' else "👎"
-                st.success(f"{icon} Feedback submitted: {fb.get('feedback_type')}")
-                if fb.get('text_feedback'):
-                    st.info(f"Comment: {fb.get('text_feedback')}")
-            else:
-                collect_feedback(entry['question'], entry.get('answer', ''), entry['id'])
+    pages = conversations.page_count()
+    st.session_state.history_page = min(st.session_state.get("history_page", 1), pages)
+    if pages > 1:
+        st.number_input(f"Page (of {pages}, newest first)", min_value=1, max_value=pages, step=1, key="history_page")
+    page = st.session_state.history_page
+    ids = conversations.page_ids(page)
+    missing = conversations.missing(ids)
+    if missing:
+        st.info(f"{len(missing)} older answers on this page are no longer kept in this session.")
+        if st.button("Load them from the database", key=f"reload_history_{page}"):
+            conversations.reload(missing)
+            st.rerun()
+    for position, conversation_id in enumerate(ids):
+        entry = conversations.get(conversation_id)
+        if entry is not None:
+            render_history_entry(entry, expanded=page == 1 and position < history.HISTORY_EXPANDED)
 
 def qa_page(DOCUMENTS: List[Dict[str, Any]], qdrant_client, OPENAI_API_KEY: str) -> None:
     render_sidebar_stats()
@@ -80,23 +133,40 @@ def qa_page(DOCUMENTS: List[Dict[str, Any]], qdrant_client, OPENAI_API_KEY: str)
         submit_button = st.form_submit_button("🚀 Submit", use_container_width=True)
 
     if submit_button and user_input and user_input.strip():
+        queue_status = st.empty()
+
+        def show_queue_position(gate: str, position: int) -> None:
+            if position:
+                queue_status.info(f"⏳ The assistant is busy, your question is number {position} in the queue...")
+
         with st.spinner("Generating answer..."):
             try:
                 conversation_id = str(uuid.uuid4())
                 ts = datetime.now()
-                answer = rag.rag(st, user_input.strip(), DOCUMENTS, qdrant_client, OPENAI_API_KEY)
+                with admission.waiting(show_queue_position):
+                    answer = rag_client.ask(st, user_input.strip(), DOCUMENTS, qdrant_client, OPENAI_API_KEY, evaluate=False)
+                queue_status.empty()
                 answer = answer or {}
                 answer['id'] = conversation_id
                 answer['timestamp'] = ts
+                if answer.get('eval_status') is None:
+                    judging.should_evaluate(answer)
                 conversation_entry = {
                     "id": conversation_id,
                     "timestamp": ts,
                     "question": user_input.strip(),
-                    "answer": answer.get('answer', '')
+                    "answer": answer.get('answer', ''),
+                    "context_ids": answer.get('context_ids', []),
+                    "eval_status": answer.get('eval_status'),
                 }
-                st.session_state.conversation_history.append(conversation_entry)
-                persistence.save_conversation(answer)
+                st.session_state.history.add(conversation_entry)
+                st.session_state.history_page = 1
+                _BACKGROUND.submit(_evaluate_and_save, answer, OPENAI_API_KEY)
+            except admission.AdmissionRejected as e:
+                queue_status.empty()
+                st.warning(f"🚦 {e}")
             except Exception as e:
+                queue_status.empty()
                 st.error(f"Error generating answer: {e}")
 
     render_conversation_history()
\ No newline at end of file
@@ -0,0 +1,125 @@
+"""
+Background warm-up of the retrieval stack.
+
+`Warmup.start()` connects to Qdrant, makes sure the index version behind the
+`hybrid_search` alias matches the data (index_versions.ensure_index: a no-op
+when it does, otherwise restored from a snapshot or built and validated while
+the previous version keeps serving; with reindex=False the live version is
+used as is) and that the POI neighbour graph (poi_graph.py) was built from that
+version, opens the memory-mapped POI store (poi_store.py) and runs one
+search, which loads the dense (embedding_models.py) and BM25 fastembed models, in a daemon
+thread, so the first user question does not pay for model loading.
+`ready` is set when done; if TRAVEL_ASSISTANT_READY_FILE is set, that file is
+written as a readiness signal for container health checks.
+
+`python warmup.py --bake` downloads the embedding models into the fastembed
+cache (FASTEMBED_CACHE_PATH) at image build time.
+"""
+import os
+import time
+import asyncio
+import argparse
+import threading
+from typing import Any, Dict, Optional
+
+import embedding_models
+
+DENSE_MODEL = embedding_models.get_model()["model"]
+SPARSE_MODEL = embedding_models.SPARSE_MODEL
+
+class Warmup:
+    def __init__(self, qdrant_url: str, reindex: bool = True):
+        self.qdrant_url = qdrant_url
+        self.reindex = reindex
+        self.ready = threading.Event()
+        self.documents = None  # poi_store.PoiStore
+        self.qdrant_client = None
+        self.error: Optional[BaseException] = None
+        self.timings: Dict[str, float] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def _timed(self, step: str, fn, *args, **kwargs) -> Any:
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.timings[step] = time.perf_counter() - start
+
+    def run(self) -> None:
+        try:
+            from qdrant_client import QdrantClient
+            import index_versions
+            import poi_graph
+            import poi_store
+            import rag
+
+            self.qdrant_client = self._timed("qdrant_connect", QdrantClient, url=self.qdrant_url)
+            if self.reindex:
+                self._timed("ensure_index", index_versions.ensure_index, self.qdrant_client)
+                self._timed("poi_graph", poi_graph.ensure_graph, self.qdrant_client)
+            self.documents = self._timed("load_documents", poi_store.load)
+            self._timed("constraint_index", rag.constraint_index, self.documents)
+            self._timed("warm_query", rag.rrf_search, self.qdrant_client, "Wawel Castle opening hours")
+        except BaseException as e:
+            self.error = e
+        finally:
+            self._finish()
+
+    async def run_async(self) -> None:
+        """Event-loop variant for the RAG API: AsyncQdrantClient, no reindexing."""
+        try:
+            from qdrant_client import AsyncQdrantClient
+            import poi_store
+            import rag
+
+            self.qdrant_client = self._timed("qdrant_connect", AsyncQdrantClient, url=self.qdrant_url)
+            self.documents = await asyncio.to_thread(self._timed, "load_documents", poi_store.load)
+            await asyncio.to_thread(self._timed, "constraint_index", rag.constraint_index, self.documents)
+            start = time.perf_counter()
+            await rag.rrf_search_async(self.qdrant_client, "Wawel Castle opening hours")
+            self.timings["warm_query"] = time.perf_counter() - start
+        except Exception as e:
+            self.error = e
+        finally:
+            self._finish()
+
+    def _finish(self) -> None:
+        self.ready.set()
+        ready_file = os.getenv("TRAVEL_ASSISTANT_READY_FILE")
+        if ready_file and self.error is None:
+            with open(ready_file, "w", encoding="utf-8") as f:
+                f.write(f"{time.time()}\n")
+
+    def start(self) -> "Warmup":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="travel-assistant-warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until warm-up finished; re-raises a warm-up failure."""
+        finished = self.ready.wait(timeout)
+        if finished and self.error is not None:
+            raise self.error
+        return finished
+
+def bake_models(cache_dir: Optional[str] = None) -> Dict[str, float]:
+    """Download (and load once) the embedding models into the fastembed cache."""
+    from fastembed import TextEmbedding, SparseTextEmbedding
+
+    timings = {}
+    for name, cls in ((DENSE_MODEL, TextEmbedding), (SPARSE_MODEL, SparseTextEmbedding)):
+        start = time.perf_counter()
+        model = cls(model_name=name, cache_dir=cache_dir)
+        list(model.embed(["warm-up"]))
+        timings[name] = time.perf_counter() - start
+    return timings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bake", action="store_true", help="download embedding models into the fastembed cache")
+    parser.add_argument("--cache-dir", default=os.getenv("FASTEMBED_CACHE_PATH"))
+    args = parser.parse_args()
+    if args.bake:
+        for model_name, seconds in bake_models(args.cache_dir).items():
+            print(f"{model_name}: {seconds:.1f}s")